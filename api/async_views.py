@@ -0,0 +1,182 @@
+# Variantes async de los endpoints de solo lectura más consultados, para servirlas
+# desde ASGI (muma/asgi.py) sin ocupar un hilo por petición mientras se espera a la
+# base de datos. Usan la interfaz async del ORM y los mismos querysets y
+# serializadores que los ViewSets de views.py.
+from django.conf import settings
+from django.db.models import F, Sum
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .cache import cachear_agregado
+from .models import Insumo, Merma
+from .serializers import InsumoSerializer, MermaSerializer, RecetaSerializer, VentaSerializer
+from .views import (
+    InsumoViewSet, MermaViewSet, RecetaViewSet, VentaViewSet,
+    leer_granularity, resumenes_ventas, totales_ventas
+)
+
+PAGE_SIZE = settings.REST_FRAMEWORK['PAGE_SIZE']
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder)
+
+
+def _no_encontrado(mensaje='No encontrado.'):
+    return _json({'detail': mensaje}, status=404)
+
+
+def _ajustar_queryset(request, queryset, serializer_class):
+    """Ajusta el queryset a ?fields= / ?omit=, como CamposDinamicosViewSetMixin"""
+    return serializer_class(context={'request': request}).ajustar_queryset(queryset)
+
+
+async def _pagina_numerada(request, queryset, serializer_class):
+    """Misma respuesta que PageNumberPagination (count, next, previous, results)"""
+    try:
+        queryset = _ajustar_queryset(request, queryset, serializer_class)
+    except ValidationError as e:
+        return _json(e.detail, status=400)
+    try:
+        pagina = int(request.GET.get('page', 1))
+    except ValueError:
+        pagina = 0
+    if pagina < 1:
+        return _no_encontrado('Página inválida.')
+
+    total = await queryset.acount()
+    inicio = (pagina - 1) * PAGE_SIZE
+    objetos = [objeto async for objeto in queryset[inicio:inicio + PAGE_SIZE]]
+    if pagina > 1 and not objetos:
+        return _no_encontrado('Página inválida.')
+
+    url = request.build_absolute_uri()
+    anterior = None
+    if pagina > 1:
+        anterior = remove_query_param(url, 'page') if pagina == 2 else replace_query_param(url, 'page', pagina - 1)
+    return _json({
+        'count': total,
+        'next': replace_query_param(url, 'page', pagina + 1) if inicio + PAGE_SIZE < total else None,
+        'previous': anterior,
+        'results': serializer_class(objetos, many=True, context={'request': request}).data
+    })
+
+
+async def _pagina_cursor(request, queryset, pagination_class, serializer_class):
+    """
+    Misma respuesta y mismos cursores que la paginación del ViewSet (next, previous,
+    results): un cursor de /api/ventas/ sirve en /api/async/ventas/ y viceversa.
+    """
+    try:
+        queryset = _ajustar_queryset(request, queryset, serializer_class)
+    except ValidationError as e:
+        return _json(e.detail, status=400)
+    paginador = pagination_class()
+    try:
+        objetos = await paginador.apaginate_queryset(queryset, Request(request))
+    except NotFound as e:
+        return _no_encontrado(e.detail)
+    return _json(paginador.datos_paginados(
+        serializer_class(objetos, many=True, context={'request': request}).data
+    ))
+
+
+async def _detalle(request, queryset, serializer_class, pk):
+    try:
+        queryset = _ajustar_queryset(request, queryset, serializer_class)
+    except ValidationError as e:
+        return _json(e.detail, status=400)
+    objeto = await queryset.filter(pk=pk).afirst()
+    if objeto is None:
+        return _no_encontrado()
+    return _json(serializer_class(objeto, context={'request': request}).data)
+
+
+# Insumos
+
+@require_GET
+async def insumos_lista(request):
+    return await _pagina_numerada(request, InsumoViewSet.queryset, InsumoSerializer)
+
+
+@require_GET
+async def insumos_detalle(request, pk):
+    return await _detalle(request, InsumoViewSet.queryset, InsumoSerializer, pk)
+
+
+@require_GET
+@cachear_agregado(Insumo)
+async def insumos_stock_bajo(request):
+    insumos = [insumo async for insumo in Insumo.objects.filter(cantidad__lt=10)]
+    return _json(InsumoSerializer(insumos, many=True, context={'request': request}).data)
+
+
+@require_GET
+@cachear_agregado(Insumo)
+async def insumos_valor_total(request):
+    return _json(await Insumo.objects.aaggregate(
+        valor_total=Sum(F('cantidad') * F('precio_unitario'))
+    ))
+
+
+# Recetas
+
+@require_GET
+async def recetas_lista(request):
+    return await _pagina_numerada(request, RecetaViewSet.queryset, RecetaSerializer)
+
+
+@require_GET
+async def recetas_detalle(request, pk):
+    return await _detalle(request, RecetaViewSet.queryset, RecetaSerializer, pk)
+
+
+# Ventas
+
+@require_GET
+async def ventas_lista(request):
+    return await _pagina_cursor(request, VentaViewSet.queryset, VentaViewSet.pagination_class, VentaSerializer)
+
+
+@require_GET
+async def ventas_detalle(request, pk):
+    return await _detalle(request, VentaViewSet.queryset, VentaSerializer, pk)
+
+
+@require_GET
+async def ventas_resumen(request):
+    try:
+        granularity = leer_granularity(request.GET)
+        resumenes = resumenes_ventas(request.GET)
+    except ValidationError as e:
+        return _json(e.detail, status=400)
+
+    resumen = await resumenes.aaggregate(**totales_ventas())
+    if granularity:
+        resumen['periodos'] = [fila async for fila in resumenes.por_periodo(granularity)]
+    return _json(resumen)
+
+
+# Mermas
+
+@require_GET
+async def mermas_lista(request):
+    return await _pagina_cursor(request, MermaViewSet.queryset, MermaViewSet.pagination_class, MermaSerializer)
+
+
+@require_GET
+async def mermas_detalle(request, pk):
+    return await _detalle(request, MermaViewSet.queryset, MermaSerializer, pk)
+
+
+@require_GET
+@cachear_agregado(Merma, Insumo)
+async def mermas_resumen(request):
+    resumen = Merma.objects.values('insumo__nombre').annotate(
+        total_merma=Sum('cantidad')
+    ).order_by('-total_merma')
+    return _json([fila async for fila in resumen])
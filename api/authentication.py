@@ -0,0 +1,72 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+
+class _CacheTokens:
+    """LRU en memoria con TTL que guarda token -> (usuario, token, expiración)"""
+
+    def __init__(self, max_entradas, ttl):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, key):
+        with self._lock:
+            entrada = self._datos.get(key)
+            if entrada is None:
+                return None
+            if entrada[2] < time.monotonic():
+                del self._datos[key]
+                return None
+            self._datos.move_to_end(key)
+            return entrada[0], entrada[1]
+
+    def guardar(self, key, user, token):
+        with self._lock:
+            self._datos[key] = (user, token, time.monotonic() + self.ttl)
+            self._datos.move_to_end(key)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def eliminar(self, key):
+        with self._lock:
+            self._datos.pop(key, None)
+
+    def eliminar_usuario(self, user_id):
+        with self._lock:
+            for key in [key for key, entrada in self._datos.items() if entrada[0].pk == user_id]:
+                del self._datos[key]
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+tokens = _CacheTokens(
+    max_entradas=getattr(settings, 'TOKEN_CACHE_MAX_ENTRADAS', 10000),
+    ttl=getattr(settings, 'TOKEN_CACHE_TTL', 300),
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication que guarda en memoria la relación token -> usuario, así
+    una petición con un token ya visto no consulta la base de datos. Las entradas
+    se invalidan desde signals.py al eliminar el token o al guardar el usuario.
+    """
+
+    def authenticate_credentials(self, key):
+        entrada = tokens.obtener(key)
+        if entrada is None:
+            user, token = super().authenticate_credentials(key)
+            tokens.guardar(key, user, token)
+            entrada = (user, token)
+        user, token = entrada
+        # Cada petición recibe su propia copia del usuario
+        return copy.copy(user), token
@@ -0,0 +1,147 @@
+import operator
+import re
+from functools import reduce
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Insumo, Receta
+
+# Una búsqueda devuelve a lo sumo estos resultados, los más relevantes
+MAX_RESULTADOS = 100
+MAX_CANDIDATOS = 1000
+MAX_TERMINOS = 8
+LOTE = 500
+
+
+def terminos(texto):
+    """Palabras del texto buscado, sin signos ni operadores de FTS5"""
+    return re.findall(r'\w+', texto)[:MAX_TERMINOS]
+
+
+class IndiceBusqueda:
+    """
+    Índice FTS5 de SQLite (tabla <tabla del modelo>_fts, creada en la migración 0014)
+    con una copia de las columnas de texto del modelo y su id como rowid. Se mantiene
+    desde signals.py; las escrituras masivas llaman a indexar() o reconstruir().
+    """
+
+    def __init__(self, modelo, campos, pesos):
+        self.modelo = modelo
+        self.campos = campos
+        # Peso de cada campo en el ranking bm25: coincidir en el nombre vale más
+        self.pesos = pesos
+        self.tabla = f'{modelo._meta.db_table}_fts'
+
+    def disponible(self, using):
+        return connections[using].vendor == 'sqlite'
+
+    def _columnas(self):
+        return ', '.join(self.modelo._meta.get_field(campo).column for campo in self.campos)
+
+    def indexar(self, ids, using='default'):
+        """Vuelve a copiar al índice el texto de las filas indicadas"""
+        if not self.disponible(using):
+            return
+        ids = list(ids)
+        with connections[using].cursor() as cursor:
+            for inicio in range(0, len(ids), LOTE):
+                lote = ids[inicio:inicio + LOTE]
+                marcas = ', '.join(['%s'] * len(lote))
+                cursor.execute(f'DELETE FROM {self.tabla} WHERE rowid IN ({marcas})', lote)
+                cursor.execute(
+                    f'INSERT INTO {self.tabla} (rowid, {self._columnas()}) '
+                    f'SELECT id, {self._columnas()} FROM {self.modelo._meta.db_table} WHERE id IN ({marcas})',
+                    lote
+                )
+
+    def eliminar(self, ids, using='default'):
+        if not self.disponible(using):
+            return
+        ids = list(ids)
+        with connections[using].cursor() as cursor:
+            for inicio in range(0, len(ids), LOTE):
+                lote = ids[inicio:inicio + LOTE]
+                cursor.execute(
+                    f"DELETE FROM {self.tabla} WHERE rowid IN ({', '.join(['%s'] * len(lote))})", lote
+                )
+
+    def reconstruir(self, using='default'):
+        """Regenera el índice completo a partir de la tabla del modelo"""
+        if not self.disponible(using):
+            return
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.tabla}')
+            cursor.execute(
+                f'INSERT INTO {self.tabla} (rowid, {self._columnas()}) '
+                f'SELECT id, {self._columnas()} FROM {self.modelo._meta.db_table}'
+            )
+
+    def _candidatos(self, cursor, consulta, limite, excluir=()):
+        # bm25 cuesta por cada fila que coincide: con prefijos cortos son decenas de
+        # miles, así que se ordenan solo las primeras MAX_CANDIDATOS coincidencias
+        pesos = ', '.join(str(peso) for peso in self.pesos)
+        cursor.execute(
+            f'SELECT rowid FROM ('
+            f'SELECT rowid, bm25({self.tabla}, {pesos}) AS puntaje FROM {self.tabla} '
+            f'WHERE {self.tabla} MATCH %s LIMIT %s'
+            f') ORDER BY puntaje, rowid LIMIT %s',
+            [consulta, MAX_CANDIDATOS, limite + len(excluir)]
+        )
+        return [rowid for rowid, in cursor.fetchall() if rowid not in excluir][:limite]
+
+    def buscar(self, texto, limite=MAX_RESULTADOS, using='default'):
+        """
+        Ids de las filas que contienen todos los términos como prefijo de alguna
+        palabra (sin distinguir mayúsculas ni acentos), de la más relevante a la menos.
+        Primero las que coinciden en el primer campo (el nombre) y luego en el resto.
+        """
+        # "azu"* "choc"*: cada término entre comillas para que no se lea como operador
+        consulta = ' '.join(f'"{termino}"*' for termino in terminos(texto))
+        with connections[using].cursor() as cursor:
+            ids = self._candidatos(cursor, f'{{{self.campos[0]}}} : ({consulta})', limite)
+            if len(ids) < limite and len(self.campos) > 1:
+                ids += self._candidatos(cursor, consulta, limite - len(ids), excluir=set(ids))
+        return ids
+
+    def filtrar(self, queryset, texto):
+        """
+        Filtra el queryset a los resultados de la búsqueda ordenados por relevancia.
+        Fuera de SQLite se usa icontains sobre los mismos campos, sin ranking.
+        """
+        palabras = terminos(texto)
+        if not palabras:
+            return queryset
+        if not self.disponible(queryset.db):
+            return queryset.filter(*[
+                reduce(operator.or_, [Q(**{f'{campo}__icontains': palabra}) for campo in self.campos])
+                for palabra in palabras
+            ])
+
+        ids = self.buscar(texto, using=queryset.db)
+        if not ids:
+            return queryset.none()
+        # Un solo CASE en SQL: cien When() de Django tardan más en compilarse que la búsqueda
+        orden = RawSQL(
+            f'CASE "{self.modelo._meta.db_table}"."id" {" ".join(["WHEN %s THEN %s"] * len(ids))} END',
+            [valor for posicion, pk in enumerate(ids) for valor in (pk, posicion)]
+        )
+        return queryset.filter(pk__in=ids).order_by(orden.asc())
+
+
+INDICES = {
+    Insumo: IndiceBusqueda(Insumo, ('nombre',), (1.0,)),
+    Receta: IndiceBusqueda(Receta, ('nombre', 'categoria', 'descripcion'), (10.0, 5.0, 1.0)),
+}
+
+
+class BusquedaViewSetMixin:
+    """Filtra el listado del ViewSet con ?q= usando el índice de búsqueda de su modelo"""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        texto = self.request.query_params.get('q', '')
+        if self.action == 'list' and texto.strip():
+            queryset = INDICES[queryset.model].filtrar(queryset, texto)
+        return queryset
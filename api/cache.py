@@ -0,0 +1,117 @@
+import hashlib
+import inspect
+import threading
+import uuid
+from functools import wraps
+
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+# Alias de settings.CACHES donde se guardan los agregados, por defecto un LRU en memoria
+ALIAS = 'agregados'
+
+_FALTA = object()
+_lock = threading.Lock()
+_estadisticas = {'hits': 0, 'misses': 0}
+
+
+def _cache():
+    return caches[ALIAS]
+
+
+def _clave_version(modelo):
+    return f'version:{modelo._meta.label_lower}'
+
+
+def _versiones(modelos):
+    """
+    Devuelve la versión vigente de cada modelo. Si una versión no existe (o fue
+    desalojada) se crea una nueva, así nunca se reutiliza una entrada antigua.
+    """
+    cache = _cache()
+    claves = [_clave_version(modelo) for modelo in modelos]
+    versiones = cache.get_many(claves)
+    for clave in claves:
+        if clave not in versiones:
+            cache.add(clave, uuid.uuid4().hex, None)
+            versiones[clave] = cache.get(clave)
+    return [versiones[clave] for clave in claves]
+
+
+def _incrementar_versiones(modelos):
+    _cache().set_many({_clave_version(modelo): uuid.uuid4().hex for modelo in modelos}, None)
+
+
+def invalidar(*modelos):
+    """
+    Invalida todos los agregados que dependen de los modelos indicados. Si hay una
+    transacción en curso se hace al confirmarla, para no volver a cachear datos viejos.
+    """
+    transaction.on_commit(lambda: _incrementar_versiones(modelos))
+
+
+def _registrar(resultado):
+    with _lock:
+        _estadisticas[resultado] += 1
+
+
+def estadisticas():
+    with _lock:
+        hits, misses = _estadisticas['hits'], _estadisticas['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None
+    }
+
+
+def _clave(func, request, modelos):
+    versiones = ':'.join(_versiones(modelos))
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'agregado:{func.__module__}.{func.__qualname__}:{url}:{versiones}'
+
+
+def cachear_agregado(*modelos):
+    """
+    Decorador para acciones de un ViewSet que cachea response.data. La entrada
+    depende de la URL completa y de la versión de cada modelo en modelos, que
+    se incrementa cuando cambia alguna de sus filas. También acepta vistas
+    async de Django, en cuyo caso se cachea el contenido de la respuesta.
+    """
+    def decorador(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def envoltura_async(request, *args, **kwargs):
+                clave = _clave(func, request, modelos)
+                cache = _cache()
+                contenido = cache.get(clave, _FALTA)
+                if contenido is not _FALTA:
+                    _registrar('hits')
+                    return HttpResponse(contenido[0], content_type=contenido[1])
+
+                _registrar('misses')
+                response = await func(request, *args, **kwargs)
+                if response.status_code == 200:
+                    cache.set(clave, (response.content, response['Content-Type']))
+                return response
+            return envoltura_async
+
+        @wraps(func)
+        def envoltura(self, request, *args, **kwargs):
+            clave = _clave(func, request, modelos)
+            cache = _cache()
+            data = cache.get(clave, _FALTA)
+            if data is not _FALTA:
+                _registrar('hits')
+                return Response(data)
+
+            _registrar('misses')
+            response = func(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(clave, response.data)
+            return response
+        return envoltura
+    return decorador
@@ -0,0 +1,81 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+
+
+def leer_campos(params):
+    """Devuelve (campos de ?fields= o None, campos de ?omit=)"""
+    def lista(parametro):
+        return {campo.strip() for campo in params.get(parametro, '').split(',') if campo.strip()}
+
+    incluidos = lista('fields')
+    return incluidos or None, lista('omit')
+
+
+class CamposDinamicosMixin:
+    """
+    Serializador cuyos campos de salida se eligen con ?fields=a,b o se quitan con
+    ?omit=a,b. Solo se aplica en lecturas (GET) y en el serializador que recibe la
+    request en el contexto, no en los anidados. ajustar_queryset evita cargar las
+    relaciones y columnas de los campos que no se van a serializar.
+    """
+    # {campo: lookup} que solo se cargan si el campo se serializa
+    prefetch_por_campo = {}
+    select_related_por_campo = {}
+    # Columnas que se leen aunque no se pidan (orden, paginación por cursor)
+    columnas_fijas = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.campos_quitados = {}
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return
+
+        incluidos, omitidos = leer_campos(getattr(request, 'query_params', request.GET))
+        desconocidos = ((incluidos or set()) | omitidos) - set(self.fields)
+        if desconocidos:
+            raise ValidationError({
+                'fields': [f"Campos desconocidos: {', '.join(sorted(desconocidos))}"]
+            })
+        for nombre in list(self.fields):
+            if (incluidos is not None and nombre not in incluidos) or nombre in omitidos:
+                self.campos_quitados[nombre] = self.fields.pop(nombre)
+
+    def ajustar_queryset(self, queryset):
+        """Agrega al queryset solo las cargas de relaciones de los campos que se serializan"""
+        prefetch = [lookup for campo, lookup in self.prefetch_por_campo.items() if campo in self.fields]
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        select_related = [
+            lookup for campo, lookup in self.select_related_por_campo.items() if campo in self.fields
+        ]
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+
+        # Columnas simples del modelo que ningún campo de la respuesta usa
+        opts = queryset.model._meta
+        fijas = {orden.lstrip('-') for orden in opts.ordering} | set(self.columnas_fijas)
+        usadas = {campo.source for campo in self.fields.values()}
+        diferidas = set()
+        for campo in self.campos_quitados.values():
+            try:
+                field = opts.get_field(campo.source)
+            except FieldDoesNotExist:
+                continue
+            if field.concrete and not field.is_relation and not field.primary_key \
+                    and field.name not in fijas and field.name not in usadas:
+                diferidas.add(field.name)
+        if diferidas:
+            queryset = queryset.defer(*sorted(diferidas))
+        return queryset
+
+
+class CamposDinamicosViewSetMixin:
+    """Ajusta el queryset del ViewSet a los campos pedidos con ?fields= y ?omit="""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer = self.get_serializer()
+        if isinstance(serializer, CamposDinamicosMixin):
+            queryset = serializer.ajustar_queryset(queryset)
+        return queryset
@@ -0,0 +1,41 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import VersionColeccion
+
+
+class ColeccionVersionadaMixin:
+    """
+    Agrega ETag y Last-Modified a list y retrieve a partir de la versión de las
+    colecciones de las que depende la respuesta. Si el cliente ya tiene la versión
+    vigente se responde 304 sin ejecutar la consulta ni el serializador.
+    """
+    # Modelos cuyas escrituras cambian la representación de esta colección
+    colecciones_versionadas = ()
+
+    def _validadores(self, request):
+        versiones = VersionColeccion.objects.vigentes(*self.colecciones_versionadas)
+        firma = ';'.join(f'{modelo}:{version}' for modelo, (version, _) in versiones.items())
+        # La representación también depende de la URL (paginación, filtros) y del formato
+        variante = f'{firma}|{request.build_absolute_uri()}|{request.accepted_media_type}'
+        etag = f'"{hashlib.md5(variante.encode()).hexdigest()}"'
+        modificado = max(modificado for _, modificado in versiones.values())
+        return etag, int(modificado.timestamp())
+
+    def _respuesta_condicional(self, request, generar, *args, **kwargs):
+        etag, modificado = self._validadores(request)
+        response = get_conditional_response(request._request, etag=etag, last_modified=modificado)
+        if response is None:
+            response = generar(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(modificado)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._respuesta_condicional(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._respuesta_condicional(request, super().retrieve, *args, **kwargs)
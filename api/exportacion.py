@@ -0,0 +1,90 @@
+import csv
+import json
+from datetime import date, datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+
+from .tareas import progreso
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Filas que se leen de la base de datos y se envían al cliente en cada bloque
+TAMANO_BLOQUE = 1000
+
+
+class _Eco:
+    """Buffer que devuelve lo que se escribe, para que csv.writer genere cadenas"""
+    def write(self, valor):
+        return valor
+
+
+def leer_formato(request):
+    # No usamos ?format= porque DRF lo reserva para elegir el renderer
+    formato = request.query_params.get('formato', 'csv')
+    if formato not in FORMATOS:
+        raise ValidationError({'formato': 'Debe ser csv o ndjson'})
+    return formato
+
+
+def _valor_csv(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, (list, tuple)):
+        return ';'.join(str(item) for item in valor)
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
+
+
+def _bloques(lineas, total=None):
+    bloque = []
+    filas = 0
+    # La primera fila sale sola, para que el cliente reciba datos sin esperar un bloque entero
+    tamano = 1
+    for linea in lineas:
+        bloque.append(linea)
+        if len(bloque) >= tamano:
+            tamano = TAMANO_BLOQUE
+            filas += len(bloque)
+            yield ''.join(bloque)
+            bloque = []
+            # En una tarea en segundo plano queda registrado el avance
+            progreso(filas, total)
+    if bloque:
+        filas += len(bloque)
+        yield ''.join(bloque)
+    progreso(filas, total)
+
+
+def _contenido(filas, campos, formato, total):
+    if formato == 'csv':
+        writer = csv.writer(_Eco())
+        # La cabecera sale de inmediato, antes de leer la primera fila
+        yield writer.writerow(campos)
+        yield from _bloques(
+            (writer.writerow([_valor_csv(fila[campo]) for campo in campos]) for fila in filas), total
+        )
+    else:
+        yield from _bloques(
+            (json.dumps({campo: fila[campo] for campo in campos}, cls=DjangoJSONEncoder) + '\n'
+             for fila in filas),
+            total
+        )
+
+
+def respuesta_exportacion(filas, campos, formato, nombre, total=None):
+    """
+    Devuelve una respuesta que va generando el archivo a medida que se leen las
+    filas, sin cargar la exportación completa en memoria. total es el número de
+    filas, si se conoce, para informar el progreso.
+    """
+    response = StreamingHttpResponse(
+        _contenido(filas, campos, formato, total), content_type=FORMATOS[formato]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{nombre}.{formato}"'
+    return response
@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import BaseParser
+
+FORMATOS_IMPORTACION = ('csv', 'json')
+
+
+class CSVParser(BaseParser):
+    """Acepta un CSV en el cuerpo de la petición (Content-Type: text/csv) y lo entrega como texto"""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return _texto(stream.read())
+        except UnicodeDecodeError as e:
+            raise ParseError(f'El CSV debe estar en UTF-8: {e}')
+
+
+def _texto(contenido):
+    # utf-8-sig descarta el BOM que agregan algunas planillas al exportar
+    return contenido.decode('utf-8-sig') if isinstance(contenido, bytes) else contenido
+
+
+def formato_archivo(nombre, formato=None):
+    """Formato indicado explícitamente o deducido de la extensión del archivo"""
+    formato = formato or nombre.rsplit('.', 1)[-1].lower()
+    if formato not in FORMATOS_IMPORTACION:
+        raise ValidationError({'formato': 'Debe ser csv o json'})
+    return formato
+
+
+def leer_filas(contenido, formato):
+    """
+    Convierte un CSV con cabecera o un JSON (lista de objetos, o un objeto con la
+    lista en "insumos") en una lista de diccionarios. Las celdas vacías del CSV
+    se omiten, así una columna sin valor no modifica ese campo.
+    """
+    try:
+        texto = _texto(contenido)
+    except UnicodeDecodeError as e:
+        raise ValidationError({'archivo': f'El archivo debe estar en UTF-8: {e}'})
+
+    if formato == 'csv':
+        lector = csv.DictReader(io.StringIO(texto))
+        return [
+            {clave.strip(): valor.strip() for clave, valor in fila.items() if clave and valor and valor.strip()}
+            for fila in lector
+        ]
+
+    try:
+        datos = json.loads(texto)
+    except ValueError as e:
+        raise ValidationError({'archivo': f'JSON inválido: {e}'})
+    if isinstance(datos, dict):
+        datos = datos.get('insumos')
+    if not isinstance(datos, list):
+        raise ValidationError({'archivo': 'Se esperaba una lista de insumos'})
+    return datos
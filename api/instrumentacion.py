@@ -0,0 +1,154 @@
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger('api.instrumentacion')
+
+# Medición de la petición en curso, la usan el execute_wrapper y el serializador
+_medicion = ContextVar('medicion', default=None)
+_data_original = BaseSerializer.data
+
+
+class Medicion:
+    """Consultas y tiempos de una petición"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = []  # (sql, duración)
+        self.tiempo_sql = 0.0
+        self.tiempo_serializacion = 0.0
+        self.tiempo_render = 0.0
+        self.inicio_vista = None
+        self.fin_vista = None
+        self.vista = None
+        self.serializando = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper de la conexión: mide cada consulta ejecutada
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.tiempo_sql += duracion
+            self.consultas.append((sql, duracion))
+
+    def duplicadas(self, minimo):
+        """{sql: repeticiones} de las consultas que se repiten al menos minimo veces"""
+        repeticiones = {}
+        for sql, _ in self.consultas:
+            repeticiones[sql] = repeticiones.get(sql, 0) + 1
+        return {sql: veces for sql, veces in repeticiones.items() if veces >= minimo}
+
+
+@property
+def _data_medida(self):
+    medicion = _medicion.get()
+    if medicion is None or medicion.serializando:
+        return _data_original.fget(self)
+    # Solo se mide el serializador más externo, los anidados quedan incluidos
+    medicion.serializando += 1
+    inicio = time.perf_counter()
+    try:
+        return _data_original.fget(self)
+    finally:
+        medicion.tiempo_serializacion += time.perf_counter() - inicio
+        medicion.serializando -= 1
+
+
+def _nombre_vista(view_func, request):
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__qualname__}'
+    accion = getattr(view_func, 'actions', {}).get(request.method.lower())
+    return f'{cls.__name__}.{accion}' if accion else cls.__name__
+
+
+def _ms(segundos):
+    return round(segundos * 1000, 2)
+
+
+class InstrumentacionSQLMiddleware:
+    """
+    Mide por petición la cantidad de consultas, el tiempo en SQL, en serialización,
+    en la vista y en el render. Los expone en el encabezado Server-Timing y registra
+    en el logger api.instrumentacion las peticiones y consultas lentas y las
+    consultas repetidas (N+1). Se activa con INSTRUMENTACION_SQL; desactivado,
+    Django lo quita de la cadena de middlewares.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTACION_SQL', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.peticion_lenta = getattr(settings, 'INSTRUMENTACION_PETICION_LENTA_MS', 500) / 1000
+        self.consulta_lenta = getattr(settings, 'INSTRUMENTACION_CONSULTA_LENTA_MS', 100) / 1000
+        self.minimo_duplicadas = getattr(settings, 'INSTRUMENTACION_DUPLICADAS_MIN', 5)
+        BaseSerializer.data = _data_medida
+
+    def __call__(self, request):
+        medicion = Medicion()
+        token = _medicion.set(medicion)
+        try:
+            with ExitStack() as stack:
+                # Obtener el wrapper de cada alias no abre la conexión
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(medicion))
+                response = self.get_response(request)
+        finally:
+            _medicion.reset(token)
+
+        total = time.perf_counter() - medicion.inicio
+        fin_vista = medicion.fin_vista or time.perf_counter()
+        tiempo_vista = fin_vista - medicion.inicio_vista if medicion.inicio_vista else 0.0
+        duplicadas = self.minimo_duplicadas and medicion.duplicadas(self.minimo_duplicadas)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={_ms(medicion.tiempo_sql)};desc="{len(medicion.consultas)} consultas"',
+            f'serializacion;dur={_ms(medicion.tiempo_serializacion)}',
+            f'vista;dur={_ms(tiempo_vista)}',
+            f'render;dur={_ms(medicion.tiempo_render)}',
+            f'total;dur={_ms(total)}',
+        ])
+        self._registrar(request, response, medicion, total, duplicadas)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        medicion = _medicion.get()
+        if medicion is not None:
+            medicion.vista = _nombre_vista(view_func, request)
+            medicion.inicio_vista = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Las respuestas de DRF se renderizan después de salir de la vista
+        medicion = _medicion.get()
+        if medicion is not None:
+            medicion.fin_vista = time.perf_counter()
+
+            def fin_render(response):
+                medicion.tiempo_render = time.perf_counter() - medicion.fin_vista
+
+            response.add_post_render_callback(fin_render)
+        return response
+
+    def _registrar(self, request, response, medicion, total, duplicadas):
+        ruta = f'{request.method} {request.get_full_path()}'
+        vista = medicion.vista or '-'
+        if total >= self.peticion_lenta:
+            logger.warning(
+                'Petición lenta %s (%s): %.1f ms, %d consultas en %.1f ms, serialización %.1f ms, estado %s',
+                ruta, vista, total * 1000, len(medicion.consultas), medicion.tiempo_sql * 1000,
+                medicion.tiempo_serializacion * 1000, response.status_code
+            )
+        for sql, duracion in medicion.consultas:
+            if duracion >= self.consulta_lenta:
+                logger.warning('Consulta lenta en %s (%s): %.1f ms: %s', ruta, vista, duracion * 1000, sql)
+        for sql, veces in (duplicadas or {}).items():
+            logger.warning('Consulta repetida %d veces en %s (%s), posible N+1: %s', veces, ruta, vista, sql)
+
@@ -0,0 +1,8 @@
+import math
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por rango más cercano de una lista de latencias no vacía"""
+    ordenados = sorted(valores)
+    indice = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
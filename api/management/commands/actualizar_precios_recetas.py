@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from api.models import RecetaInsumo
+
+
+class Command(BaseCommand):
+    help = 'Actualiza los precios de las líneas de receta con el precio actual de sus insumos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--insumo', type=int, action='append', dest='insumos',
+            help='Limitar a las líneas de este insumo (se puede repetir)'
+        )
+        parser.add_argument(
+            '--historial', action='store_true',
+            help='Registrar el costo anterior y el nuevo de cada receta afectada'
+        )
+
+    def handle(self, *args, **options):
+        lineas = RecetaInsumo.objects.all()
+        if options['insumos']:
+            lineas = lineas.filter(insumo_id__in=options['insumos'])
+
+        actualizadas, historial = lineas.actualizar_precios(registrar_historial=options['historial'])
+
+        for cambio in historial:
+            self.stdout.write(
+                f'Receta {cambio.receta_id}: {cambio.costo_anterior} -> {cambio.costo_nuevo} '
+                f'({cambio.diferencia:+})'
+            )
+        self.stdout.write(self.style.SUCCESS(f'{actualizadas} líneas de receta actualizadas'))
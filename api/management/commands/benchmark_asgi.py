@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+
+from api.management.benchmark import percentil
+
+# Host de los clientes de prueba: AsyncClient siempre envía "testserver" como Host
+HOST = 'testserver'
+
+# Pares (endpoint WSGI síncrono, variante async equivalente)
+RUTAS = [
+    ('/api/insumos/', '/api/async/insumos/'),
+    ('/api/insumos/valor_total/', '/api/async/insumos/valor_total/'),
+    ('/api/recetas/', '/api/async/recetas/'),
+    ('/api/ventas/', '/api/async/ventas/'),
+    ('/api/ventas/resumen_ventas/', '/api/async/ventas/resumen_ventas/'),
+    ('/api/mermas/', '/api/async/mermas/'),
+    ('/api/mermas/resumen_mermas/', '/api/async/mermas/resumen_mermas/'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara concurrencia y latencia (p50/p95/p99) de los endpoints de lectura '
+        'servidos por WSGI (ViewSets síncronos con un número fijo de hilos) y por ASGI '
+        '(vistas async de api/async_views.py)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=50, help='Clientes concurrentes')
+        parser.add_argument('--peticiones', type=int, default=20, help='Peticiones por cliente')
+        parser.add_argument('--hilos', type=int, default=4, help='Hilos de trabajo del servidor WSGI')
+
+    def handle(self, *args, **options):
+        clientes, peticiones = options['clientes'], options['peticiones']
+
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, HOST]):
+            wsgi = self._wsgi(clientes, peticiones, options['hilos'])
+            asgi = asyncio.run(self._asgi(clientes, peticiones))
+
+        self.stdout.write(
+            f"{'servidor':<10} {'req/s':>10} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10} {'errores':>8}"
+        )
+        for nombre, (latencias, duracion, errores) in (('WSGI', wsgi), ('ASGI', asgi)):
+            self.stdout.write(
+                f'{nombre:<10} {len(latencias) / duracion:>10.1f} '
+                f'{percentil(latencias, 50) * 1000:>10.2f} '
+                f'{percentil(latencias, 95) * 1000:>10.2f} '
+                f'{percentil(latencias, 99) * 1000:>10.2f} {errores:>8}'
+            )
+        # Con errores la comparación mediría páginas de error, no los endpoints
+        errores = wsgi[2] + asgi[2]
+        if errores:
+            raise CommandError(f'{errores} peticiones respondieron con un código distinto de 2xx')
+
+    def _wsgi(self, clientes, peticiones, hilos):
+        # Un semáforo con tantos permisos como hilos simula el pool de trabajadores;
+        # la latencia incluye la espera hasta que un hilo queda libre.
+        trabajadores = threading.Semaphore(hilos)
+        latencias = []
+        errores = [0]
+        lock = threading.Lock()
+
+        def cliente(numero):
+            client = Client(HTTP_HOST=HOST)
+            try:
+                for i in range(peticiones):
+                    ruta = RUTAS[(numero + i) % len(RUTAS)][0]
+                    inicio = time.perf_counter()
+                    with trabajadores:
+                        response = client.get(ruta)
+                    with lock:
+                        latencias.append(time.perf_counter() - inicio)
+                        errores[0] += not 200 <= response.status_code < 300
+            finally:
+                connections.close_all()
+
+        hilos_clientes = [threading.Thread(target=cliente, args=(n,)) for n in range(clientes)]
+        inicio = time.perf_counter()
+        for hilo in hilos_clientes:
+            hilo.start()
+        for hilo in hilos_clientes:
+            hilo.join()
+        return latencias, time.perf_counter() - inicio, errores[0]
+
+    async def _asgi(self, clientes, peticiones):
+        latencias = []
+        errores = 0
+
+        async def cliente(numero):
+            nonlocal errores
+            client = AsyncClient()
+            for i in range(peticiones):
+                ruta = RUTAS[(numero + i) % len(RUTAS)][1]
+                inicio = time.perf_counter()
+                response = await client.get(ruta)
+                latencias.append(time.perf_counter() - inicio)
+                errores += not 200 <= response.status_code < 300
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente(n) for n in range(clientes)))
+        return latencias, time.perf_counter() - inicio, errores
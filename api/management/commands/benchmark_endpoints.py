@@ -0,0 +1,204 @@
+import json
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import URLResolver, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import urls
+from api.management.benchmark import percentil
+from api.models import Insumo, Merma, Receta, RecetaInsumo, Venta
+
+USUARIO = 'benchmark'
+
+
+def _patrones(patrones):
+    for patron in patrones:
+        if isinstance(patron, URLResolver):
+            yield from _patrones(patron.url_patterns)
+        else:
+            yield patron
+
+
+def _acepta_get(callback):
+    """Indica si la vista responde a GET (las vistas de Django sin DRF se asumen de lectura)"""
+    acciones = getattr(callback, 'actions', None)
+    if acciones is not None:
+        return 'get' in acciones
+    cls = getattr(callback, 'cls', None)
+    if cls is not None:
+        return hasattr(cls, 'get')
+    return True
+
+
+def endpoints():
+    """
+    Devuelve [(nombre, necesita_pk)] de las rutas GET de api/urls.py, sin las
+    variantes con sufijo de formato (.json, .api) que genera el router
+    """
+    vistos = {}
+    for patron in _patrones(urls.urlpatterns):
+        grupos = patron.pattern.regex.groupindex
+        if patron.name is None or 'format' in grupos or not _acepta_get(patron.callback):
+            continue
+        vistos.setdefault(patron.name, 'pk' in grupos)
+    return list(vistos.items())
+
+
+def _basename(nombre):
+    """Prefijo registrado en el router al que pertenece la ruta (insumo, receta...)"""
+    nombre = nombre.removeprefix('async-')
+    candidatos = [
+        basename for _, _, basename in urls.router.registry if nombre.startswith(f'{basename}-')
+    ]
+    return max(candidatos, key=len) if candidatos else None
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide throughput y latencia p50/p95/p99 de cada endpoint GET de api/urls.py con '
+        'el cliente de pruebas de Django y guarda los resultados en JSON (por defecto en '
+        'BENCHMARK_DIRECTORIO) para comparar ejecuciones. Conviene correrlo sobre datos de '
+        'generar_datos. No mide las acciones que solo aceptan POST (importar, '
+        'registrar_compra, verificar_insumos, actualizar_precios, planificar_produccion, '
+        'registrar_lote): escriben o dependen del cuerpo enviado; las escrituras concurrentes '
+        'se miden con benchmark_escrituras.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=50, help='Peticiones medidas por endpoint')
+        parser.add_argument('--calentamiento', type=int, default=3, help='Peticiones previas sin medir')
+        parser.add_argument('--concurrencia', type=int, default=1, help='Clientes concurrentes por endpoint')
+        parser.add_argument('--filtro', default='', help='Solo endpoints cuyo nombre contenga este texto')
+        parser.add_argument('--excluir', nargs='*', default=[], help='Nombres de endpoints a omitir')
+        parser.add_argument('--salida', default=None, help='Archivo JSON de resultados (por defecto en BENCHMARK_DIRECTORIO)')
+        parser.add_argument('--comparar', default=None, help='JSON de una ejecución anterior')
+
+    def handle(self, *args, **options):
+        if options['peticiones'] < 1 or options['concurrencia'] < 1:
+            raise CommandError('--peticiones y --concurrencia deben ser positivos')
+
+        usuario, _ = User.objects.get_or_create(username=USUARIO)
+        # Los ViewSets sin queryset fijo (las tareas de cada usuario) no miden el detalle
+        pks = {
+            basename: viewset.queryset.model.objects.order_by('pk').values_list('pk', flat=True).first()
+            for _, viewset, basename in urls.router.registry
+            if viewset.queryset is not None
+        }
+        parametros = {
+            'receta-por-categoria': {'categoria': Receta.objects.values_list('categoria', flat=True).first()},
+            'insumo-stock-historico': {'fecha': timezone.localdate().isoformat()},
+        }
+
+        resultados = {}
+        for nombre, necesita_pk in endpoints():
+            if options['filtro'] not in nombre or nombre in options['excluir']:
+                continue
+            kwargs = {}
+            if necesita_pk:
+                pk = pks.get(_basename(nombre))
+                if pk is None:
+                    self.stdout.write(f'{nombre}: omitido, no hay filas para el detalle')
+                    continue
+                kwargs['pk'] = pk
+            url = reverse(nombre, kwargs=kwargs)
+            resultados[nombre] = self._medir(
+                usuario, url, parametros.get(nombre, {}), options['peticiones'],
+                options['calentamiento'], options['concurrencia']
+            )
+
+        anteriores = {}
+        if options['comparar']:
+            anteriores = json.loads(Path(options['comparar']).read_text())['endpoints']
+        self._reporte(resultados, anteriores)
+
+        salida = Path(
+            options['salida'] or settings.BENCHMARK_DIRECTORIO / f"benchmark-{timezone.now():%Y%m%d-%H%M%S}.json"
+        )
+        salida.parent.mkdir(parents=True, exist_ok=True)
+        salida.write_text(json.dumps({
+            'fecha': timezone.now().isoformat(),
+            'base_de_datos': settings.DATABASES['default']['ENGINE'],
+            'filas': {
+                modelo._meta.label: modelo.objects.count()
+                for modelo in (Insumo, Receta, RecetaInsumo, Venta, Merma)
+            },
+            'parametros': {
+                clave: options[clave] for clave in ('peticiones', 'calentamiento', 'concurrencia')
+            },
+            'endpoints': resultados,
+        }, indent=2, ensure_ascii=False))
+        self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {salida}'))
+
+    def _medir(self, usuario, url, parametros, peticiones, calentamiento, concurrencia):
+        latencias = []
+        errores = [0]
+        lock = threading.Lock()
+
+        def get(client):
+            response = client.get(url, parametros)
+            if response.streaming:
+                # Las exportaciones se miden hasta recibir el último byte
+                for _ in response.streaming_content:
+                    pass
+            return response.status_code
+
+        def cliente(cantidad):
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(usuario)
+            try:
+                for _ in range(calentamiento):
+                    get(client)
+                for _ in range(cantidad):
+                    inicio = time.perf_counter()
+                    status = get(client)
+                    with lock:
+                        latencias.append(time.perf_counter() - inicio)
+                        errores[0] += status != 200
+            finally:
+                if concurrencia > 1:
+                    connections.close_all()
+
+        # Se reparten las peticiones entre los clientes
+        cantidades = [peticiones // concurrencia + (i < peticiones % concurrencia) for i in range(concurrencia)]
+        inicio = time.perf_counter()
+        if concurrencia == 1:
+            cliente(peticiones)
+        else:
+            hilos = [threading.Thread(target=cliente, args=(cantidad,)) for cantidad in cantidades]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        duracion = time.perf_counter() - inicio
+
+        return {
+            'url': url,
+            'peticiones': len(latencias),
+            'errores': errores[0],
+            'req_s': round(len(latencias) / duracion, 2),
+            'p50_ms': round(percentil(latencias, 50) * 1000, 3),
+            'p95_ms': round(percentil(latencias, 95) * 1000, 3),
+            'p99_ms': round(percentil(latencias, 99) * 1000, 3),
+        }
+
+    def _reporte(self, resultados, anteriores):
+        self.stdout.write(
+            f"{'endpoint':<32} {'req/s':>9} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10} {'errores':>8}"
+            + (f" {'Δ p95':>9}" if anteriores else '')
+        )
+        for nombre, resultado in resultados.items():
+            linea = (
+                f"{nombre:<32} {resultado['req_s']:>9.1f} {resultado['p50_ms']:>10.2f} "
+                f"{resultado['p95_ms']:>10.2f} {resultado['p99_ms']:>10.2f} {resultado['errores']:>8}"
+            )
+            anterior = anteriores.get(nombre)
+            if anterior and anterior['p95_ms']:
+                linea += f" {(resultado['p95_ms'] / anterior['p95_ms'] - 1) * 100:>+8.1f}%"
+            self.stdout.write(linea)
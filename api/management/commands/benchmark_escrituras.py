@@ -0,0 +1,104 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+
+from api.management.benchmark import percentil
+from api.models import Insumo
+from api.serializers import MermaLoteSerializer
+
+NOMBRE_INSUMO = '__benchmark_escrituras__'
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de concurrencia de escrituras: varios hilos registran mermas (insert + '
+        'update de stock en una transacción) a una tasa objetivo y se cuentan los errores '
+        'de bloqueo de la base de datos. Falla si hubo alguno.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8, help='Hilos escritores concurrentes')
+        parser.add_argument('--tasa', type=float, default=100, help='Escrituras por segundo objetivo (total)')
+        parser.add_argument('--segundos', type=float, default=10, help='Duración de la prueba')
+
+    def handle(self, *args, **options):
+        hilos, tasa, segundos = options['hilos'], options['tasa'], options['segundos']
+        if hilos < 1 or tasa <= 0 or segundos <= 0:
+            raise CommandError('--hilos, --tasa y --segundos deben ser positivos')
+
+        self.stdout.write(f"Base de datos: {settings.DATABASES['default']['ENGINE']}")
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.stdout.write(f'journal_mode: {cursor.fetchone()[0]}')
+
+        # Insumo propio de la prueba, con stock suficiente para todas las mermas
+        insumo = Insumo.objects.create(
+            nombre=NOMBRE_INSUMO, cantidad=Decimal('1000000000'),
+            unidad='unidad', precio_unitario=Decimal('1')
+        )
+        try:
+            latencias, errores, duracion = self._escribir(insumo.id, hilos, tasa, segundos)
+        finally:
+            insumo.delete()
+
+        escrituras = len(latencias)
+        self.stdout.write(
+            f'{escrituras} escrituras en {duracion:.1f} s ({escrituras / duracion:.1f}/s, '
+            f'objetivo {tasa:.1f}/s)'
+        )
+        if latencias:
+            self.stdout.write(
+                f'latencia p50 {percentil(latencias, 50) * 1000:.2f} ms, '
+                f'p95 {percentil(latencias, 95) * 1000:.2f} ms, '
+                f'p99 {percentil(latencias, 99) * 1000:.2f} ms'
+            )
+        if errores:
+            raise CommandError(f'{len(errores)} errores de bloqueo, por ejemplo: {errores[0]}')
+        self.stdout.write(self.style.SUCCESS('Sin errores de bloqueo'))
+
+    def _escribir(self, insumo_id, hilos, tasa, segundos):
+        # Cada hilo escribe a tasa / hilos por segundo, siguiendo un calendario fijo
+        # para que una escritura lenta no reduzca la tasa de las siguientes
+        intervalo = hilos / tasa
+        latencias = []
+        errores = []
+        lock = threading.Lock()
+        inicio = time.perf_counter()
+        fin = inicio + segundos
+
+        def escritor(numero):
+            siguiente = inicio + intervalo * numero / hilos
+            try:
+                while siguiente < fin:
+                    espera = siguiente - time.perf_counter()
+                    if espera > 0:
+                        time.sleep(espera)
+                    siguiente += intervalo
+
+                    serializer = MermaLoteSerializer(
+                        data={'mermas': [{'insumo': insumo_id, 'cantidad': '1'}]}
+                    )
+                    serializer.is_valid(raise_exception=True)
+                    t = time.perf_counter()
+                    try:
+                        serializer.save()
+                    except OperationalError as e:
+                        with lock:
+                            errores.append(str(e))
+                        continue
+                    with lock:
+                        latencias.append(time.perf_counter() - t)
+            finally:
+                connections.close_all()
+
+        escritores = [threading.Thread(target=escritor, args=(n,)) for n in range(hilos)]
+        for hilo in escritores:
+            hilo.start()
+        for hilo in escritores:
+            hilo.join()
+        return latencias, errores, time.perf_counter() - inicio
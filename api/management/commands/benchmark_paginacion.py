@@ -0,0 +1,83 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIRequestFactory
+
+from api.views import MermaViewSet, VentaViewSet
+
+COLECCIONES = {
+    'ventas': VentaViewSet,
+    'mermas': MermaViewSet,
+}
+
+
+class PaginaNumeradaPagination(PageNumberPagination):
+    """La paginación anterior al cursor: COUNT(*) más OFFSET en cada página"""
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class Command(BaseCommand):
+    help = (
+        'Recorre las páginas de /api/ventas/ o /api/mermas/ siguiendo el cursor y '
+        'compara el tiempo de cada página con el mismo listado paginado por número de página'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('coleccion', choices=sorted(COLECCIONES))
+        parser.add_argument('--paginas', type=int, default=200, help='Número máximo de páginas a recorrer')
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--muestras', type=int, default=10, help='Páginas a mostrar en el reporte')
+        parser.add_argument('--repeticiones', type=int, default=3, help='Mediciones de cada página')
+
+    def handle(self, *args, **options):
+        coleccion = options['coleccion']
+        page_size = options['page_size']
+        # Las dos vistas pasan por el mismo ViewSet, permisos, serializador y render;
+        # solo cambia la clase de paginación
+        vistas = {
+            'cursor': COLECCIONES[coleccion].as_view({'get': 'list'}),
+            'numerada': COLECCIONES[coleccion].as_view({'get': 'list'}, pagination_class=PaginaNumeradaPagination),
+        }
+        factory = APIRequestFactory(SERVER_NAME='localhost')
+
+        def medir(vista, url):
+            tiempos = []
+            for _ in range(options['repeticiones']):
+                inicio = time.perf_counter()
+                response = vistas[vista](factory.get(url))
+                response.render()
+                tiempos.append(time.perf_counter() - inicio)
+                if response.status_code != 200:
+                    raise CommandError(f'{url} respondió {response.status_code}')
+            return statistics.median(tiempos), response
+
+        # Recorremos la colección siguiendo el enlace next del cursor
+        urls_cursor = []
+        url = f'/api/{coleccion}/?page_size={page_size}'
+        while url and len(urls_cursor) < options['paginas']:
+            urls_cursor.append(url)
+            url = medir('cursor', url)[1].data['next']
+
+        if not urls_cursor:
+            raise CommandError('No hay datos para recorrer')
+
+        paso = max(1, len(urls_cursor) // options['muestras'])
+        paginas = sorted(set(range(0, len(urls_cursor), paso)) | {len(urls_cursor) - 1})
+
+        self.stdout.write(f"{'página':>8} {'cursor (ms)':>12} {'numerada (ms)':>14}")
+        resultados = []
+        for pagina in paginas:
+            tiempo_cursor = medir('cursor', urls_cursor[pagina])[0]
+            tiempo_numerada = medir('numerada', f'/api/{coleccion}/?page_size={page_size}&page={pagina + 1}')[0]
+            resultados.append((tiempo_cursor, tiempo_numerada))
+            self.stdout.write(f'{pagina + 1:>8} {tiempo_cursor * 1000:>12.2f} {tiempo_numerada * 1000:>14.2f}')
+
+        (primera_cursor, primera_numerada), (ultima_cursor, ultima_numerada) = resultados[0], resultados[-1]
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(urls_cursor)} páginas recorridas; de la primera a la última página el cursor pasa de '
+            f'{primera_cursor * 1000:.2f} a {ultima_cursor * 1000:.2f} ms y la paginación numerada de '
+            f'{primera_numerada * 1000:.2f} a {ultima_numerada * 1000:.2f} ms'
+        ))
@@ -0,0 +1,230 @@
+import random
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.busqueda import INDICES
+from api.cache import invalidar
+from api.models import (
+    ConsumoTeoricoDiario, HistorialCostoReceta, Insumo, LineaVenta, Merma, MovimientoStock, Receta,
+    RecetaInsumo, ResumenVentaDiario, SaldoStock, Venta, VersionColeccion
+)
+
+# (nombre, unidad, precio mínimo, precio máximo)
+INSUMOS_BASE = [
+    ('Harina', 'kg', 1, 3), ('Azúcar', 'kg', 1, 3), ('Mantequilla', 'kg', 8, 15),
+    ('Huevo', 'unidad', 0.2, 0.5), ('Leche', 'l', 1, 2), ('Crema', 'l', 4, 8),
+    ('Chocolate', 'kg', 10, 25), ('Levadura', 'kg', 5, 12), ('Sal', 'kg', 0.5, 1),
+    ('Vainilla', 'l', 30, 80), ('Queso', 'kg', 8, 20), ('Jamón', 'kg', 10, 22),
+    ('Tomate', 'kg', 1, 4), ('Café', 'kg', 15, 35), ('Frutilla', 'kg', 4, 10),
+    ('Manzana', 'kg', 1, 3), ('Nuez', 'kg', 12, 25), ('Aceite', 'l', 2, 6),
+]
+CATEGORIAS = ['Panadería', 'Pastelería', 'Postres', 'Bebidas', 'Salados']
+LOTE = 5000
+
+
+def _decimal(valor, decimales='0.01'):
+    return Decimal(str(valor)).quantize(Decimal(decimales))
+
+
+@contextmanager
+def _fecha_manual(modelo, campo):
+    """Desactiva auto_now_add para insertar filas con una fecha del historial"""
+    field = modelo._meta.get_field(campo)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        'Llena la base de datos con datos sintéticos para pruebas de carga: insumos, '
+        'recetas con un número configurable de insumos e historial de ventas y mermas. '
+        'Con la misma semilla y fecha final genera siempre los mismos datos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--insumos', type=int, default=200)
+        parser.add_argument('--recetas', type=int, default=100)
+        parser.add_argument('--insumos-por-receta', type=int, default=6,
+                            help='Insumos promedio por receta (varía entre la mitad y 1.5 veces)')
+        parser.add_argument('--anios', type=float, default=2, help='Años de historial de ventas y mermas')
+        parser.add_argument('--ventas-por-dia', type=int, default=80)
+        parser.add_argument('--mermas-por-dia', type=int, default=5)
+        parser.add_argument('--hasta', type=date.fromisoformat, default=None,
+                            help='Último día del historial (AAAA-MM-DD), por defecto hoy')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--limpiar', action='store_true',
+                            help='Elimina antes los insumos, recetas, ventas y mermas existentes')
+
+    def handle(self, *args, **options):
+        if options['insumos'] < 1 or options['recetas'] < 1 or options['insumos_por_receta'] < 1:
+            raise CommandError('--insumos, --recetas y --insumos-por-receta deben ser positivos')
+        if not options['limpiar'] and Insumo.objects.exists():
+            raise CommandError('La base de datos ya tiene datos, use --limpiar para reemplazarlos')
+
+        self.rng = random.Random(options['semilla'])
+        hasta = options['hasta'] or timezone.localdate()
+        desde = hasta - timedelta(days=max(0, round(options['anios'] * 365) - 1))
+
+        with transaction.atomic():
+            if options['limpiar']:
+                self._limpiar()
+            insumos = self._insumos(options['insumos'])
+            # El stock inicial abre el registro de movimientos de cada insumo
+            MovimientoStock.objects.registrar(
+                MovimientoStock.Tipo.AJUSTE, {insumo.pk: insumo.cantidad for insumo in insumos}
+            )
+            costos = self._recetas(options['recetas'], insumos, options['insumos_por_receta'])
+            ventas = self._ventas(costos, desde, hasta, options['ventas_por_dia'])
+            mermas = self._mermas(insumos, desde, hasta, options['mermas_por_dia'])
+            ResumenVentaDiario.objects.recalcular()
+            ConsumoTeoricoDiario.objects.recalcular()
+            for indice in INDICES.values():
+                indice.reconstruir()
+            invalidar(Insumo, Receta, RecetaInsumo, Venta, Merma)
+            VersionColeccion.objects.incrementar(Insumo, Receta, RecetaInsumo)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(insumos)} insumos, {len(costos)} recetas, {ventas} ventas y {mermas} mermas '
+            f'entre {desde} y {hasta}'
+        ))
+
+    def _limpiar(self):
+        # Borrado directo en SQL: las señales por fila de Venta y Merma recalcularían
+        # el resumen y las versiones una vez por cada fila eliminada
+        for modelo in (MovimientoStock, SaldoStock, LineaVenta, Venta, Merma, HistorialCostoReceta,
+                       ConsumoTeoricoDiario, RecetaInsumo, Receta, Insumo, ResumenVentaDiario):
+            modelo.objects.all()._raw_delete(modelo.objects.db)
+
+    def _insumos(self, cantidad):
+        rng = self.rng
+        insumos = []
+        for i in range(cantidad):
+            nombre, unidad, minimo, maximo = INSUMOS_BASE[i % len(INSUMOS_BASE)]
+            if i >= len(INSUMOS_BASE):
+                nombre = f'{nombre} {i // len(INSUMOS_BASE) + 1}'
+            insumos.append(Insumo(
+                nombre=nombre,
+                unidad=unidad,
+                cantidad=_decimal(rng.uniform(500, 5000)),
+                precio_unitario=_decimal(rng.uniform(minimo, maximo))
+            ))
+        return Insumo.objects.bulk_create(insumos, batch_size=LOTE)
+
+    def _recetas(self, cantidad, insumos, fan_out):
+        """Crea las recetas con sus líneas y devuelve {receta_id: costo_total}"""
+        rng = self.rng
+        recetas = Receta.objects.bulk_create([
+            Receta(
+                nombre=f'{CATEGORIAS[i % len(CATEGORIAS)]} {i + 1}',
+                descripcion='Receta generada para pruebas de carga',
+                porciones=rng.randint(1, 12),
+                categoria=CATEGORIAS[i % len(CATEGORIAS)]
+            )
+            for i in range(cantidad)
+        ], batch_size=LOTE)
+
+        lineas = []
+        for receta in recetas:
+            tamano = rng.randint(max(1, fan_out // 2), max(1, fan_out * 3 // 2))
+            for insumo in rng.sample(insumos, min(tamano, len(insumos))):
+                lineas.append(RecetaInsumo(
+                    receta=receta,
+                    insumo=insumo,
+                    cantidad=_decimal(rng.uniform(0.05, 2)),
+                    precio_unitario=insumo.precio_unitario
+                ))
+        # bulk_create no llama a save() ni a las señales, el costo se calcula al final
+        RecetaInsumo.objects.bulk_create(lineas, batch_size=LOTE)
+        Receta.objects.filter(pk__in=[receta.pk for receta in recetas]).recalcular_costo_total()
+        return dict(Receta.objects.filter(pk__in=[receta.pk for receta in recetas]).values_list('id', 'costo_total'))
+
+    def _momento(self, dia, hora_inicio, hora_fin):
+        segundos = self.rng.randrange(hora_inicio * 3600, hora_fin * 3600)
+        return timezone.make_aware(datetime.combine(dia, time.min) + timedelta(seconds=segundos))
+
+    def _por_dia(self, dia, promedio):
+        # Más movimiento los fines de semana y variación diaria de ±30 %
+        factor = 1.4 if dia.weekday() >= 5 else 1
+        return max(0, round(promedio * factor * self.rng.uniform(0.7, 1.3)))
+
+    def _dias(self, desde, hasta):
+        dia = desde
+        while dia <= hasta:
+            yield dia
+            dia += timedelta(days=1)
+
+    def _ventas(self, costos, desde, hasta, por_dia):
+        rng = self.rng
+        receta_ids = list(costos)
+        total = 0
+        pendientes = []
+
+        def guardar(pendientes):
+            with _fecha_manual(Venta, 'fecha_venta'):
+                Venta.objects.bulk_create([venta for venta, _ in pendientes], batch_size=LOTE)
+            LineaVenta.objects.bulk_create([
+                LineaVenta(venta_id=venta.pk, **linea)
+                for venta, lineas in pendientes
+                for linea in lineas
+            ], batch_size=LOTE)
+
+        for dia in self._dias(desde, hasta):
+            for _ in range(self._por_dia(dia, por_dia)):
+                recetas = rng.sample(receta_ids, min(rng.choice((1, 1, 1, 2, 2, 3)), len(receta_ids)))
+                margen = Decimal(str(rng.uniform(1.8, 3)))
+                lineas = [
+                    {
+                        'receta_id': receta_id,
+                        'cantidad': rng.choice((1, 1, 1, 2, 2, 3)),
+                        'precio_unitario': _decimal(costos[receta_id] * margen)
+                    }
+                    for receta_id in recetas
+                ]
+                venta = Venta(
+                    fecha_venta=self._momento(dia, 8, 22),
+                    total=sum(linea['cantidad'] * linea['precio_unitario'] for linea in lineas),
+                    # Las ventas del último día quedan en parte sin completar
+                    completada=dia < hasta or rng.random() < 0.7
+                )
+                pendientes.append((venta, lineas))
+            if len(pendientes) >= LOTE:
+                guardar(pendientes)
+                total += len(pendientes)
+                pendientes = []
+        if pendientes:
+            guardar(pendientes)
+            total += len(pendientes)
+        return total
+
+    def _mermas(self, insumos, desde, hasta, por_dia):
+        rng = self.rng
+        total = 0
+        pendientes = []
+
+        def guardar(pendientes):
+            with _fecha_manual(Merma, 'fecha_merma'):
+                Merma.objects.bulk_create(pendientes, batch_size=LOTE)
+
+        for dia in self._dias(desde, hasta):
+            for _ in range(self._por_dia(dia, por_dia)):
+                pendientes.append(Merma(
+                    insumo=rng.choice(insumos),
+                    cantidad=_decimal(rng.uniform(0.1, 5)),
+                    fecha_merma=self._momento(dia, 6, 23)
+                ))
+            if len(pendientes) >= LOTE:
+                guardar(pendientes)
+                total += len(pendientes)
+                pendientes = []
+        if pendientes:
+            guardar(pendientes)
+            total += len(pendientes)
+        return total
@@ -0,0 +1,84 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from api.models import Insumo, MovimientoStock, SaldoStock
+
+PERIODOS = ('dia', 'semana', 'mes')
+
+
+def inicio_periodo(dia, periodo):
+    if periodo == 'semana':
+        return dia - timedelta(days=dia.weekday())
+    if periodo == 'mes':
+        return dia.replace(day=1)
+    return dia
+
+
+def siguiente_periodo(dia, periodo):
+    if periodo == 'semana':
+        return dia + timedelta(weeks=1)
+    if periodo == 'mes':
+        return (dia.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return dia + timedelta(days=1)
+
+
+class Command(BaseCommand):
+    help = (
+        'Guarda el saldo de stock de cada insumo al inicio de cada período, desde el '
+        'último saldo guardado (o el primer movimiento) hasta hoy. Pensado para '
+        'ejecutarse periódicamente, por ejemplo con cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--periodo', choices=PERIODOS, default='semana', help='Por defecto semana')
+        parser.add_argument('--hasta', help='Último día de corte (AAAA-MM-DD), por defecto hoy')
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help='Comparar el stock calculado con los movimientos contra Insumo.cantidad'
+        )
+
+    def handle(self, *args, **options):
+        periodo = options['periodo']
+        hasta = timezone.localdate()
+        if options['hasta']:
+            hasta = parse_date(options['hasta'])
+            if hasta is None:
+                raise CommandError('--hasta debe tener el formato AAAA-MM-DD')
+
+        # Se continúa desde el último saldo; sin saldos, desde el primer movimiento
+        ultimo = SaldoStock.objects.aggregate(corte=Max('corte'))['corte']
+        if ultimo is not None:
+            dia = siguiente_periodo(inicio_periodo(timezone.localtime(ultimo).date(), periodo), periodo)
+        else:
+            primero = MovimientoStock.objects.aggregate(fecha=Min('fecha'))['fecha']
+            if primero is None:
+                raise CommandError('No hay movimientos de stock')
+            dia = siguiente_periodo(inicio_periodo(timezone.localtime(primero).date(), periodo), periodo)
+
+        cortes = saldos = 0
+        while dia <= hasta:
+            with transaction.atomic():
+                saldos += SaldoStock.objects.generar(timezone.make_aware(datetime.combine(dia, time.min)))
+            cortes += 1
+            dia = siguiente_periodo(dia, periodo)
+        self.stdout.write(self.style.SUCCESS(f'{saldos} saldos guardados en {cortes} cortes'))
+
+        if options['verificar']:
+            self._verificar()
+
+    def _verificar(self):
+        calculado = MovimientoStock.objects.saldos_en(timezone.now())
+        diferencias = 0
+        for insumo_id, nombre, cantidad in Insumo.objects.order_by('id').values_list('id', 'nombre', 'cantidad'):
+            esperado = calculado.get(insumo_id, 0)
+            if esperado != cantidad:
+                diferencias += 1
+                self.stderr.write(f'Insumo {insumo_id} ({nombre}): stock {cantidad}, movimientos {esperado}')
+        if diferencias:
+            raise CommandError(f'{diferencias} insumos no coinciden con su registro de movimientos')
+        self.stdout.write(self.style.SUCCESS('El stock coincide con el registro de movimientos'))
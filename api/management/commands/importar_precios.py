@@ -0,0 +1,66 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from api.importacion import FORMATOS_IMPORTACION, formato_archivo, leer_filas
+from api.serializers import ImportacionInsumosSerializer
+
+
+def _mensajes(errores):
+    return '; '.join(
+        f"{campo}: {' '.join(str(mensaje) for mensaje in mensajes)}" for campo, mensajes in errores.items()
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa una lista de precios de proveedor (CSV o JSON) creando o actualizando '
+        'insumos por id o nombre, en una sola transacción'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo CSV o JSON')
+        parser.add_argument('--formato', choices=FORMATOS_IMPORTACION, help='Por defecto según la extensión')
+        parser.add_argument(
+            '--historial', action='store_true',
+            help='Registrar el costo anterior y el nuevo de cada receta afectada'
+        )
+        parser.add_argument('--detalle', action='store_true', help='Mostrar la acción de cada fila')
+
+    def handle(self, *args, **options):
+        ruta = Path(options['archivo'])
+        if not ruta.is_file():
+            raise CommandError(f'No existe el archivo {ruta}')
+
+        try:
+            filas = leer_filas(ruta.read_bytes(), formato_archivo(ruta.name, options['formato']))
+        except ValidationError as e:
+            raise CommandError(e.detail)
+
+        serializer = ImportacionInsumosSerializer(data={
+            'insumos': filas,
+            'registrar_historial': options['historial']
+        })
+        if not serializer.is_valid():
+            errores = serializer.errores_por_fila
+            for fila in errores.pop('filas', []):
+                self.stderr.write(f"Fila {fila['fila']}: {_mensajes(fila['errores'])}")
+            if errores:
+                self.stderr.write(_mensajes(errores))
+            raise CommandError('No se importó ninguna fila')
+
+        reporte = serializer.save()
+        if options['detalle']:
+            for fila in reporte['filas']:
+                self.stdout.write(f"Fila {fila['fila']}: {fila['accion']} {fila['id']} {fila['nombre']}")
+        for cambio in reporte['historial']:
+            self.stdout.write(
+                f'Receta {cambio.receta_id}: {cambio.costo_anterior} -> {cambio.costo_nuevo} '
+                f'({cambio.diferencia:+})'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{reporte['creados']} insumos creados, {reporte['actualizados']} actualizados, "
+            f"{reporte['sin_cambios']} sin cambios; "
+            f"{reporte['lineas_receta_actualizadas']} líneas de receta actualizadas"
+        ))
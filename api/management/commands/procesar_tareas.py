@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.tareas import Trabajadores
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta las tareas en segundo plano encoladas con ?asincrono=1'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hilos', type=int, default=settings.TAREAS_CONCURRENCIA,
+            help='Tareas que se ejecutan a la vez (por defecto TAREAS_CONCURRENCIA)'
+        )
+        parser.add_argument(
+            '--intervalo', type=float, default=1.0,
+            help='Segundos entre consultas a la cola cuando está vacía'
+        )
+        parser.add_argument(
+            '--una-vez', action='store_true',
+            help='Termina cuando no quedan tareas pendientes en lugar de esperar nuevas'
+        )
+
+    def handle(self, *args, **options):
+        if options['hilos'] < 1:
+            self.stderr.write('--hilos debe ser mayor que cero')
+            return
+        trabajadores = Trabajadores(options['hilos'], options['intervalo'], options['una_vez'])
+        trabajadores.iniciar()
+        self.stdout.write(f"Procesando tareas con {options['hilos']} hilos ({trabajadores.nombre})")
+        try:
+            trabajadores.esperar()
+        except KeyboardInterrupt:
+            self.stdout.write('Interrumpido tras terminar las tareas en curso')
+        self.stdout.write(self.style.SUCCESS('Trabajadores detenidos'))
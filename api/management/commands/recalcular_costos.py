@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Receta
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el costo_total almacenado de todas las recetas en una sola pasada'
+
+    def handle(self, *args, **options):
+        actualizadas = Receta.objects.all().recalcular_costo_total()
+        self.stdout.write(self.style.SUCCESS(f'Costo recalculado para {actualizadas} recetas'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api.busqueda import INDICES
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los índices de búsqueda de texto de insumos y recetas'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stdout.write('Los índices de búsqueda solo existen en SQLite, no hay nada que reconstruir')
+            return
+        with transaction.atomic():
+            for modelo, indice in INDICES.items():
+                indice.reconstruir()
+                self.stdout.write(f'{modelo._meta.verbose_name_plural}: {modelo.objects.count()} filas indexadas')
+        self.stdout.write(self.style.SUCCESS('Índices de búsqueda reconstruidos'))
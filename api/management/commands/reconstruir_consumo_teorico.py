@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.models import ConsumoTeoricoDiario
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye la tabla de consumo teórico diario por insumo a partir de todas '
+        'las ventas completadas y las recetas actuales'
+    )
+
+    def handle(self, *args, **options):
+        ConsumoTeoricoDiario.objects.recalcular()
+        total = ConsumoTeoricoDiario.objects.count()
+        dias = ConsumoTeoricoDiario.objects.values('fecha').distinct().count()
+        self.stdout.write(self.style.SUCCESS(f'Consumo teórico reconstruido: {total} filas en {dias} días'))
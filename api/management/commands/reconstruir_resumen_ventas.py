@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api.models import ResumenVentaDiario
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la tabla de resúmenes diarios de ventas a partir de todas las ventas'
+
+    def handle(self, *args, **options):
+        ResumenVentaDiario.objects.recalcular()
+        total = ResumenVentaDiario.objects.count()
+        self.stdout.write(self.style.SUCCESS(f'Resumen reconstruido para {total} días'))
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 13:21
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def calcular_costos(apps, schema_editor):
+    Receta = apps.get_model('api', 'Receta')
+    RecetaInsumo = apps.get_model('api', 'RecetaInsumo')
+    costo = RecetaInsumo.objects.filter(receta=OuterRef('pk')).values('receta').annotate(
+        total=Sum(F('cantidad') * F('precio_unitario'))
+    ).values('total')
+    Receta.objects.update(costo_total=Coalesce(
+        Subquery(costo, output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+        Value(Decimal('0')),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_alter_venta_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receta',
+            name='costo_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(calcular_costos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 13:24
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def generar_resumenes(apps, schema_editor):
+    Venta = apps.get_model('api', 'Venta')
+    ResumenVentaDiario = apps.get_model('api', 'ResumenVentaDiario')
+    filas = Venta.objects.order_by().annotate(fecha=TruncDate('fecha_venta')).values('fecha').annotate(
+        cantidad_ventas=Count('id'),
+        ventas_completadas=Count('id', filter=Q(completada=True)),
+        ventas_pendientes=Count('id', filter=Q(completada=False)),
+        monto_total=Coalesce(
+            Sum('total', filter=Q(completada=True)), Value(Decimal('0')),
+            output_field=models.DecimalField(max_digits=14, decimal_places=2)
+        )
+    )
+    ResumenVentaDiario.objects.bulk_create([ResumenVentaDiario(**fila) for fila in filas])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_receta_costo_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenVentaDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('cantidad_ventas', models.PositiveIntegerField(default=0)),
+                ('ventas_completadas', models.PositiveIntegerField(default=0)),
+                ('ventas_pendientes', models.PositiveIntegerField(default=0)),
+                ('monto_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.RunPython(generar_resumenes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_resumenventadiario'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='merma',
+            index=models.Index(fields=['-fecha_merma', '-id'], name='merma_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['-fecha_venta', '-id'], name='venta_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 13:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_versioncoleccion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorialCostoReceta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('costo_anterior', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('costo_nuevo', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('receta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historial_costos', to='api.receta')),
+            ],
+            options={
+                'ordering': ['-fecha'],
+            },
+        ),
+    ]
@@ -0,0 +1,83 @@
+from decimal import Decimal
+from itertools import islice
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BLOQUE = 2000
+
+
+def _repartir_total(total, partes):
+    parte = (total / partes).quantize(Decimal('0.01'))
+    return [parte] * (partes - 1) + [total - parte * (partes - 1)]
+
+
+def copiar_lineas(apps, schema_editor):
+    """
+    Cada fila de la tabla intermedia pasa a ser una línea de una unidad. El total
+    de la venta se reparte en partes iguales entre sus recetas, así la suma de las
+    líneas sigue siendo el total.
+    """
+    Venta = apps.get_model('api', 'Venta')
+    LineaVenta = apps.get_model('api', 'LineaVenta')
+    RecetasVenta = Venta.receta.through
+
+    ventas = Venta.objects.order_by('id').values_list('id', 'total').iterator(chunk_size=BLOQUE)
+    while bloque := list(islice(ventas, BLOQUE)):
+        recetas = {}
+        for venta_id, receta_id in RecetasVenta.objects.filter(
+            venta_id__in=[venta_id for venta_id, _ in bloque]
+        ).order_by('id').values_list('venta_id', 'receta_id'):
+            recetas.setdefault(venta_id, []).append(receta_id)
+
+        LineaVenta.objects.bulk_create([
+            LineaVenta(venta_id=venta_id, receta_id=receta_id, cantidad=1, precio_unitario=precio)
+            for venta_id, total in bloque if venta_id in recetas
+            for receta_id, precio in zip(recetas[venta_id], _repartir_total(total, len(recetas[venta_id])))
+        ])
+
+
+def copiar_recetas(apps, schema_editor):
+    Venta = apps.get_model('api', 'Venta')
+    LineaVenta = apps.get_model('api', 'LineaVenta')
+    RecetasVenta = Venta.receta.through
+
+    lineas = LineaVenta.objects.order_by('id').values_list('venta_id', 'receta_id').iterator(chunk_size=BLOQUE)
+    while bloque := list(islice(lineas, BLOQUE)):
+        RecetasVenta.objects.bulk_create([
+            RecetasVenta(venta_id=venta_id, receta_id=receta_id) for venta_id, receta_id in bloque
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_historialcostoreceta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LineaVenta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField(default=1)),
+                ('precio_unitario', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('receta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas_venta', to='api.receta')),
+                ('venta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas', to='api.venta')),
+            ],
+            options={
+                'unique_together': {('venta', 'receta')},
+            },
+        ),
+        migrations.RunPython(copiar_lineas, copiar_recetas),
+        # La relación pasa a usar LineaVenta como tabla intermedia
+        migrations.RemoveField(
+            model_name='venta',
+            name='receta',
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='receta',
+            field=models.ManyToManyField(related_name='ventas', through='api.LineaVenta', to='api.receta'),
+        ),
+    ]
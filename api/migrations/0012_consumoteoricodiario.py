@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 13:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+
+
+def generar_consumos(apps, schema_editor):
+    LineaVenta = apps.get_model('api', 'LineaVenta')
+    ConsumoTeoricoDiario = apps.get_model('api', 'ConsumoTeoricoDiario')
+    filas = LineaVenta.objects.filter(venta__completada=True).order_by().annotate(
+        fecha=TruncDate('venta__fecha_venta')
+    ).values('fecha', insumo_id=F('receta__recetainsumo__insumo')).annotate(cantidad=Sum(
+        F('cantidad') * F('receta__recetainsumo__cantidad'),
+        output_field=models.DecimalField(max_digits=14, decimal_places=2)
+    )).filter(insumo_id__isnull=False)
+    ConsumoTeoricoDiario.objects.bulk_create([ConsumoTeoricoDiario(**fila) for fila in filas], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_lineaventa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumoTeoricoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('cantidad', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('insumo', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='consumos_teoricos', to='api.insumo')),
+            ],
+            options={
+                'unique_together': {('fecha', 'insumo')},
+            },
+        ),
+        migrations.RunPython(generar_consumos, migrations.RunPython.noop),
+    ]
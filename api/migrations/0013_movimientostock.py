@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-18 14:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def registrar_stock_inicial(apps, schema_editor):
+    """El registro empieza con un ajuste por el stock que cada insumo tiene al migrar"""
+    Insumo = apps.get_model('api', 'Insumo')
+    MovimientoStock = apps.get_model('api', 'MovimientoStock')
+    ahora = django.utils.timezone.now()
+    MovimientoStock.objects.bulk_create([
+        MovimientoStock(insumo_id=insumo_id, tipo='ajuste', cantidad=cantidad, fecha=ahora)
+        for insumo_id, cantidad in Insumo.objects.exclude(cantidad=0).values_list('id', 'cantidad').iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_consumoteoricodiario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('tipo', models.CharField(choices=[('compra', 'Compra'), ('venta', 'Venta'), ('merma', 'Merma'), ('ajuste', 'Ajuste')], max_length=10)),
+                ('cantidad', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('insumo', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='api.insumo')),
+                ('venta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_stock', to='api.venta')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['insumo', 'fecha', 'id'], name='movimiento_insumo_fecha_idx'), models.Index(fields=['fecha'], name='movimiento_fecha_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SaldoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('corte', models.DateTimeField()),
+                ('cantidad', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('insumo', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='api.insumo')),
+            ],
+            options={
+                'unique_together': {('corte', 'insumo')},
+            },
+        ),
+        migrations.RunPython(registrar_stock_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# Índices FTS5 (solo SQLite) de api/busqueda.py: copia del texto con el id del
+# modelo como rowid, sin distinguir acentos y con índices de prefijos de 2 y 3 letras
+INDICES = {
+    'api_insumo': ('nombre',),
+    'api_receta': ('nombre', 'categoria', 'descripcion'),
+}
+
+
+def crear_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for tabla, columnas in INDICES.items():
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {tabla}_fts USING fts5({', '.join(columnas)}, "
+            f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {tabla}_fts (rowid, {', '.join(columnas)}) "
+            f"SELECT id, {', '.join(columnas)} FROM {tabla}"
+        )
+
+
+def eliminar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for tabla in INDICES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {tabla}_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_movimientostock'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, eliminar_indices),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 14:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Nombre que Django dio al índice de la ForeignKey api_merma.insumo_id
+# (api_merma_insumo_id_ + names_digest de tabla y columna), igual en SQLite y PostgreSQL
+INDICE_INSUMO = 'api_merma_insumo_id_3f3ecf89'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_indices_busqueda'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='merma',
+                    name='insumo',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='mermas', to='api.insumo'),
+                ),
+            ],
+            database_operations=[
+                # En SQLite AlterField reconstruye la tabla completa solo para quitar el índice
+                migrations.RunSQL(
+                    f'DROP INDEX IF EXISTS "{INDICE_INSUMO}"',
+                    f'CREATE INDEX IF NOT EXISTS "{INDICE_INSUMO}" ON "api_merma" ("insumo_id")',
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='merma',
+            index=models.Index(fields=['insumo', 'fecha_merma', 'cantidad'], name='merma_insumo_fecha_idx'),
+        ),
+    ]
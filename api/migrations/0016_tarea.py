@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-18 14:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_merma_insumo_fecha_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarea',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('vista', models.CharField(max_length=200)),
+                ('accion', models.CharField(max_length=100)),
+                ('metodo', models.CharField(default='GET', max_length=10)),
+                ('ruta', models.CharField(max_length=200)),
+                ('origen', models.CharField(max_length=200)),
+                ('parametros', models.JSONField(default=dict)),
+                ('datos', models.JSONField(blank=True, null=True)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En Curso'), ('completada', 'Completada'), ('fallida', 'Fallida')], default='pendiente', max_length=10)),
+                ('procesados', models.PositiveBigIntegerField(default=0)),
+                ('total', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('trabajador', models.CharField(blank=True, max_length=100)),
+                ('latido', models.DateTimeField(blank=True, null=True)),
+                ('codigo', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('archivo', models.CharField(blank=True, max_length=100)),
+                ('tipo_contenido', models.CharField(blank=True, max_length=100)),
+                ('disposicion', models.CharField(blank=True, max_length=200)),
+                ('error', models.TextField(blank=True)),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('iniciada', models.DateTimeField(blank=True, null=True)),
+                ('terminada', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='tareas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'id'], name='tarea_estado_idx'), models.Index(fields=['usuario', '-id'], name='tarea_usuario_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+# Colecciones servidas con ETag / Last-Modified (colecciones_versionadas de los ViewSets)
+COLECCIONES = ('api.insumo', 'api.receta', 'api.recetainsumo')
+
+
+def crear_versiones(apps, schema_editor):
+    VersionColeccion = apps.get_model('api', 'VersionColeccion')
+    # Las filas de otros modelos (mermas, ventas) ya no se incrementan
+    VersionColeccion.objects.exclude(modelo__in=COLECCIONES).delete()
+    existentes = set(VersionColeccion.objects.values_list('modelo', flat=True))
+    VersionColeccion.objects.bulk_create(
+        [VersionColeccion(modelo=modelo) for modelo in COLECCIONES if modelo not in existentes]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_tarea'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_versiones, migrations.RunPython.noop),
+    ]
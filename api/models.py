@@ -1,5 +1,52 @@
-from django.db import models
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import (
+    Case, Count, DecimalField, F, Max, Min, OuterRef, Q, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Coalesce, Round, TruncDate, TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .cache import invalidar
+
+# Máximo de períodos de una consulta agrupada con expresion_periodo
+MAX_PERIODOS = 400
+
+# Funciones de truncado para agrupar por periodo (parámetro granularity)
+GRANULARIDADES = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+class InsumoQuerySet(models.QuerySet):
+    def ajustar_cantidades(self, cambios, tipo, **referencias):
+        """
+        Suma a cada insumo la cantidad indicada en cambios ({insumo_id: cantidad})
+        con un solo UPDATE calculado en la base de datos y registra un movimiento
+        de stock del tipo indicado por cada insumo. Si algún insumo no existe no se
+        modifica ninguno y se lanza ValidationError: el stock y el registro de
+        movimientos cambian siempre juntos.
+        """
+        if not cambios:
+            return 0
+        invalidar(Insumo)
+        with transaction.atomic():
+            actualizados = self.filter(pk__in=cambios).update(cantidad=F('cantidad') + Case(
+                *[When(pk=pk, then=Value(cantidad)) for pk, cantidad in cambios.items()],
+                output_field=DecimalField(max_digits=10, decimal_places=2)
+            ))
+            if actualizados != len(cambios):
+                faltantes = set(cambios) - set(Insumo.objects.filter(pk__in=cambios).values_list('id', flat=True))
+                raise ValidationError({'insumos': f"Los siguientes insumos no existen: {sorted(faltantes)}"})
+            MovimientoStock.objects.registrar(tipo, cambios, **referencias)
+            # El stock solo se muestra en la colección de insumos
+            VersionColeccion.objects.incrementar(Insumo)
+        return actualizados
 
 # Modelo de Insumo
 class Insumo(models.Model):
@@ -9,10 +56,12 @@ class Insumo(models.Model):
     unidad = models.CharField(max_length=50)
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    objects = InsumoQuerySet.as_manager()
     
     def __str__(self):
         return self.nombre
-    
+
     # Validaciones para el modelo Insumo
 
     # Validación de Eliminar Insumo
@@ -27,16 +76,61 @@ class Insumo(models.Model):
         return super().delete(*args, **kwargs)
     
 
+class RecetaInsumoQuerySet(models.QuerySet):
+    def actualizar_precios(self, registrar_historial=False):
+        """
+        Copia el precio actual del insumo a las líneas del queryset cuyo precio quedó
+        desactualizado, con un solo UPDATE, y recalcula el costo de las recetas
+        afectadas. Con registrar_historial guarda el costo anterior y el nuevo de
+        cada receta en HistorialCostoReceta. Devuelve (lineas, historial).
+        """
+        desactualizadas = self.exclude(precio_unitario=F('insumo__precio_unitario'))
+
+        with transaction.atomic():
+            receta_ids = set(desactualizadas.values_list('receta_id', flat=True).distinct())
+            if not receta_ids:
+                return 0, []
+            recetas = Receta.objects.filter(pk__in=receta_ids)
+            costos_anteriores = dict(recetas.values_list('id', 'costo_total')) if registrar_historial else {}
+
+            lineas = desactualizadas.update(precio_unitario=Subquery(
+                Insumo.objects.filter(pk=OuterRef('insumo_id')).values('precio_unitario')[:1]
+            ))
+            recetas.recalcular_costo_total()
+            invalidar(RecetaInsumo)
+            VersionColeccion.objects.incrementar(RecetaInsumo)
+
+            historial = []
+            if registrar_historial:
+                historial = HistorialCostoReceta.objects.bulk_create([
+                    HistorialCostoReceta(
+                        receta_id=receta_id,
+                        costo_anterior=costos_anteriores[receta_id],
+                        costo_nuevo=costo_nuevo
+                    )
+                    for receta_id, costo_nuevo in recetas.values_list('id', 'costo_total')
+                ])
+        return lineas, historial
+
 # Modelo de RecetaInsumo
 class RecetaInsumo(models.Model):
     receta = models.ForeignKey('Receta', on_delete=models.CASCADE)
     insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE)
     cantidad = models.DecimalField(max_digits=10, decimal_places=2)
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+
+    objects = RecetaInsumoQuerySet.as_manager()
     
     class Meta:
         unique_together = ('receta', 'insumo')
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guardamos la receta cargada por si la línea se mueve a otra receta
+        instance._receta_id_original = instance.__dict__.get('receta_id')
+        return instance
+
     def save(self, *args, **kwargs):
         # Actualizar el precio unitario con el precio actual del insumo
         self.precio_unitario = self.insumo.precio_unitario
@@ -49,6 +143,20 @@ class RecetaInsumo(models.Model):
     def subtotal(self):
         return self.cantidad * self.precio_unitario
 
+class RecetaQuerySet(models.QuerySet):
+    def recalcular_costo_total(self):
+        """
+        Recalcula el costo_total de las recetas del queryset en un solo UPDATE
+        """
+        costo = RecetaInsumo.objects.filter(receta=OuterRef('pk')).values('receta').annotate(
+            total=Sum(F('cantidad') * F('precio_unitario'))
+        ).values('total')
+        return self.update(costo_total=Coalesce(
+            Subquery(costo, output_field=DecimalField(max_digits=12, decimal_places=2)),
+            Value(Decimal('0')),
+            output_field=DecimalField(max_digits=12, decimal_places=2)
+        ))
+
 # Modelo de Receta
 class Receta(models.Model):
     id = models.BigAutoField(primary_key=True)
@@ -58,35 +166,667 @@ class Receta(models.Model):
     porciones = models.DecimalField(max_digits=10, decimal_places=2)
     categoria = models.CharField(max_length=50)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Se mantiene desde signals.py cada vez que cambian sus RecetaInsumo
+    costo_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+
+    objects = RecetaQuerySet.as_manager()
     
     def __str__(self):
         return self.nombre
-    
+
+# Historial de cambios de costo de las recetas al actualizar precios
+class HistorialCostoReceta(models.Model):
+    receta = models.ForeignKey(Receta, on_delete=models.CASCADE, related_name='historial_costos')
+    costo_anterior = models.DecimalField(max_digits=12, decimal_places=2)
+    costo_nuevo = models.DecimalField(max_digits=12, decimal_places=2)
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-fecha']
+
+    def __str__(self):
+        return f"{self.receta_id}: {self.costo_anterior} -> {self.costo_nuevo}"
+
     @property
-    def costo_total(self):
-        # traemos todas las filas de RecetaInsumo que apunten a esta receta
-        items = RecetaInsumo.objects.filter(receta=self)
-        return sum(item.subtotal for item in items)
+    def diferencia(self):
+        return self.costo_nuevo - self.costo_anterior
+
+def repartir_total(total, partes):
+    """
+    Divide total en partes iguales con dos decimales; la última absorbe el redondeo
+    para que la suma sea exactamente total
+    """
+    if partes < 1:
+        return []
+    parte = (Decimal(total) / partes).quantize(Decimal('0.01'))
+    return [parte] * (partes - 1) + [Decimal(total) - parte * (partes - 1)]
 
 # Modelo de Venta
 class Venta(models.Model):
     id = models.BigAutoField(primary_key=True)
-    receta = models.ManyToManyField(Receta, related_name='ventas')
+    receta = models.ManyToManyField(Receta, through='LineaVenta', related_name='ventas')
     fecha_venta = models.DateTimeField(auto_now_add=True)
     total = models.DecimalField(max_digits=10, decimal_places=2)
     completada = models.BooleanField(default=False)
     
     class Meta:
         ordering = ['-fecha_venta']
+        indexes = [
+            # Soporta el orden y la paginación por cursor de las ventas
+            models.Index(fields=['-fecha_venta', '-id'], name='venta_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"Venta {self.id} - Total: {self.total}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guardamos lo que aporta al resumen diario para sumar solo la diferencia al guardar
+        if {'completada', 'total'} <= instance.__dict__.keys():
+            instance._aporte_original = instance.aporte_resumen()
+        return instance
+
+    def aporte_resumen(self):
+        """Lo que la venta suma al resumen de su día en ResumenVentaDiario"""
+        return {
+            'cantidad_ventas': 1,
+            'ventas_completadas': int(self.completada),
+            'ventas_pendientes': int(not self.completada),
+            'monto_total': self.total if self.completada else Decimal('0'),
+        }
+
+    def completar(self):
+        """
+        Marca la venta como completada y descuenta del stock los insumos de sus
+        recetas con aritmética en la base de datos, en una sola transacción y con
+        un número fijo de sentencias. Devuelve False si la venta ya estaba completada.
+        """
+        with transaction.atomic():
+            # Solo una petición concurrente puede hacer la transición a completada
+            if not Venta.objects.filter(pk=self.pk, completada=False).update(completada=True):
+                return False
+
+            # Cantidad del insumo por receta multiplicada por las unidades vendidas de cada línea
+            demanda = RecetaInsumo.objects.filter(receta__lineas_venta__venta=self).values_list(
+                'insumo'
+            ).annotate(total=Sum(
+                F('cantidad') * F('receta__lineas_venta__cantidad'),
+                output_field=DecimalField(max_digits=20, decimal_places=2)
+            ))
+            cambios = {insumo_id: -total.quantize(Decimal('0.01')) for insumo_id, total in demanda}
+            Insumo.objects.ajustar_cantidades(cambios, MovimientoStock.Tipo.VENTA, venta=self)
+            # El UPDATE de arriba no emite señales: la venta pasa de pendiente a completada en el resumen
+            ResumenVentaDiario.objects.sumar(
+                self.fecha_venta, ventas_completadas=1, ventas_pendientes=-1, monto_total=self.total
+            )
+
+            # Si algún insumo quedó negativo se revierte toda la transacción
+            faltantes = Insumo.objects.filter(pk__in=cambios, cantidad__lt=0).order_by('nombre')
+            if faltantes:
+                raise ValidationError({
+                    'insumos_faltantes': [
+                        f"{insumo.nombre}: faltan {-insumo.cantidad} {insumo.unidad}"
+                        for insumo in faltantes
+                    ]
+                })
+
+        self.completada = True
+        self._aporte_original = self.aporte_resumen()
+        ConsumoTeoricoDiario.objects.recalcular([self.fecha_venta])
+        return True
     
+# Línea de una venta: unidades vendidas de una receta y su precio unitario
+class LineaVenta(models.Model):
+    venta = models.ForeignKey(Venta, on_delete=models.CASCADE, related_name='lineas')
+    receta = models.ForeignKey(Receta, on_delete=models.CASCADE, related_name='lineas_venta')
+    cantidad = models.PositiveIntegerField(default=1)
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        unique_together = ('venta', 'receta')
+
+    def __str__(self):
+        return f"Venta {self.venta_id} - {self.cantidad} x receta {self.receta_id}"
+
+    @property
+    def subtotal(self):
+        return self.cantidad * self.precio_unitario
+
+class MermaQuerySet(models.QuerySet):
+    def por_periodo(self, granularity='day', desde=None, hasta=None):
+        """
+        Agrupa las mermas de desde a hasta (días locales, inclusive; por defecto la
+        primera y la última merma) por período e insumo, con la cantidad, el número de
+        registros y el costo (cantidad por precio actual del insumo)
+        """
+        if desde is None or hasta is None:
+            extremos = self.aggregate(primera=Min('fecha_merma'), ultima=Max('fecha_merma'))
+            if extremos['primera'] is None:
+                return self.none().values()
+            desde = desde or timezone.localtime(extremos['primera']).date()
+            hasta = hasta or timezone.localtime(extremos['ultima']).date()
+        periodos = periodos_locales(desde, hasta, granularity)
+        if len(periodos) > MAX_PERIODOS:
+            raise ValidationError({
+                'granularity': f'El rango abarca más de {MAX_PERIODOS} períodos, acótelo o use una granularity mayor'
+            })
+        if not periodos:
+            return self.none().values()
+
+        return self.filter(
+            fecha_merma__gte=timezone.make_aware(datetime.combine(desde, time.min)),
+            fecha_merma__lt=timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min))
+        ).annotate(periodo=expresion_periodo('fecha_merma', periodos)).values(
+            'periodo', 'insumo', insumo_nombre=F('insumo__nombre')
+        ).annotate(
+            total_merma=Sum('cantidad'),
+            registros=Count('id'),
+            # SQLite multiplica decimales como reales, se redondea en la consulta
+            costo_merma=Round(Sum(F('cantidad') * F('insumo__precio_unitario')), 2,
+                              output_field=DecimalField(max_digits=14, decimal_places=2))
+        ).order_by('periodo', 'insumo')
+
+
 class Merma(models.Model):
     id = models.BigAutoField(primary_key=True)
-    insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE, related_name='mermas')
+    # El índice (insumo, fecha_merma, cantidad) también cubre las búsquedas por insumo
+    insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE, related_name='mermas', db_index=False)
     cantidad = models.DecimalField(max_digits=10, decimal_places=2)
     fecha_merma = models.DateTimeField(auto_now_add=True)
+
+    objects = MermaQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Soporta los filtros por fecha y la paginación por cursor de las mermas
+            models.Index(fields=['-fecha_merma', '-id'], name='merma_fecha_idx'),
+            # Rango de fechas de las mermas de un insumo; con cantidad, los agregados
+            # por insumo y período se leen solo del índice
+            models.Index(fields=['insumo', 'fecha_merma', 'cantidad'], name='merma_insumo_fecha_idx'),
+        ]
     
     def __str__(self):
-        return f"Merma de {self.insumo.nombre} - Cantidad: {self.cantidad}"
\ No newline at end of file
+        return f"Merma de {self.insumo.nombre} - Cantidad: {self.cantidad}"
+
+
+def dias_locales(fechas):
+    """Días (en la zona horaria local) de una colección de fechas o datetimes"""
+    return {
+        timezone.localtime(fecha).date() if isinstance(fecha, datetime) else fecha
+        for fecha in fechas
+    }
+
+
+def periodos_locales(desde, hasta, granularity):
+    """Primer día de cada día, semana (lunes) o mes que toca el rango desde–hasta (inclusive)"""
+    if granularity == 'week':
+        inicio = desde - timedelta(days=desde.weekday())
+    elif granularity == 'month':
+        inicio = desde.replace(day=1)
+    else:
+        inicio = desde
+    periodos = []
+    while inicio <= hasta:
+        periodos.append(inicio)
+        if granularity == 'month':
+            inicio = (inicio + timedelta(days=32)).replace(day=1)
+        else:
+            inicio += timedelta(days=7 if granularity == 'week' else 1)
+    return periodos
+
+
+def expresion_periodo(campo, periodos):
+    """
+    Primer día del período (de la lista ordenada periodos) en que cae el DateTimeField
+    campo en la zona horaria local. Es un CASE de búsqueda binaria sobre los límites de
+    los períodos, que la base de datos evalúa sin funciones: en SQLite Trunc llama a una
+    función de Python por cada fila.
+    """
+    if len(periodos) == 1:
+        return Value(periodos[0], output_field=models.DateField())
+    mitad = len(periodos) // 2
+    limite = timezone.make_aware(datetime.combine(periodos[mitad], time.min))
+    return Case(
+        When(**{f'{campo}__lt': limite}, then=expresion_periodo(campo, periodos[:mitad])),
+        default=expresion_periodo(campo, periodos[mitad:]),
+        output_field=models.DateField()
+    )
+
+
+def filtro_dias(dias, campo):
+    """Q que selecciona las filas cuyo DateTimeField campo cae en alguno de los días"""
+    rango = Q()
+    for dia in dias:
+        inicio = timezone.make_aware(datetime.combine(dia, time.min))
+        rango |= Q(**{f'{campo}__gte': inicio, f'{campo}__lt': inicio + timedelta(days=1)})
+    return rango
+
+
+class MovimientoStockQuerySet(models.QuerySet):
+    def registrar(self, tipo, cambios, fecha=None, **referencias):
+        """
+        Agrega un movimiento por insumo de cambios ({insumo_id: cantidad}), omitiendo
+        los que no cambian el stock. No modifica Insumo.cantidad.
+        """
+        fecha = fecha or timezone.now()
+        return self.bulk_create([
+            MovimientoStock(insumo_id=insumo_id, tipo=tipo, cantidad=cantidad, fecha=fecha, **referencias)
+            for insumo_id, cantidad in cambios.items() if cantidad
+        ])
+
+    def saldos_en(self, momento, insumos=None):
+        """
+        Stock de cada insumo ({insumo_id: cantidad}) en el instante momento: el
+        último saldo guardado antes de momento más los movimientos posteriores,
+        sin recorrer el historial completo
+        """
+        saldos = SaldoStock.objects.filter(corte__lte=momento)
+        movimientos = self.filter(fecha__lt=momento).order_by()
+        if insumos is not None:
+            saldos = saldos.filter(insumo__in=insumos)
+            movimientos = movimientos.filter(insumo__in=insumos)
+
+        corte = saldos.aggregate(corte=Max('corte'))['corte']
+        resultado = {}
+        if corte is not None:
+            resultado = dict(saldos.filter(corte=corte).values_list('insumo_id', 'cantidad'))
+            movimientos = movimientos.filter(fecha__gte=corte)
+        for insumo_id, total in movimientos.values_list('insumo').annotate(total=Sum('cantidad')):
+            resultado[insumo_id] = resultado.get(insumo_id, 0) + total
+        # En SQLite las sumas de decimales se calculan en coma flotante
+        return {insumo_id: Decimal(cantidad).quantize(Decimal('0.01')) for insumo_id, cantidad in resultado.items()}
+
+
+# Registro de solo inserción de cada cambio de Insumo.cantidad. La suma de los
+# movimientos de un insumo es su stock; se escribe desde todos los caminos que
+# modifican el stock (ajustar_cantidades, ventas completadas, edición e importación)
+class MovimientoStock(models.Model):
+    class Tipo(models.TextChoices):
+        COMPRA = 'compra'
+        VENTA = 'venta'
+        MERMA = 'merma'
+        AJUSTE = 'ajuste'
+
+    id = models.BigAutoField(primary_key=True)
+    # El índice (insumo, fecha, id) también cubre las búsquedas por insumo
+    insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE, related_name='movimientos', db_index=False)
+    tipo = models.CharField(max_length=10, choices=Tipo.choices)
+    # Positiva si entra stock, negativa si sale
+    cantidad = models.DecimalField(max_digits=12, decimal_places=2)
+    fecha = models.DateTimeField(default=timezone.now)
+    venta = models.ForeignKey(
+        Venta, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_stock'
+    )
+
+    objects = MovimientoStockQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Rango de movimientos de un insumo y su paginación por cursor
+            models.Index(fields=['insumo', 'fecha', 'id'], name='movimiento_insumo_fecha_idx'),
+            # Movimientos de todos los insumos desde el último saldo
+            models.Index(fields=['fecha'], name='movimiento_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} de {self.insumo_id}: {self.cantidad}"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None and not self._state.adding:
+            raise ValidationError("Los movimientos de stock no se pueden modificar")
+        return super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Los movimientos de stock no se pueden eliminar")
+
+
+class SaldoStockQuerySet(models.QuerySet):
+    def generar(self, corte):
+        """
+        Guarda el stock de cada insumo en el instante corte, a partir del saldo
+        anterior más cercano y los movimientos entre ambos. Devuelve cuántos
+        saldos se guardaron.
+        """
+        anterior = self.filter(corte__lt=corte).aggregate(corte=Max('corte'))['corte']
+        saldos = {}
+        movimientos = MovimientoStock.objects.filter(fecha__lt=corte).order_by()
+        if anterior is not None:
+            saldos = dict(self.filter(corte=anterior).values_list('insumo_id', 'cantidad'))
+            movimientos = movimientos.filter(fecha__gte=anterior)
+        for insumo_id, total in movimientos.values_list('insumo').annotate(total=Sum('cantidad')):
+            saldos[insumo_id] = saldos.get(insumo_id, 0) + total
+
+        return len(SaldoStock.objects.bulk_create(
+            [SaldoStock(insumo_id=insumo_id, corte=corte, cantidad=cantidad) for insumo_id, cantidad in saldos.items()],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['corte', 'insumo'],
+            update_fields=['cantidad']
+        ))
+
+
+# Stock de cada insumo en un instante (corte), generado periódicamente para que
+# consultar el stock en una fecha no requiera sumar todos los movimientos
+class SaldoStock(models.Model):
+    insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE, related_name='saldos', db_index=False)
+    corte = models.DateTimeField()
+    cantidad = models.DecimalField(max_digits=12, decimal_places=2)
+
+    objects = SaldoStockQuerySet.as_manager()
+
+    class Meta:
+        # corte primero: se leen todos los saldos de un corte
+        unique_together = ('corte', 'insumo')
+
+    def __str__(self):
+        return f"Saldo de {self.insumo_id} al {self.corte}: {self.cantidad}"
+
+
+class ResumenVentaDiarioQuerySet(models.QuerySet):
+    def sumar(self, fecha, **diferencias):
+        """
+        Suma las diferencias ({campo: cantidad}) al resumen del día local de fecha
+        con un UPDATE calculado en la base de datos, así dos ventas concurrentes del
+        mismo día no se pisan. Si el día no tiene resumen se crea.
+        """
+        diferencias = {campo: valor for campo, valor in diferencias.items() if valor}
+        if not diferencias:
+            return
+        dia, = dias_locales([fecha])
+        incrementos = {campo: F(campo) + valor for campo, valor in diferencias.items()}
+        with transaction.atomic():
+            if self.filter(fecha=dia).update(**incrementos):
+                # Los días que se quedaron sin ventas desaparecen del resumen
+                if diferencias.get('cantidad_ventas', 0) < 0:
+                    self.filter(fecha=dia, cantidad_ventas=0).delete()
+                return
+            if any(valor < 0 for valor in diferencias.values()):
+                # Resumen ausente o desactualizado: lo corrige reconstruir_resumen_ventas
+                return
+            try:
+                with transaction.atomic():
+                    ResumenVentaDiario.objects.create(fecha=dia, **diferencias)
+            except IntegrityError:
+                # Otra venta creó el resumen del día entre el UPDATE y el INSERT
+                self.filter(fecha=dia).update(**incrementos)
+
+    def recalcular(self):
+        """Reconstruye todos los resúmenes a partir de la tabla de ventas"""
+        resumenes = [
+            ResumenVentaDiario(**fila)
+            for fila in Venta.objects.order_by().annotate(fecha=TruncDate('fecha_venta')).values('fecha').annotate(
+                cantidad_ventas=Count('id'),
+                ventas_completadas=Count('id', filter=Q(completada=True)),
+                ventas_pendientes=Count('id', filter=Q(completada=False)),
+                monto_total=Coalesce(
+                    Sum('total', filter=Q(completada=True)), Value(Decimal('0')),
+                    output_field=DecimalField(max_digits=14, decimal_places=2)
+                )
+            )
+        ]
+
+        with transaction.atomic():
+            self.all().delete()
+            ResumenVentaDiario.objects.bulk_create(resumenes, batch_size=1000)
+
+    def por_periodo(self, granularity='day'):
+        """Agrupa los resúmenes diarios por día, semana o mes"""
+        return self.annotate(periodo=GRANULARIDADES[granularity]('fecha')).values('periodo').annotate(
+            cantidad_ventas=Sum('cantidad_ventas'),
+            ventas_completadas=Sum('ventas_completadas'),
+            ventas_pendientes=Sum('ventas_pendientes'),
+            monto_total=Sum('monto_total')
+        ).order_by('periodo')
+
+# Resumen diario de ventas, se mantiene desde signals.py y al completar una venta
+class ResumenVentaDiario(models.Model):
+    fecha = models.DateField(unique=True)
+    cantidad_ventas = models.PositiveIntegerField(default=0)
+    ventas_completadas = models.PositiveIntegerField(default=0)
+    ventas_pendientes = models.PositiveIntegerField(default=0)
+    monto_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    objects = ResumenVentaDiarioQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-fecha']
+
+    def __str__(self):
+        return f"Resumen {self.fecha} - Ventas: {self.cantidad_ventas}"
+
+
+class ConsumoTeoricoDiarioQuerySet(models.QuerySet):
+    def recalcular(self, fechas=None):
+        """
+        Recalcula el consumo teórico de los días indicados (fechas o datetimes) a
+        partir de las líneas de las ventas completadas y las recetas actuales. Sin
+        fechas reconstruye todos los días.
+        """
+        lineas = LineaVenta.objects.filter(venta__completada=True).order_by()
+        if fechas is not None:
+            dias = dias_locales(fechas)
+            if not dias:
+                return
+            lineas = lineas.filter(filtro_dias(dias, 'venta__fecha_venta'))
+
+        # Las unidades se agrupan por día y receta en SQL; multiplicarlas por los
+        # insumos de cada receta en Python evita truncar la fecha en cada fila del JOIN
+        unidades = lineas.annotate(fecha=TruncDate('venta__fecha_venta')).values_list(
+            'fecha', 'receta_id'
+        ).annotate(unidades=Sum('cantidad'))
+        if fechas is None:
+            recetas = RecetaInsumo.objects.all()
+            unidades = unidades.iterator(chunk_size=5000)
+        else:
+            # Solo las recetas vendidas esos días, no el catálogo completo
+            unidades = list(unidades)
+            recetas = RecetaInsumo.objects.filter(receta_id__in={receta_id for _, receta_id, _ in unidades})
+        insumos_por_receta = {}
+        for receta_id, insumo_id, cantidad in recetas.values_list('receta_id', 'insumo_id', 'cantidad'):
+            insumos_por_receta.setdefault(receta_id, []).append((insumo_id, cantidad))
+
+        consumos = {}
+        for fecha, receta_id, cantidad_vendida in unidades:
+            for insumo_id, cantidad in insumos_por_receta.get(receta_id, ()):
+                clave = (fecha, insumo_id)
+                consumos[clave] = consumos.get(clave, 0) + cantidad * cantidad_vendida
+
+        with transaction.atomic():
+            anteriores = self.all() if fechas is None else self.filter(fecha__in=dias)
+            anteriores.delete()
+            ConsumoTeoricoDiario.objects.bulk_create([
+                ConsumoTeoricoDiario(fecha=fecha, insumo_id=insumo_id, cantidad=cantidad)
+                for (fecha, insumo_id), cantidad in consumos.items()
+            ], batch_size=5000)
+
+
+# Consumo teórico de cada insumo por día según las recetas vendidas, se mantiene
+# desde signals.py y al completar o cambiar las líneas de una venta
+class ConsumoTeoricoDiario(models.Model):
+    fecha = models.DateField()
+    # Sin índice propio: con él SQLite recorre toda la tabla en orden de insumo para
+    # agrupar, en lugar de usar el índice único por rango de fechas
+    insumo = models.ForeignKey(
+        Insumo, on_delete=models.CASCADE, related_name='consumos_teoricos', db_index=False
+    )
+    cantidad = models.DecimalField(max_digits=14, decimal_places=2)
+
+    objects = ConsumoTeoricoDiarioQuerySet.as_manager()
+
+    class Meta:
+        # fecha primero: las consultas filtran por rango de fechas y agrupan por insumo
+        unique_together = ('fecha', 'insumo')
+
+    def __str__(self):
+        return f"Consumo teórico {self.fecha} - {self.insumo_id}: {self.cantidad}"
+
+
+
+# Fecha de modificación de una colección que todavía no tiene fila de versión
+VERSION_INICIAL = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+class VersionColeccionQuerySet(models.QuerySet):
+    def incrementar(self, *modelos):
+        """
+        Incrementa la versión de las colecciones de los modelos indicados. Solo se
+        llama para los modelos que sirven los ViewSets con ETag (Insumo, Receta y
+        RecetaInsumo); las filas las crea la migración 0017. Si hay una transacción
+        en curso se hace al confirmarla, para no bloquear la fila de la colección
+        mientras dura.
+        """
+        etiquetas = {modelo._meta.label_lower for modelo in modelos}
+        transaction.on_commit(lambda: self._incrementar(etiquetas), using=self.db)
+
+    def _incrementar(self, etiquetas):
+        actualizadas = self.filter(modelo__in=etiquetas).update(
+            version=F('version') + 1, modificado=timezone.now()
+        )
+        if actualizadas < len(etiquetas):
+            # Solo si la tabla se vació después de migrar (p. ej. un flush)
+            self.bulk_create(
+                [VersionColeccion(modelo=etiqueta) for etiqueta in etiquetas],
+                ignore_conflicts=True
+            )
+
+    def vigentes(self, *modelos):
+        """
+        Devuelve {etiqueta: (version, modificado)} de las colecciones indicadas, sin
+        escribir: una colección sin fila queda en la versión 0.
+        """
+        etiquetas = sorted(modelo._meta.label_lower for modelo in modelos)
+        versiones = {
+            modelo: (version, modificado)
+            for modelo, version, modificado in self.filter(modelo__in=etiquetas).values_list(
+                'modelo', 'version', 'modificado'
+            )
+        }
+        return {etiqueta: versiones.get(etiqueta, (0, VERSION_INICIAL)) for etiqueta in etiquetas}
+
+# Marcador de versión por colección, se incrementa en cada escritura (ETag / Last-Modified)
+class VersionColeccion(models.Model):
+    modelo = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=1)
+    modificado = models.DateTimeField(default=timezone.now)
+
+    objects = VersionColeccionQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.modelo} v{self.version}"
+
+
+class TareaQuerySet(models.QuerySet):
+    def reclamar(self, trabajador):
+        """
+        Marca como en curso la tarea pendiente más antigua y la devuelve (None si no
+        hay). El UPDATE condicional evita que dos trabajadores tomen la misma.
+        """
+        while True:
+            pk = self.filter(estado=Tarea.Estado.PENDIENTE).order_by('id').values_list('id', flat=True).first()
+            if pk is None:
+                return None
+            ahora = timezone.now()
+            if self.filter(pk=pk, estado=Tarea.Estado.PENDIENTE).update(
+                estado=Tarea.Estado.EN_CURSO, trabajador=trabajador, iniciada=ahora, latido=ahora,
+                intentos=F('intentos') + 1
+            ):
+                return self.select_related('usuario').get(pk=pk)
+
+    def latir(self, prefijo):
+        """Renueva el latido de las tareas en curso de los trabajadores cuyo nombre empieza con prefijo"""
+        return self.filter(estado=Tarea.Estado.EN_CURSO, trabajador__startswith=prefijo).update(
+            latido=timezone.now()
+        )
+
+    def recuperar_abandonadas(self, sin_latido, max_intentos):
+        """
+        Devuelve a la cola las tareas en curso cuyo trabajador dejó de latir hace más
+        de sin_latido, o las marca como fallidas si ya agotaron sus intentos
+        """
+        abandonadas = self.filter(estado=Tarea.Estado.EN_CURSO, latido__lt=timezone.now() - sin_latido)
+        fallidas = abandonadas.filter(intentos__gte=max_intentos).update(
+            estado=Tarea.Estado.FALLIDA, terminada=timezone.now(),
+            error='El trabajador dejó de responder mientras ejecutaba la tarea'
+        )
+        reencoladas = abandonadas.update(estado=Tarea.Estado.PENDIENTE, trabajador='')
+        return reencoladas, fallidas
+
+    def purgar(self, antes_de):
+        """Elimina las tareas terminadas antes de la fecha indicada y sus archivos"""
+        terminadas = self.filter(
+            estado__in=[Tarea.Estado.COMPLETADA, Tarea.Estado.FALLIDA], terminada__lt=antes_de
+        )
+        for tarea in terminadas.exclude(archivo=''):
+            tarea.eliminar_archivo()
+        return terminadas.delete()[0]
+
+
+# Ejecución en segundo plano de una acción de un ViewSet (ver api/tareas.py)
+class Tarea(models.Model):
+    class Estado(models.TextChoices):
+        PENDIENTE = 'pendiente'
+        EN_CURSO = 'en_curso'
+        COMPLETADA = 'completada'
+        FALLIDA = 'fallida'
+
+    id = models.BigAutoField(primary_key=True)
+    # El índice (usuario, id) también cubre las búsquedas por usuario
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='tareas', db_index=False
+    )
+    # Petición original: ViewSet (ruta de importación), acción, método, URL y parámetros
+    vista = models.CharField(max_length=200)
+    accion = models.CharField(max_length=100)
+    metodo = models.CharField(max_length=10, default='GET')
+    ruta = models.CharField(max_length=200)
+    origen = models.CharField(max_length=200)
+    parametros = models.JSONField(default=dict)
+    datos = models.JSONField(null=True, blank=True)
+
+    estado = models.CharField(max_length=10, choices=Estado.choices, default=Estado.PENDIENTE)
+    procesados = models.PositiveBigIntegerField(default=0)
+    total = models.PositiveBigIntegerField(null=True, blank=True)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    trabajador = models.CharField(max_length=100, blank=True)
+    latido = models.DateTimeField(null=True, blank=True)
+
+    # Respuesta de la acción: JSON en resultado o, si es un archivo, su nombre en TAREAS_DIRECTORIO
+    codigo = models.PositiveSmallIntegerField(null=True, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    archivo = models.CharField(max_length=100, blank=True)
+    tipo_contenido = models.CharField(max_length=100, blank=True)
+    disposicion = models.CharField(max_length=200, blank=True)
+    error = models.TextField(blank=True)
+
+    creada = models.DateTimeField(auto_now_add=True)
+    iniciada = models.DateTimeField(null=True, blank=True)
+    terminada = models.DateTimeField(null=True, blank=True)
+
+    objects = TareaQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Cola de pendientes en orden de llegada
+            models.Index(fields=['estado', 'id'], name='tarea_estado_idx'),
+            models.Index(fields=['usuario', '-id'], name='tarea_usuario_idx'),
+        ]
+
+    def __str__(self):
+        return f"Tarea {self.pk} {self.accion} ({self.estado})"
+
+    @property
+    def progreso(self):
+        """Porcentaje de avance, si se conoce el total"""
+        if self.estado == Tarea.Estado.COMPLETADA:
+            return 100
+        if not self.total:
+            return None
+        return min(100, self.procesados * 100 // self.total)
+
+    @property
+    def ruta_archivo(self):
+        return Path(settings.TAREAS_DIRECTORIO) / self.archivo
+
+    def eliminar_archivo(self):
+        if self.archivo:
+            self.ruta_archivo.unlink(missing_ok=True)
@@ -0,0 +1,70 @@
+from rest_framework.pagination import CursorPagination
+
+
+# Paginación por cursor para colecciones ordenadas por fecha que solo crecen.
+# No ejecuta COUNT(*) ni OFFSET, por lo que cualquier página cuesta lo mismo.
+class FechaCursorPagination(CursorPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Variante async de paginate_queryset para async_views.py: la misma consulta,
+        el mismo cursor y los mismos enlaces next/previous, pero la página se lee
+        con el ORM async. request es un Request de DRF.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, posicion = self.cursor or (0, False, None)
+
+        if reverse:
+            queryset = queryset.order_by(*[
+                campo[1:] if campo.startswith('-') else f'-{campo}' for campo in self.ordering
+            ])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if posicion is not None:
+            campo = self.ordering[0]
+            operador = 'lt' if reverse != campo.startswith('-') else 'gt'
+            queryset = queryset.filter(**{f"{campo.lstrip('-')}__{operador}": posicion})
+
+        resultados = [objeto async for objeto in queryset[offset:offset + self.page_size + 1]]
+        self.page = resultados[:self.page_size]
+        siguiente = None
+        if len(resultados) > len(self.page):
+            siguiente = self._get_position_from_instance(resultados[-1], self.ordering)
+
+        # Igual que CursorPagination.paginate_queryset a partir de aquí
+        if reverse:
+            self.page.reverse()
+            self.has_next = posicion is not None or offset > 0
+            self.has_previous = siguiente is not None
+            self.next_position, self.previous_position = posicion, siguiente
+        else:
+            self.has_next = siguiente is not None
+            self.has_previous = posicion is not None or offset > 0
+            self.next_position, self.previous_position = siguiente, posicion
+        return self.page
+
+    def datos_paginados(self, data):
+        """El cuerpo de get_paginated_response, para respuestas fuera de DRF"""
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+
+class VentaCursorPagination(FechaCursorPagination):
+    ordering = ('-fecha_venta', '-id')
+
+
+class MermaCursorPagination(FechaCursorPagination):
+    ordering = ('-fecha_merma', '-id')
+
+
+class MovimientoCursorPagination(FechaCursorPagination):
+    ordering = ('-fecha', '-id')
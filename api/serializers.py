@@ -1,6 +1,19 @@
+from decimal import Decimal
+
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from django.contrib.auth.models import User
-from .models import Insumo, Receta, Venta, Merma, RecetaInsumo
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from .models import (
+    ConsumoTeoricoDiario, Insumo, LineaVenta, MovimientoStock, Receta, Venta, Merma, RecetaInsumo, Tarea,
+    repartir_total
+)
+from .busqueda import INDICES
+from .cache import invalidar
+from .campos import CamposDinamicosMixin
+from .signals import recalculo_diferido, recalcular_costos, registrar_escritura
 
 
 # Serializador para el modelo de Usuario
@@ -25,7 +38,7 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
 
 
 # Serializador para el modelo de Insumo
-class InsumoSerializer(serializers.HyperlinkedModelSerializer):
+class InsumoSerializer(CamposDinamicosMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Insumo
         fields = ['url', 'id', 'nombre', 'cantidad', 'unidad', 'precio_unitario', 'fecha_creacion']
@@ -48,6 +61,197 @@ class InsumoSerializer(serializers.HyperlinkedModelSerializer):
             raise serializers.ValidationError("El precio no puede ser negativo")
         return value
 
+    # El stock inicial y cada edición de la cantidad quedan como ajustes en el registro de movimientos
+    @transaction.atomic
+    def create(self, validated_data):
+        insumo = super().create(validated_data)
+        MovimientoStock.objects.registrar(MovimientoStock.Tipo.AJUSTE, {insumo.pk: insumo.cantidad})
+        return insumo
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        if 'cantidad' not in validated_data:
+            return super().update(instance, validated_data)
+        # Se compara con el valor vigente en la base, no con el leído al cargar la instancia
+        anterior = Insumo.objects.select_for_update().values_list('cantidad', flat=True).get(pk=instance.pk)
+        insumo = super().update(instance, validated_data)
+        MovimientoStock.objects.registrar(MovimientoStock.Tipo.AJUSTE, {insumo.pk: insumo.cantidad - anterior})
+        return insumo
+
+class MovimientoStockSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MovimientoStock
+        fields = ['id', 'tipo', 'cantidad', 'fecha', 'venta']
+
+# Entrada de stock por una compra al proveedor
+class CompraInsumoSerializer(serializers.Serializer):
+    cantidad = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+    def validate_cantidad(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("La cantidad comprada debe ser mayor a 0")
+        return value
+
+# Fila de una lista de precios de proveedor, identificada por id o por nombre
+class ImportacionInsumoSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False)
+    nombre = serializers.CharField(max_length=100, required=False)
+    cantidad = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    unidad = serializers.CharField(max_length=50, required=False)
+    precio_unitario = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+    # Mismas reglas que al crear o editar un insumo
+    validate_cantidad = InsumoSerializer.validate_cantidad
+    validate_precio_unitario = InsumoSerializer.validate_precio_unitario
+
+    def validate(self, data):
+        if 'id' not in data and 'nombre' not in data:
+            raise serializers.ValidationError("Cada fila necesita id o nombre")
+        return data
+
+# Serializador para importar una lista de precios completa en una sola transacción
+class ImportacionInsumosSerializer(serializers.Serializer):
+    CAMPOS = ['nombre', 'cantidad', 'unidad', 'precio_unitario']
+
+    # Cada fila se valida en validate_insumos, para reportar los errores de todas a la vez
+    insumos = serializers.ListField(allow_empty=False)
+    registrar_historial = serializers.BooleanField(default=False)
+
+    def validate_insumos(self, filas):
+        """
+        Valida todas las filas y las resuelve contra los insumos existentes con dos
+        consultas, antes de aplicar cambios
+        """
+        fila_serializer = ImportacionInsumoSerializer()
+        validadas = []
+        errores = []
+        for fila in filas:
+            try:
+                validadas.append(fila_serializer.run_validation(fila))
+                errores.append({})
+            except serializers.ValidationError as e:
+                validadas.append(None)
+                errores.append(e.detail)
+
+        por_id = Insumo.objects.in_bulk({fila['id'] for fila in validadas if fila and 'id' in fila})
+        por_nombre = {}
+        nombres = {fila['nombre'] for fila in validadas if fila and 'id' not in fila}
+        for insumo in Insumo.objects.filter(nombre__in=nombres):
+            por_nombre.setdefault(insumo.nombre, []).append(insumo)
+
+        vistos = set()
+        for fila, error in zip(validadas, errores):
+            if fila is None:
+                continue
+            insumo = None
+            if 'id' in fila:
+                insumo = por_id.get(fila['id'])
+                if insumo is None:
+                    error['id'] = [f"No existe el insumo {fila['id']}"]
+            else:
+                candidatos = por_nombre.get(fila['nombre'], [])
+                if len(candidatos) > 1:
+                    error['nombre'] = ["Hay varios insumos con este nombre, indique el id"]
+                elif candidatos:
+                    insumo = candidatos[0]
+                else:
+                    # Insumo nuevo: necesita todos los campos
+                    for campo in self.CAMPOS:
+                        if campo not in fila:
+                            error[campo] = ["Este campo es requerido para crear un insumo"]
+
+            clave = insumo.pk if insumo is not None else fila.get('nombre')
+            if clave in vistos:
+                error.setdefault('non_field_errors', []).append("El insumo aparece más de una vez en la lista")
+            vistos.add(clave)
+
+            fila['insumo'] = insumo
+
+        if any(errores):
+            raise serializers.ValidationError(errores)
+        return validadas
+
+    @property
+    def errores_por_fila(self):
+        """Errores de validación con el número de fila (desde 1) de cada fila inválida"""
+        errores = dict(self.errors)
+        filas = errores.pop('insumos', None)
+        if filas and all(isinstance(error, dict) for error in filas):
+            errores['filas'] = [
+                {'fila': numero, 'errores': error}
+                for numero, error in enumerate(filas, start=1) if error
+            ]
+        elif filas is not None:
+            errores['insumos'] = filas
+        return errores
+
+    @transaction.atomic
+    def create(self, validated_data):
+        """
+        Inserta y actualiza los insumos con INSERT ... ON CONFLICT por lotes, propaga
+        los precios nuevos a las recetas y devuelve el reporte por fila
+        """
+        guardar = []
+        filas = []
+        precios_cambiados = []
+        # Las líneas de receta muestran nombre y unidad del insumo
+        renombrados = False
+        # Stock vigente de los insumos existentes, para registrar los ajustes de cantidad
+        stock_anterior = dict(Insumo.objects.select_for_update().filter(
+            pk__in=[fila['insumo'].pk for fila in validated_data['insumos'] if fila['insumo'] is not None]
+        ).values_list('id', 'cantidad'))
+        for fila in validated_data['insumos']:
+            insumo = fila['insumo']
+            if insumo is None:
+                insumo = Insumo(**{campo: fila[campo] for campo in self.CAMPOS})
+                accion = 'creado'
+            else:
+                # El UPDATE escribe todos los CAMPOS: no se sobrescribe el stock con el valor leído al validar
+                insumo.cantidad = stock_anterior.get(insumo.pk, insumo.cantidad)
+                cambios = [
+                    campo for campo in self.CAMPOS
+                    if campo in fila and getattr(insumo, campo) != fila[campo]
+                ]
+                for campo in cambios:
+                    setattr(insumo, campo, fila[campo])
+                if 'precio_unitario' in cambios:
+                    precios_cambiados.append(insumo.pk)
+                if {'nombre', 'unidad'} & set(cambios):
+                    renombrados = True
+                accion = 'actualizado' if cambios else 'sin_cambios'
+            if accion != 'sin_cambios':
+                guardar.append(insumo)
+            filas.append((insumo, accion))
+
+        # Los insumos existentes chocan por id y solo se actualizan sus CAMPOS
+        Insumo.objects.bulk_create(
+            guardar, batch_size=1000,
+            update_conflicts=True, unique_fields=['id'], update_fields=self.CAMPOS
+        )
+        if guardar:
+            registrar_escritura(*([Insumo, RecetaInsumo] if renombrados else [Insumo]))
+            # bulk_create no emite señales: se reindexa el nombre de los insumos guardados
+            INDICES[Insumo].indexar([insumo.pk for insumo in guardar])
+        MovimientoStock.objects.registrar(MovimientoStock.Tipo.AJUSTE, {
+            insumo.pk: insumo.cantidad - stock_anterior.get(insumo.pk, 0) for insumo in guardar
+        })
+        lineas, historial = RecetaInsumo.objects.filter(insumo_id__in=precios_cambiados).actualizar_precios(
+            registrar_historial=validated_data['registrar_historial']
+        )
+
+        acciones = [accion for _, accion in filas]
+        return {
+            'creados': acciones.count('creado'),
+            'actualizados': acciones.count('actualizado'),
+            'sin_cambios': acciones.count('sin_cambios'),
+            'lineas_receta_actualizadas': lineas,
+            'historial': historial,
+            'filas': [
+                {'fila': numero, 'id': insumo.pk, 'nombre': insumo.nombre, 'accion': accion}
+                for numero, (insumo, accion) in enumerate(filas, start=1)
+            ],
+        }
+
 class RecetaInsumoSerializer(serializers.HyperlinkedModelSerializer):
     insumo_url = serializers.HyperlinkedRelatedField(
         view_name='insumo-detail',
@@ -78,10 +282,15 @@ class RecetaInsumoCreateSerializer(serializers.ModelSerializer):
         model = RecetaInsumo
         fields = ['insumo', 'cantidad']
 
-class RecetaSerializer(serializers.HyperlinkedModelSerializer):
+class RecetaSerializer(CamposDinamicosMixin, serializers.HyperlinkedModelSerializer):
     insumos_detalle = RecetaInsumoSerializer(source='recetainsumo_set', many=True, read_only=True)
     insumos = RecetaInsumoCreateSerializer(many=True, write_only=True, required=False)
-    costo_total = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    costo_total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    # Las líneas de la receta con su insumo se cargan en una sola consulta extra
+    prefetch_por_campo = {
+        'insumos_detalle': Prefetch('recetainsumo_set', queryset=RecetaInsumo.objects.select_related('insumo'))
+    }
 
     class Meta:
         model = Receta
@@ -92,19 +301,14 @@ class RecetaSerializer(serializers.HyperlinkedModelSerializer):
             'url': {'view_name': 'receta-detail'}
         }
 
+    @transaction.atomic
     def create(self, validated_data):
         insumos_data = validated_data.pop('insumos', [])
         receta = Receta.objects.create(**validated_data)
-        
-        for insumo_data in insumos_data:
-            RecetaInsumo.objects.create(
-                receta=receta,
-                insumo_id=insumo_data['insumo'],
-                cantidad=insumo_data['cantidad']
-            )
-        
+        self._guardar_insumos(receta, insumos_data, nueva=True)
         return receta
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         insumos_data = validated_data.pop('insumos', [])
         
@@ -115,92 +319,286 @@ class RecetaSerializer(serializers.HyperlinkedModelSerializer):
         
         # Actualizar insumos si se proporcionaron
         if insumos_data:
-            # Eliminar relaciones existentes
-            instance.recetainsumo_set.all().delete()
-            
-            # Crear nuevas relaciones
-            for insumo_data in insumos_data:
-                RecetaInsumo.objects.create(
-                    receta=instance,
-                    insumo_id=insumo_data['insumo'],
-                    cantidad=insumo_data['cantidad']
-                )
+            self._guardar_insumos(instance, insumos_data)
         
         return instance
 
+    def _normalizar_insumos(self, insumos_data):
+        """Convierte la lista de insumos recibida en un diccionario {insumo_id: cantidad}"""
+        campo_cantidad = serializers.DecimalField(max_digits=10, decimal_places=2)
+        lineas = {}
+        for insumo_data in insumos_data:
+            try:
+                insumo_id = int(getattr(insumo_data['insumo'], 'pk', insumo_data['insumo']))
+                cantidad = campo_cantidad.run_validation(insumo_data['cantidad'])
+            except (KeyError, TypeError, ValueError, serializers.ValidationError):
+                raise serializers.ValidationError({
+                    'insumos': 'Cada insumo debe incluir un id de insumo y una cantidad válidos'
+                })
+            if insumo_id in lineas:
+                raise serializers.ValidationError({
+                    'insumos': f'El insumo {insumo_id} está repetido en la receta'
+                })
+            lineas[insumo_id] = cantidad
+        return lineas
+
+    def _guardar_insumos(self, receta, insumos_data, nueva=False):
+        """
+        Sincroniza las líneas de la receta con un número constante de consultas:
+        una lectura de precios, inserciones/actualizaciones en bloque y un solo
+        recálculo del costo total
+        """
+        lineas = self._normalizar_insumos(insumos_data)
+
+        # Traemos todos los precios en una sola consulta
+        precios = dict(
+            Insumo.objects.filter(id__in=lineas).values_list('id', 'precio_unitario')
+        )
+        insumos_no_existentes = set(lineas) - set(precios)
+        if insumos_no_existentes:
+            raise serializers.ValidationError({
+                'insumos': f'Los siguientes insumos no existen: {insumos_no_existentes}'
+            })
+
+        existentes = {} if nueva else {
+            linea.insumo_id: linea for linea in receta.recetainsumo_set.all()
+        }
+
+        nuevas = []
+        modificadas = []
+        for insumo_id, cantidad in lineas.items():
+            linea = existentes.get(insumo_id)
+            if linea is None:
+                nuevas.append(RecetaInsumo(
+                    receta=receta,
+                    insumo_id=insumo_id,
+                    cantidad=cantidad,
+                    precio_unitario=precios[insumo_id]
+                ))
+            elif linea.cantidad != cantidad or linea.precio_unitario != precios[insumo_id]:
+                linea.cantidad = cantidad
+                linea.precio_unitario = precios[insumo_id]
+                modificadas.append(linea)
+
+        with recalculo_diferido():
+            eliminadas = set(existentes) - set(lineas)
+            if eliminadas:
+                receta.recetainsumo_set.filter(insumo_id__in=eliminadas).delete()
+            if modificadas:
+                RecetaInsumo.objects.bulk_update(modificadas, ['cantidad', 'precio_unitario'])
+            if nuevas:
+                RecetaInsumo.objects.bulk_create(nuevas)
+            if modificadas or nuevas:
+                registrar_escritura(RecetaInsumo)
+            # bulk_create y bulk_update no emiten señales, recalculamos una sola vez
+            recalcular_costos(receta.pk)
+
+        receta.refresh_from_db(fields=['costo_total'])
+        # Recargamos las líneas con su insumo para la respuesta
+        getattr(receta, '_prefetched_objects_cache', {}).pop('recetainsumo_set', None)
+        prefetch_related_objects(
+            [receta],
+            Prefetch('recetainsumo_set', queryset=RecetaInsumo.objects.select_related('insumo'))
+        )
+
+class LoteProduccionSerializer(serializers.Serializer):
+    receta = serializers.IntegerField()
+    lotes = serializers.IntegerField(min_value=1)
+
+class PlanProduccionSerializer(serializers.Serializer):
+    recetas = LoteProduccionSerializer(many=True, allow_empty=False)
+
+    def validate_recetas(self, value):
+        # Sumamos los lotes si una receta aparece más de una vez
+        lotes = {}
+        for item in value:
+            lotes[item['receta']] = lotes.get(item['receta'], 0) + item['lotes']
+
+        # Verificar que todas las recetas existan
+        recetas_existentes = Receta.objects.filter(id__in=lotes).values_list('id', flat=True)
+        recetas_no_existentes = set(lotes) - set(recetas_existentes)
+
+        if recetas_no_existentes:
+            raise serializers.ValidationError(
+                f"Las siguientes recetas no existen: {recetas_no_existentes}"
+            )
+        return lotes
+
+class ActualizarPreciosSerializer(serializers.Serializer):
+    insumos = serializers.ListField(child=serializers.IntegerField(), required=False)
+    registrar_historial = serializers.BooleanField(default=False)
+
 class RecetaSimpleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Receta
         fields = ['id', 'nombre']
 
-class VentaSerializer(serializers.HyperlinkedModelSerializer):
+class LineaVentaSerializer(serializers.ModelSerializer):
+    receta = serializers.IntegerField(source='receta_id')
+    receta_nombre = serializers.CharField(source='receta.nombre', read_only=True)
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = LineaVenta
+        fields = ['receta', 'receta_nombre', 'cantidad', 'precio_unitario', 'subtotal']
+
+    def validate_cantidad(self, value):
+        if value < 1:
+            raise serializers.ValidationError("La cantidad debe ser al menos 1")
+        return value
+
+    def validate_precio_unitario(self, value):
+        if value < 0:
+            raise serializers.ValidationError("El precio unitario no puede ser negativo")
+        return value
+
+class VentaSerializer(CamposDinamicosMixin, serializers.HyperlinkedModelSerializer):
     recetas = RecetaSimpleSerializer(source='receta', many=True, read_only=True)
+    lineas = LineaVentaSerializer(many=True, required=False)
+    # Forma anterior: lista de ids, una unidad de cada receta y el total repartido en partes iguales
     receta = serializers.ListField(
         child=serializers.IntegerField(),
         write_only=True,
-        required=True
+        required=False
     )
 
+    prefetch_por_campo = {
+        'recetas': Prefetch('receta', queryset=Receta.objects.only('id', 'nombre')),
+        'lineas': Prefetch('lineas', queryset=LineaVenta.objects.select_related('receta').order_by('id'))
+    }
+
     class Meta:
         model = Venta
-        fields = ['url', 'id', 'recetas', 'receta', 'fecha_venta', 'total', 'completada']
+        fields = ['url', 'id', 'recetas', 'lineas', 'receta', 'fecha_venta', 'total', 'completada']
         read_only_fields = ['fecha_venta']
         extra_kwargs = {
-            'url': {'view_name': 'venta-detail'}
+            'url': {'view_name': 'venta-detail'},
+            # Con lineas el total se calcula a partir de ellas
+            'total': {'required': False}
         }
 
-    def validate_receta(self, value):
-        from .models import Receta
-        if not value:
-            raise serializers.ValidationError("Debes proporcionar al menos una receta")
-        
-        # Verificar que todas las recetas existan
-        recetas_existentes = Receta.objects.filter(id__in=value).values_list('id', flat=True)
-        recetas_no_existentes = set(value) - set(recetas_existentes)
-        
-        if recetas_no_existentes:
-            raise serializers.ValidationError(
-                f"Las siguientes recetas no existen: {recetas_no_existentes}"
-            )
-        return value
-
     def validate_total(self, value):
         if value < 0:
             raise serializers.ValidationError("El total no puede ser negativo")
         return value
 
+    def validate(self, data):
+        receta_ids = data.pop('receta', None)
+        lineas = data.get('lineas')
+        completada = self.instance is not None and self.instance.completada
+        if completada and data.get('completada') is False:
+            raise serializers.ValidationError({'completada': "Una venta completada no puede volver a pendiente"})
+        if receta_ids is not None and lineas is not None:
+            raise serializers.ValidationError("Envía receta o lineas, no ambas")
+        if receta_ids is None and lineas is None:
+            if not self.partial and self.instance is None:
+                raise serializers.ValidationError({'lineas': "Debes proporcionar al menos una receta"})
+            return data
+
+        if receta_ids is not None:
+            campo = 'receta'
+            receta_ids = list(dict.fromkeys(receta_ids))
+            if 'total' not in data:
+                if self.instance is None:
+                    raise serializers.ValidationError({'total': "El total es obligatorio al enviar receta"})
+                # Al actualizar sin total se reparte el total vigente, como antes de las líneas
+                data['total'] = self.instance.total
+            lineas = [
+                {'receta_id': receta_id, 'cantidad': 1, 'precio_unitario': precio}
+                for receta_id, precio in zip(receta_ids, repartir_total(data['total'], len(receta_ids)))
+            ]
+        else:
+            campo = 'lineas'
+            receta_ids = [linea['receta_id'] for linea in lineas]
+            repetidas = {receta_id for receta_id in receta_ids if receta_ids.count(receta_id) > 1}
+            if repetidas:
+                raise serializers.ValidationError(
+                    {campo: f"Recetas repetidas, indica la cantidad en una sola línea: {sorted(repetidas)}"}
+                )
+
+        if not lineas:
+            raise serializers.ValidationError({campo: "Debes proporcionar al menos una receta"})
+
+        # Verificar que todas las recetas existan con una sola consulta
+        recetas_no_existentes = set(receta_ids) - set(
+            Receta.objects.filter(id__in=receta_ids).values_list('id', flat=True)
+        )
+        if recetas_no_existentes:
+            raise serializers.ValidationError(
+                {campo: f"Las siguientes recetas no existen: {sorted(recetas_no_existentes)}"}
+            )
+
+        total = sum((linea['cantidad'] * linea['precio_unitario'] for linea in lineas), Decimal('0'))
+        if 'total' in data and data['total'] != total:
+            raise serializers.ValidationError(
+                {'total': f"El total no coincide con la suma de las líneas ({total})"}
+            )
+        data['total'] = total
+        if completada:
+            # El stock ya se descontó con las líneas actuales: solo se aceptan sin cambios
+            actuales = set(self.instance.lineas.values_list('receta_id', 'cantidad', 'precio_unitario'))
+            if {(linea['receta_id'], linea['cantidad'], linea['precio_unitario']) for linea in lineas} != actuales:
+                raise serializers.ValidationError({campo: "No se pueden cambiar las líneas de una venta completada"})
+            data.pop('lineas', None)
+            return data
+        data['lineas'] = lineas
+        return data
+
+    @transaction.atomic
     def create(self, validated_data):
-        from .models import Receta
-        receta_ids = validated_data.pop('receta', [])
-        
-        # Crear la venta
+        lineas = validated_data.pop('lineas')
+        completada = validated_data.pop('completada', False)
+
+        # Crear la venta y sus líneas
         venta = Venta.objects.create(**validated_data)
-        
-        # Obtener las recetas y establecer la relación
-        recetas = Receta.objects.filter(id__in=receta_ids)
-        venta.receta.add(*recetas)
-        
+        self._guardar_lineas(venta, lineas)
+
+        # Descontar el stock si la venta se registra ya completada
+        if completada:
+            self._completar(venta)
+
         return venta
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        from .models import Receta
-        receta_ids = validated_data.pop('receta', None)
-        
+        lineas = validated_data.pop('lineas', None)
+
+        # La transición a completada se hace al final para descontar el stock
+        completar = validated_data.get('completada') and not instance.completada
+        if completar:
+            validated_data.pop('completada')
+
         # Actualizar campos básicos
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
-        
-        # Actualizar recetas si se proporcionaron
-        if receta_ids is not None:
-            recetas = Receta.objects.filter(id__in=receta_ids)
-            instance.receta.clear()  # Limpiar relaciones existentes
-            instance.receta.add(*recetas)  # Agregar nuevas relaciones
-        
+
+        # Reemplazar las líneas si se proporcionaron
+        if lineas is not None:
+            instance.lineas.all().delete()
+            self._guardar_lineas(instance, lineas)
+
+        if completar:
+            self._completar(instance)
+
         return instance
 
+    def _guardar_lineas(self, venta, lineas):
+        LineaVenta.objects.bulk_create([LineaVenta(venta=venta, **linea) for linea in lineas])
+        # bulk_create no emite señales; las ventas pendientes no suman consumo
+        if venta.completada:
+            ConsumoTeoricoDiario.objects.recalcular([venta.fecha_venta])
+        # Evita servir en la respuesta las relaciones precargadas antes del cambio
+        getattr(venta, '_prefetched_objects_cache', {}).clear()
+
+    def _completar(self, venta):
+        try:
+            venta.completar()
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.message_dict)
+
 # Serializador para el modelo de Merma
-class MermaSerializer(serializers.HyperlinkedModelSerializer):
+class MermaSerializer(CamposDinamicosMixin, serializers.HyperlinkedModelSerializer):
     insumo_url = serializers.HyperlinkedRelatedField(
         view_name='insumo-detail',
         read_only=True,
@@ -208,6 +606,10 @@ class MermaSerializer(serializers.HyperlinkedModelSerializer):
     )
     insumo_nombre = serializers.CharField(source='insumo.nombre', read_only=True)
 
+    # insumo e insumo_url solo necesitan insumo_id, el JOIN es para el nombre
+    select_related_por_campo = {'insumo_nombre': 'insumo'}
+    columnas_fijas = ('fecha_merma',)
+
     class Meta:
         model = Merma
         fields = ['url', 'id', 'insumo', 'insumo_url', 'insumo_nombre', 'cantidad', 'fecha_merma']
@@ -217,14 +619,11 @@ class MermaSerializer(serializers.HyperlinkedModelSerializer):
         }
 
     # Validacion al Crear una Merma y Actualizar la Cantidad de Insumo
+    @transaction.atomic
     def create(self, validated_data):
         # Verificar si el insumo existe
         if 'insumo' not in validated_data:
             raise serializers.ValidationError("El insumo es requerido")
-        try:
-            insumo_instance = Insumo.objects.get(id=validated_data['insumo'].id)
-        except Insumo.DoesNotExist:
-            raise serializers.ValidationError("El insumo no existe")
         
         # Verificar si la cantidad de merma es válida
         cantidad_merma = validated_data['cantidad']
@@ -232,18 +631,83 @@ class MermaSerializer(serializers.HyperlinkedModelSerializer):
         if cantidad_merma <= 0:
             raise serializers.ValidationError("La cantidad de merma debe ser mayor a 0")
         
-        # Sumar la cantidad de merma a la cantidad del insumo
-        insumo_instance.cantidad += cantidad_merma
-        insumo_instance.save()
+        # Descontar la cantidad de merma del stock del insumo en la base de datos
+        try:
+            Insumo.objects.ajustar_cantidades(
+                {validated_data['insumo'].id: -cantidad_merma}, MovimientoStock.Tipo.MERMA
+            )
+        except DjangoValidationError:
+            raise serializers.ValidationError("El insumo no existe")
 
         # Crear la instancia de Merma
         return super().create(validated_data)
 
+    def validate_cantidad(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("La cantidad de merma debe ser mayor a 0")
+        return value
 
+class MermaLoteItemSerializer(serializers.Serializer):
+    insumo = serializers.IntegerField()
+    cantidad = serializers.DecimalField(max_digits=10, decimal_places=2)
 
     def validate_cantidad(self, value):
         if value <= 0:
             raise serializers.ValidationError("La cantidad de merma debe ser mayor a 0")
         return value
-    
-    
\ No newline at end of file
+
+# Serializador para registrar muchas mermas en una sola petición
+class MermaLoteSerializer(serializers.Serializer):
+    mermas = MermaLoteItemSerializer(many=True, allow_empty=False)
+
+    def validate_mermas(self, value):
+        # Verificar que todos los insumos existan con una sola consulta
+        insumo_ids = {item['insumo'] for item in value}
+        insumos_existentes = Insumo.objects.filter(id__in=insumo_ids).values_list('id', flat=True)
+        insumos_no_existentes = insumo_ids - set(insumos_existentes)
+
+        if insumos_no_existentes:
+            raise serializers.ValidationError(
+                f"Los siguientes insumos no existen: {insumos_no_existentes}"
+            )
+        return value
+
+    @transaction.atomic
+    def create(self, validated_data):
+        mermas = [
+            Merma(insumo_id=item['insumo'], cantidad=item['cantidad'])
+            for item in validated_data['mermas']
+        ]
+
+        # Agrupamos los cambios de stock por insumo
+        cambios = {}
+        for merma in mermas:
+            cambios[merma.insumo_id] = cambios.get(merma.insumo_id, 0) - merma.cantidad
+
+        try:
+            Insumo.objects.ajustar_cantidades(cambios, MovimientoStock.Tipo.MERMA)
+        except DjangoValidationError as e:
+            # Un insumo eliminado después de validar el lote
+            raise serializers.ValidationError(e.message_dict)
+        invalidar(Merma)
+        return Merma.objects.bulk_create(mermas)
+
+
+# Estado de una tarea en segundo plano; la respuesta de la acción se descarga aparte
+class TareaSerializer(serializers.ModelSerializer):
+    url = serializers.HyperlinkedIdentityField(view_name='tarea-detail')
+    progreso = serializers.IntegerField(read_only=True)
+    resultado_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Tarea
+        fields = [
+            'url', 'id', 'metodo', 'ruta', 'parametros', 'estado', 'progreso', 'procesados', 'total',
+            'intentos', 'error', 'creada', 'iniciada', 'terminada', 'resultado_url'
+        ]
+        read_only_fields = fields
+
+    def get_resultado_url(self, obj):
+        if obj.terminada is None:
+            return None
+        return reverse('tarea-resultado', args=[obj.pk], request=self.context.get('request'))
@@ -0,0 +1,176 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import tokens
+from .busqueda import INDICES
+from .cache import invalidar
+from .models import (
+    ConsumoTeoricoDiario, Insumo, Merma, Receta, RecetaInsumo, ResumenVentaDiario, Venta,
+    VersionColeccion
+)
+
+_estado = threading.local()
+
+
+@contextmanager
+def recalculo_diferido():
+    """
+    Agrupa hasta el final del bloque los recálculos de costo_total y las
+    invalidaciones y versiones de colección que disparan las señales de cada fila,
+    útil para escrituras masivas de RecetaInsumo: al salir se hace una sola vez
+    por receta y por modelo
+    """
+    if getattr(_estado, 'recetas', None) is not None:
+        # Ya estamos dentro de un bloque diferido
+        yield
+        return
+
+    _estado.recetas, _estado.invalidados, _estado.versionados = set(), set(), set()
+    try:
+        yield
+        recetas, invalidados, versionados = _estado.recetas, _estado.invalidados, _estado.versionados
+    finally:
+        _estado.recetas = _estado.invalidados = _estado.versionados = None
+    if recetas:
+        Receta.objects.filter(pk__in=recetas).recalcular_costo_total()
+    if invalidados:
+        invalidar(*invalidados)
+    if versionados:
+        VersionColeccion.objects.incrementar(*versionados)
+
+
+def recalcular_costos(*receta_ids):
+    ids = {receta_id for receta_id in receta_ids if receta_id is not None}
+    if not ids:
+        return
+    pendientes = getattr(_estado, 'recetas', None)
+    if pendientes is not None:
+        pendientes.update(ids)
+    else:
+        Receta.objects.filter(pk__in=ids).recalcular_costo_total()
+
+
+def registrar_escritura(*modelos, versionar=True):
+    """
+    Invalida los agregados de los modelos y, con versionar, incrementa la versión
+    de sus colecciones; dentro de recalculo_diferido se hace al salir del bloque
+    """
+    invalidados = getattr(_estado, 'invalidados', None)
+    if invalidados is not None:
+        invalidados.update(modelos)
+        if versionar:
+            _estado.versionados.update(modelos)
+        return
+    invalidar(*modelos)
+    if versionar:
+        VersionColeccion.objects.incrementar(*modelos)
+
+
+# Mantener Receta.costo_total al día cuando cambian sus insumos
+@receiver(post_save, sender=RecetaInsumo)
+def recetainsumo_guardado(sender, instance, **kwargs):
+    recalcular_costos(instance.receta_id, getattr(instance, '_receta_id_original', None))
+    instance._receta_id_original = instance.receta_id
+
+
+@receiver(post_delete, sender=RecetaInsumo)
+def recetainsumo_eliminado(sender, instance, origin=None, **kwargs):
+    # Si se está eliminando la receta completa no hay costo que recalcular
+    if isinstance(origin, Receta) or (isinstance(origin, QuerySet) and origin.model is Receta):
+        return
+    recalcular_costos(instance.receta_id)
+
+
+# Mantener el resumen diario de ventas y el consumo teórico del día
+@receiver(pre_save, sender=Venta)
+@receiver(pre_delete, sender=Venta)
+def venta_por_modificar(sender, instance, **kwargs):
+    # Instancias cargadas sin completada o total: se lee lo que aporta hoy al resumen
+    if instance.pk is not None and getattr(instance, '_aporte_original', None) is None:
+        guardada = Venta.objects.only('completada', 'total').filter(pk=instance.pk).first()
+        instance._aporte_original = guardada.aporte_resumen() if guardada else {}
+
+
+@receiver(post_save, sender=Venta)
+def venta_guardada(sender, instance, created, **kwargs):
+    anterior = {} if created else instance._aporte_original
+    aporte = instance.aporte_resumen()
+    ResumenVentaDiario.objects.sumar(
+        instance.fecha_venta, **{campo: valor - anterior.get(campo, 0) for campo, valor in aporte.items()}
+    )
+    instance._aporte_original = aporte
+    # Solo las ventas completadas suman consumo y guardar la venta no cambia sus líneas:
+    # basta recalcular si la venta entra o sale de las completadas
+    if aporte['ventas_completadas'] != anterior.get('ventas_completadas', 0):
+        ConsumoTeoricoDiario.objects.recalcular([instance.fecha_venta])
+
+
+@receiver(post_delete, sender=Venta)
+def venta_eliminada(sender, instance, **kwargs):
+    ResumenVentaDiario.objects.sumar(
+        instance.fecha_venta, **{campo: -valor for campo, valor in instance._aporte_original.items()}
+    )
+    if instance._aporte_original.get('ventas_completadas'):
+        ConsumoTeoricoDiario.objects.recalcular([instance.fecha_venta])
+
+
+# Invalidar los agregados cacheados que dependen de estos modelos y, para los
+# que se sirven con ETag / Last-Modified, incrementar la versión de su colección
+@receiver(post_save, sender=Merma)
+@receiver(post_delete, sender=Merma)
+def merma_modificada(sender, **kwargs):
+    registrar_escritura(sender, versionar=False)
+
+
+@receiver(post_save, sender=Insumo)
+def insumo_guardado(sender, update_fields=None, **kwargs):
+    # Las líneas de receta muestran nombre y unidad del insumo, pero no su stock
+    if update_fields is not None and set(update_fields) <= {'cantidad'}:
+        registrar_escritura(Insumo)
+    else:
+        registrar_escritura(Insumo, RecetaInsumo)
+
+
+@receiver(post_delete, sender=Insumo)
+@receiver(post_save, sender=RecetaInsumo)
+@receiver(post_delete, sender=RecetaInsumo)
+@receiver(post_save, sender=Receta)
+@receiver(post_delete, sender=Receta)
+def coleccion_modificada(sender, **kwargs):
+    registrar_escritura(sender)
+
+
+# Mantener los índices de búsqueda de texto
+@receiver(post_save, sender=Insumo)
+@receiver(post_save, sender=Receta)
+def indexar_busqueda(sender, instance, update_fields=None, using='default', **kwargs):
+    indice = INDICES[sender]
+    # Los guardados que solo tocan otras columnas (stock, costo) no cambian el texto
+    if update_fields is not None and not set(update_fields) & set(indice.campos):
+        return
+    indice.indexar([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Insumo)
+@receiver(post_delete, sender=Receta)
+def desindexar_busqueda(sender, instance, using='default', **kwargs):
+    INDICES[sender].eliminar([instance.pk], using=using)
+
+
+# Invalidar la cache de tokens de autenticación
+@receiver(post_delete, sender=Token)
+def token_eliminado(sender, instance, **kwargs):
+    tokens.eliminar(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def usuario_modificado(sender, instance, **kwargs):
+    # Cubre desactivaciones, cambios de contraseña y cualquier otro cambio del usuario
+    tokens.eliminar_usuario(instance.pk)
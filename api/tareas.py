@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from functools import wraps
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, connection, transaction
+from django.http import QueryDict
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import NotAuthenticated, Throttled
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+# Sin latido durante este tiempo, una tarea en curso se considera abandonada
+SIN_LATIDO = timedelta(minutes=2)
+INTERVALO_LATIDO = 30
+MAX_INTENTOS = 3
+# Como máximo una escritura de progreso por segundo y tarea
+INTERVALO_PROGRESO = 1.0
+
+_actual = threading.local()
+
+
+def en_tarea():
+    """Indica si el hilo está ejecutando una tarea en segundo plano"""
+    return getattr(_actual, 'tarea', None) is not None
+
+
+def progreso(procesados, total=None):
+    """
+    Registra el avance de la tarea que ejecuta el hilo (procesados de total, si se
+    conoce). Fuera de una tarea no hace nada, así las acciones pueden llamarla siempre.
+    """
+    tarea = getattr(_actual, 'tarea', None)
+    if tarea is None:
+        return
+    ahora = time.monotonic()
+    if ahora - _actual.ultimo_progreso < INTERVALO_PROGRESO and (total is None or procesados < total):
+        return
+    _actual.ultimo_progreso = ahora
+    Tarea.objects.filter(pk=tarea.pk).update(procesados=procesados, total=total, latido=timezone.now())
+
+
+def encolar(request, vista, accion):
+    """Crea la tarea que repetirá la petición en segundo plano"""
+    usuario = request.user
+    if not usuario.is_authenticated:
+        raise NotAuthenticated('Las tareas en segundo plano requieren autenticación')
+
+    parametros = {
+        clave: valores for clave, valores in request.query_params.lists() if clave != 'asincrono'
+    }
+    datos = None
+    if request.method != 'GET':
+        datos = request.data.dict() if isinstance(request.data, QueryDict) else request.data
+
+    with transaction.atomic():
+        # Bloquea la fila del usuario hasta crear la tarea: dos peticiones simultáneas
+        # no pueden contar las mismas activas y pasar ambas el límite
+        get_user_model().objects.select_for_update().only('pk').get(pk=usuario.pk)
+        activas = Tarea.objects.filter(
+            usuario=usuario, estado__in=[Tarea.Estado.PENDIENTE, Tarea.Estado.EN_CURSO]
+        ).count()
+        if activas >= settings.TAREAS_MAX_POR_USUARIO:
+            raise Throttled(detail=(
+                f'Ya tiene {activas} tareas pendientes o en curso, espere a que terminen'
+            ))
+        return Tarea.objects.create(
+            usuario=usuario, vista=vista, accion=accion, metodo=request.method, ruta=request.path,
+            origen=request.build_absolute_uri('/'), parametros=parametros, datos=datos
+        )
+
+
+def en_segundo_plano(func):
+    """
+    Decorador para acciones de un ViewSet. Con ?asincrono=1 la petición no se
+    ejecuta: se encola una Tarea y se responde 202 con su estado. Un trabajador de
+    procesar_tareas la ejecuta después con los mismos parámetros y usuario, y la
+    respuesta queda en /api/tareas/{id}/resultado/.
+    """
+    vista = f'{func.__module__}.{func.__qualname__.rsplit(".", 1)[0]}'
+
+    @wraps(func)
+    def envoltura(self, request, *args, **kwargs):
+        if request.query_params.get('asincrono') not in ('1', 'true'):
+            return func(self, request, *args, **kwargs)
+
+        from .serializers import TareaSerializer
+
+        tarea = encolar(request, vista, func.__name__)
+        return Response(
+            TareaSerializer(tarea, context={'request': request}).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': request.build_absolute_uri(reverse('tarea-detail', args=[tarea.pk]))}
+        )
+    return envoltura
+
+
+def _responder(tarea):
+    """
+    Repite la petición original contra la acción del ViewSet, con la misma URL, host
+    y cuerpo, autenticada como el usuario que encoló la tarea. Los permisos se
+    vuelven a comprobar.
+    """
+    # Los mismos argumentos con que el router creó la vista (basename, detail) y los de la URL
+    ruta = resolve(tarea.ruta)
+    vista = import_string(tarea.vista).as_view({tarea.metodo.lower(): tarea.accion}, **ruta.func.initkwargs)
+    origen = urlsplit(tarea.origen)
+    request = APIRequestFactory().generic(
+        tarea.metodo, f'{tarea.ruta}?{urlencode(tarea.parametros, doseq=True)}',
+        json.dumps(tarea.datos) if tarea.datos is not None else '',
+        content_type='application/json', secure=origen.scheme == 'https', HTTP_HOST=origen.netloc
+    )
+    force_authenticate(request, user=tarea.usuario)
+    return vista(request, *ruta.args, **ruta.kwargs)
+
+
+def _guardar_respuesta(tarea, response):
+    tarea.codigo = response.status_code
+    tarea.tipo_contenido = response.get('Content-Type', '')
+    tarea.disposicion = response.get('Content-Disposition', '')
+    if response.streaming:
+        # Las exportaciones se escriben al archivo a medida que se generan
+        directorio = Path(settings.TAREAS_DIRECTORIO)
+        directorio.mkdir(parents=True, exist_ok=True)
+        tarea.archivo = f'tarea-{tarea.pk}'
+        with open(tarea.ruta_archivo, 'wb') as archivo:
+            for bloque in response.streaming_content:
+                archivo.write(bloque)
+    else:
+        response.render()
+        tarea.resultado = json.loads(response.content) if response.content else None
+
+
+def ejecutar(tarea):
+    """Ejecuta una tarea reclamada y guarda su respuesta y su estado final"""
+    _actual.tarea = tarea
+    _actual.ultimo_progreso = time.monotonic()
+    inicio = time.monotonic()
+    try:
+        response = _responder(tarea)
+        _guardar_respuesta(tarea, response)
+        tarea.estado = Tarea.Estado.COMPLETADA if response.status_code < 400 else Tarea.Estado.FALLIDA
+        if tarea.estado == Tarea.Estado.FALLIDA:
+            tarea.error = f'La acción respondió {response.status_code}'
+    except Exception as exc:
+        logger.exception('Error en la tarea %s', tarea.pk)
+        tarea.eliminar_archivo()
+        tarea.archivo = ''
+        tarea.estado = Tarea.Estado.FALLIDA
+        tarea.error = f'{type(exc).__name__}: {exc}'
+    finally:
+        _actual.tarea = None
+
+    tarea.terminada = timezone.now()
+    if tarea.estado == Tarea.Estado.COMPLETADA and tarea.total is None:
+        tarea.procesados = Tarea.objects.values_list('procesados', flat=True).get(pk=tarea.pk)
+    tarea.save(update_fields=[
+        'estado', 'codigo', 'resultado', 'archivo', 'tipo_contenido', 'disposicion', 'error',
+        'terminada', 'procesados'
+    ])
+    logger.info('Tarea %s %s %s en %.1f s', tarea.pk, tarea.ruta, tarea.estado, time.monotonic() - inicio)
+
+
+class Trabajadores:
+    """
+    Grupo de hilos que reclaman y ejecutan tareas pendientes. El número de hilos es
+    el límite de tareas que se ejecutan a la vez en el proceso.
+    """
+
+    def __init__(self, hilos, intervalo=1.0, una_vez=False):
+        self.hilos = hilos
+        self.intervalo = intervalo
+        self.una_vez = una_vez
+        self.nombre = f'{socket.gethostname()}:{os.getpid()}'
+        self.detener = threading.Event()
+        self._hilos = []
+
+    def _trabajar(self, numero):
+        trabajador = f'{self.nombre}:{numero}'
+        try:
+            while not self.detener.is_set():
+                close_old_connections()
+                tarea = Tarea.objects.reclamar(trabajador)
+                if tarea is None:
+                    if self.una_vez:
+                        return
+                    self.detener.wait(self.intervalo)
+                    continue
+                ejecutar(tarea)
+        finally:
+            connection.close()
+
+    def iniciar(self):
+        for numero in range(self.hilos):
+            hilo = threading.Thread(target=self._trabajar, args=(numero,), name=f'tarea-{numero}', daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def vivos(self):
+        return any(hilo.is_alive() for hilo in self._hilos)
+
+    def mantener(self):
+        """Latido de las tareas propias, recuperación de abandonadas y purga de las viejas"""
+        Tarea.objects.latir(f'{self.nombre}:')
+        reencoladas, fallidas = Tarea.objects.recuperar_abandonadas(SIN_LATIDO, MAX_INTENTOS)
+        if reencoladas or fallidas:
+            logger.warning('Tareas abandonadas: %s reencoladas, %s fallidas', reencoladas, fallidas)
+        Tarea.objects.purgar(timezone.now() - timedelta(hours=settings.TAREAS_RETENCION_HORAS))
+
+    def esperar(self):
+        """Mantiene las tareas hasta que terminan los hilos o se pide detenerlos"""
+        try:
+            while self.vivos():
+                self.mantener()
+                for hilo in self._hilos:
+                    hilo.join(INTERVALO_LATIDO / max(1, len(self._hilos)))
+        finally:
+            self.detener.set()
+            for hilo in self._hilos:
+                hilo.join()
+            connection.close()
@@ -1,3 +1,1278 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.core.exceptions import MiddlewareNotUsed, ValidationError as DjangoValidationError
+from django.db import connection, connections
+from django.db.models import Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.serializers import BaseSerializer
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient, APITestCase
+
+from .authentication import CachedTokenAuthentication, _CacheTokens, tokens
+from .cache import ALIAS, estadisticas
+from .instrumentacion import InstrumentacionSQLMiddleware, _data_original
+from .models import (
+    ConsumoTeoricoDiario, HistorialCostoReceta, Insumo, LineaVenta, Merma, MovimientoStock, Receta, RecetaInsumo, ResumenVentaDiario, SaldoStock, Tarea,
+    Venta, VersionColeccion
+)
+from .serializers import RecetaSerializer
+from .signals import recalculo_diferido
+
+
+def crear_insumo(nombre='Harina', cantidad='100', precio='2'):
+    return Insumo.objects.create(
+        nombre=nombre, cantidad=Decimal(cantidad), unidad='kg', precio_unitario=Decimal(precio)
+    )
+
+
+def crear_receta(*lineas, nombre='Pan', categoria='Panadería', descripcion=''):
+    """Crea una receta con una línea por cada (insumo, cantidad)"""
+    receta = Receta.objects.create(nombre=nombre, descripcion=descripcion, porciones=1, categoria=categoria)
+    for insumo, cantidad in lineas:
+        RecetaInsumo.objects.create(receta=receta, insumo=insumo, cantidad=Decimal(cantidad))
+    return receta
+
+
+class ApiTestCase(APITestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('prueba', password='clave')
+        self.client.force_authenticate(self.usuario)
+        # La cache de agregados vive en el proceso y sobrevive al rollback de cada test
+        caches[ALIAS].clear()
+
+
+class CostoTotalTests(ApiTestCase):
+    def test_se_actualiza_al_cambiar_las_lineas(self):
+        harina, azucar = crear_insumo('Harina', precio='2'), crear_insumo('Azúcar', precio='3')
+        receta = crear_receta((harina, '2'))
+        receta.refresh_from_db()
+        self.assertEqual(receta.costo_total, Decimal('4.00'))
+
+        linea = RecetaInsumo.objects.create(receta=receta, insumo=azucar, cantidad=Decimal('1'))
+        receta.refresh_from_db()
+        self.assertEqual(receta.costo_total, Decimal('7.00'))
+
+        linea.cantidad = Decimal('3')
+        linea.save()
+        receta.refresh_from_db()
+        self.assertEqual(receta.costo_total, Decimal('13.00'))
+
+        linea.delete()
+        receta.refresh_from_db()
+        self.assertEqual(receta.costo_total, Decimal('4.00'))
+
+    def test_el_precio_de_la_linea_es_una_copia(self):
+        harina = crear_insumo(precio='2')
+        receta = crear_receta((harina, '2'))
+        harina.precio_unitario = Decimal('5')
+        harina.save()
+
+        receta.refresh_from_db()
+        self.assertEqual(RecetaInsumo.objects.get(receta=receta).precio_unitario, Decimal('2.00'))
+        self.assertEqual(receta.costo_total, Decimal('4.00'))
+
+        response = self.client.post('/api/recetas/actualizar_precios/', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['lineas_actualizadas'], 1)
+        receta.refresh_from_db()
+        self.assertEqual(receta.costo_total, Decimal('10.00'))
+
+    def reemplazar_lineas(self, n, consultas):
+        """PUT que cambia, elimina y agrega líneas de una receta de n líneas dentro de consultas"""
+        anteriores = [crear_insumo(f'Anterior {i}') for i in range(n)]
+        nuevos = [crear_insumo(f'Nuevo {i}') for i in range(n)]
+        receta = crear_receta(*[(insumo, '1') for insumo in anteriores], nombre=f'Receta {n}')
+        # La mitad de las líneas cambia de cantidad, el resto se reemplaza por insumos nuevos
+        lineas = [{'insumo': insumo.pk, 'cantidad': '2'} for insumo in anteriores[:n // 2]]
+        lineas += [{'insumo': insumo.pk, 'cantidad': '1'} for insumo in nuevos[n // 2:]]
+        with consultas:
+            response = self.client.put(f'/api/recetas/{receta.pk}/', {
+                'nombre': receta.nombre, 'descripcion': 'Masa', 'porciones': 1,
+                'categoria': receta.categoria, 'insumos': lineas
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['insumos_detalle']), n)
+        receta.refresh_from_db()
+        self.assertEqual(receta.costo_total, Decimal(4 * (n // 2) + 2 * (n - n // 2)))
+
+    def test_reemplazar_lineas_con_consultas_constantes(self):
+        consultas = CaptureQueriesContext(connection)
+        self.reemplazar_lineas(5, consultas)
+        self.reemplazar_lineas(40, self.assertNumQueries(len(consultas)))
+
+
+class PlanificarProduccionTests(ApiTestCase):
+    URL = '/api/recetas/planificar_produccion/'
+
+    def setUp(self):
+        super().setUp()
+        self.harina = crear_insumo('Harina', cantidad='10')
+        self.azucar = crear_insumo('Azúcar', cantidad='3')
+        self.pan = crear_receta((self.harina, '2'), (self.azucar, '1'), nombre='Pan')
+        self.torta = crear_receta((self.harina, '3'), nombre='Torta')
+
+    def planificar(self, *lotes):
+        return self.client.post(self.URL, {
+            'recetas': [{'receta': receta, 'lotes': n} for receta, n in lotes]
+        }, format='json')
+
+    def test_suma_la_demanda_de_las_recetas(self):
+        response = self.planificar((self.pan.pk, 2), (self.torta.pk, 1))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'success')
+        # Pan: min(10 // 2, 3 // 1); torta: 10 // 3
+        self.assertEqual(response.data['recetas'], [
+            {'receta': self.pan.pk, 'lotes': 2, 'lotes_maximos': 3},
+            {'receta': self.torta.pk, 'lotes': 1, 'lotes_maximos': 3},
+        ])
+
+    def test_informa_los_faltantes(self):
+        # La receta repetida suma sus lotes: 3 panes y 2 tortas piden 12 de harina y 3 de azúcar
+        response = self.planificar((self.pan.pk, 1), (self.torta.pk, 2), (self.pan.pk, 2))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['status'], 'error')
+        self.assertEqual(response.data['insumos_faltantes'], [{
+            'insumo_id': self.harina.pk, 'insumo': 'Harina', 'unidad': 'kg',
+            'cantidad_necesaria': Decimal('12'), 'cantidad_disponible': Decimal('10'), 'faltante': Decimal('2')
+        }])
+        self.assertEqual(
+            [(receta['receta'], receta['lotes']) for receta in response.data['recetas']],
+            [(self.pan.pk, 3), (self.torta.pk, 2)]
+        )
+
+    def test_lotes_maximos_sin_stock(self):
+        Insumo.objects.filter(pk=self.azucar.pk).update(cantidad=Decimal('-2'))
+        sin_lineas = crear_receta(nombre='Agua')
+        response = self.planificar((self.pan.pk, 1), (sin_lineas.pk, 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['recetas'], [
+            {'receta': self.pan.pk, 'lotes': 1, 'lotes_maximos': 0},
+            {'receta': sin_lineas.pk, 'lotes': 1, 'lotes_maximos': None},
+        ])
+
+    def test_recetas_invalidas(self):
+        response = self.planificar((self.pan.pk, 1), (999, 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('999', str(response.data['recetas']))
+        for recetas in ([], [{'receta': 'pan', 'lotes': 1}], [{'receta': self.pan.pk, 'lotes': 0}]):
+            response = self.client.post(self.URL, {'recetas': recetas}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('recetas', response.data)
+
+
+class VarianzaTests(ApiTestCase):
+    def vender(self, receta, cantidad):
+        response = self.client.post('/api/ventas/', {
+            'lineas': [{'receta': receta.pk, 'cantidad': cantidad, 'precio_unitario': '5.00'}],
+            'completada': True
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_coincide_con_la_variacion_real_del_stock(self):
+        harina, azucar = crear_insumo('Harina', cantidad='100'), crear_insumo('Azúcar', cantidad='50')
+        pan = crear_receta((harina, '2'), (azucar, '1'))
+
+        self.vender(pan, 3)
+        response = self.client.post('/api/mermas/', {'insumo': f'/api/insumos/{harina.pk}/', 'cantidad': '5'})
+        self.assertEqual(response.status_code, 201, response.data)
+        response = self.client.post(f'/api/insumos/{harina.pk}/registrar_compra/', {'cantidad': '10'})
+        self.assertEqual(response.status_code, 200, response.data)
+
+        hoy = timezone.localdate().isoformat()
+        response = self.client.get(f'/api/insumos/varianza/?fecha_inicio={hoy}&fecha_fin={hoy}')
+        self.assertEqual(response.status_code, 200)
+        filas = {fila['insumo']: fila for fila in response.data['insumos']}
+
+        harina.refresh_from_db()
+        fila = filas[harina.pk]
+        self.assertEqual(fila['consumo_teorico'], Decimal('6.00'))
+        self.assertEqual(fila['merma'], Decimal('5.00'))
+        self.assertEqual(fila['salidas_esperadas'], Decimal('11.00'))
+        self.assertEqual(fila['compras'], Decimal('10.00'))
+        # Stock real: 100 - 6 vendidos - 5 de merma + 10 comprados
+        self.assertEqual(harina.cantidad, Decimal('99.00'))
+        self.assertEqual(fila['variacion_stock'], harina.cantidad - Decimal('100'))
+        self.assertEqual(fila['variacion_esperada'], fila['variacion_stock'])
+        self.assertEqual(fila['diferencia'], Decimal('0'))
+
+        azucar.refresh_from_db()
+        self.assertEqual(filas[azucar.pk]['variacion_stock'], azucar.cantidad - Decimal('50'))
+        self.assertEqual(filas[azucar.pk]['variacion_stock'], -filas[azucar.pk]['salidas_esperadas'])
+
+
+class ResumenVentaDiarioTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pan = crear_receta((crear_insumo(cantidad='1000'), '1'))
+
+    def crear_venta(self, cantidad=1, completada=False):
+        response = self.client.post('/api/ventas/', {
+            'lineas': [{'receta': self.pan.pk, 'cantidad': cantidad, 'precio_unitario': '10.00'}],
+            'completada': completada
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def resumen(self):
+        return list(ResumenVentaDiario.objects.order_by('fecha').values(
+            'fecha', 'cantidad_ventas', 'ventas_completadas', 'ventas_pendientes', 'monto_total'
+        ))
+
+    def assertIgualAReconstruido(self):
+        incremental = self.resumen()
+        ResumenVentaDiario.objects.recalcular()
+        self.assertEqual(incremental, self.resumen())
+
+    def test_sigue_a_las_ventas(self):
+        pendiente = self.crear_venta(2)
+        self.crear_venta(1, completada=True)
+        [dia] = self.resumen()
+        self.assertEqual(
+            (dia['cantidad_ventas'], dia['ventas_completadas'], dia['ventas_pendientes'], dia['monto_total']),
+            (2, 1, 1, Decimal('10.00'))
+        )
+        self.assertIgualAReconstruido()
+
+        response = self.client.put(f'/api/ventas/{pendiente}/', {'completada': True}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.resumen()[0]['monto_total'], Decimal('30.00'))
+        self.assertIgualAReconstruido()
+
+        venta = Venta.objects.get(pk=pendiente)
+        venta.total = Decimal('25.00')
+        venta.save()
+        self.assertEqual(self.resumen()[0]['monto_total'], Decimal('35.00'))
+        self.assertIgualAReconstruido()
+
+        self.assertEqual(self.client.delete(f'/api/ventas/{pendiente}/').status_code, 204)
+        self.assertIgualAReconstruido()
+        Venta.objects.all().delete()
+        self.assertEqual(self.resumen(), [])
+
+    def test_suma_diferencias_sin_releer_el_dia(self):
+        # Ventas del mismo día que confirmó otra transacción no se pierden ni se recuentan
+        self.crear_venta(1, completada=True)
+        ResumenVentaDiario.objects.update(cantidad_ventas=5, ventas_completadas=5, monto_total=Decimal('50'))
+        self.crear_venta(1, completada=True)
+        [dia] = self.resumen()
+        self.assertEqual((dia['cantidad_ventas'], dia['monto_total']), (6, Decimal('60.00')))
+
+
+class ConsumoTeoricoDiarioTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.harina, self.azucar = crear_insumo('Harina', cantidad='1000'), crear_insumo('Azúcar', cantidad='1000')
+        self.pan = crear_receta((self.harina, '2'), nombre='Pan')
+        self.queque = crear_receta((self.harina, '1'), (self.azucar, '3'), nombre='Queque')
+
+    def consumo(self):
+        return dict(ConsumoTeoricoDiario.objects.values_list('insumo_id', 'cantidad'))
+
+    def test_sigue_a_las_ventas_completadas(self):
+        venta = Venta.objects.create(total=Decimal('10'))
+        venta.lineas.create(receta=self.pan, cantidad=3, precio_unitario=Decimal('10'))
+        self.assertEqual(self.consumo(), {})
+
+        venta.completar()
+        self.assertEqual(self.consumo(), {self.harina.pk: Decimal('6.00')})
+
+        incremental = self.consumo()
+        ConsumoTeoricoDiario.objects.recalcular()
+        self.assertEqual(incremental, self.consumo())
+
+        venta.delete()
+        self.assertEqual(self.consumo(), {})
+
+    def test_las_ventas_pendientes_no_recalculan(self):
+        with CaptureQueriesContext(connection) as consultas:
+            venta = Venta.objects.create(total=Decimal('10'))
+            venta.total = Decimal('12')
+            venta.save()
+            venta.delete()
+        tablas = ' '.join(consulta['sql'] for consulta in consultas)
+        self.assertNotIn('api_consumoteoricodiario', tablas)
+        self.assertNotIn('api_recetainsumo', tablas)
+
+    def test_solo_lee_las_recetas_vendidas(self):
+        venta = Venta.objects.create(total=Decimal('10'))
+        venta.lineas.create(receta=self.pan, cantidad=1, precio_unitario=Decimal('10'))
+        with CaptureQueriesContext(connection) as consultas:
+            venta.completar()
+        lecturas = [
+            consulta['sql'] for consulta in consultas
+            if consulta['sql'].startswith('SELECT') and 'FROM "api_recetainsumo"' in consulta['sql']
+            and 'GROUP BY' not in consulta['sql']
+        ]
+        self.assertTrue(lecturas)
+        for sql in lecturas:
+            self.assertIn('"api_recetainsumo"."receta_id" IN', sql)
+
+
+class MovimientoStockTests(ApiTestCase):
+    def assertRegistroCuadra(self):
+        """La suma de los movimientos de cada insumo es su stock"""
+        movimientos = {
+            insumo_id: Decimal(total).quantize(Decimal('0.01'))
+            for insumo_id, total in MovimientoStock.objects.values_list('insumo').annotate(total=Sum('cantidad'))
+        }
+        for insumo_id, cantidad in Insumo.objects.values_list('id', 'cantidad'):
+            self.assertEqual(movimientos.get(insumo_id, Decimal('0.00')), cantidad, f'insumo {insumo_id}')
+
+    def test_todos_los_caminos_registran_movimientos(self):
+        response = self.client.post('/api/insumos/', {
+            'nombre': 'Harina', 'cantidad': '100', 'unidad': 'kg', 'precio_unitario': '2'
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        harina = Insumo.objects.get(pk=response.data['id'])
+        pan = crear_receta((harina, '2'))
+
+        self.client.post(f'/api/insumos/{harina.pk}/registrar_compra/', {'cantidad': '20'})
+        self.client.post('/api/ventas/', {
+            'lineas': [{'receta': pan.pk, 'cantidad': 4, 'precio_unitario': '1'}], 'completada': True
+        }, format='json')
+        self.client.post('/api/mermas/', {'insumo': f'/api/insumos/{harina.pk}/', 'cantidad': '3'})
+        self.client.post('/api/mermas/registrar_lote/', {
+            'mermas': [{'insumo': harina.pk, 'cantidad': '1'}, {'insumo': harina.pk, 'cantidad': '2'}]
+        }, format='json')
+        self.client.put(f'/api/insumos/{harina.pk}/', {
+            'nombre': 'Harina', 'cantidad': '90', 'unidad': 'kg', 'precio_unitario': '2'
+        })
+        self.client.post('/api/insumos/importar/', [{'id': harina.pk, 'cantidad': '95'}], format='json')
+
+        harina.refresh_from_db()
+        self.assertEqual(harina.cantidad, Decimal('95.00'))
+        self.assertEqual(
+            list(MovimientoStock.objects.filter(insumo=harina).order_by('id').values_list('tipo', 'cantidad')),
+            [('ajuste', Decimal('100.00')), ('compra', Decimal('20.00')), ('venta', Decimal('-8.00')),
+             ('merma', Decimal('-3.00')), ('merma', Decimal('-3.00')), ('ajuste', Decimal('-16.00')),
+             ('ajuste', Decimal('5.00'))]
+        )
+        self.assertRegistroCuadra()
+
+    def test_insumo_inexistente_no_cambia_ningun_stock(self):
+        harina = crear_insumo(cantidad='10')
+        with self.assertRaises(DjangoValidationError):
+            Insumo.objects.ajustar_cantidades({harina.pk: Decimal('5'), harina.pk + 100: Decimal('1')}, 'compra')
+        harina.refresh_from_db()
+        self.assertEqual(harina.cantidad, Decimal('10.00'))
+        self.assertFalse(MovimientoStock.objects.exists())
+
+    def test_los_movimientos_no_se_modifican(self):
+        harina = crear_insumo()
+        [movimiento] = MovimientoStock.objects.registrar('compra', {harina.pk: Decimal('5')})
+        movimiento.cantidad = Decimal('6')
+        with self.assertRaises(DjangoValidationError):
+            movimiento.save()
+        with self.assertRaises(DjangoValidationError):
+            movimiento.delete()
+
+    def test_stock_en_una_fecha_desde_el_ultimo_saldo(self):
+        harina = crear_insumo()
+        ahora = timezone.now()
+        MovimientoStock.objects.registrar('ajuste', {harina.pk: Decimal('100')}, fecha=ahora - timedelta(days=10))
+        MovimientoStock.objects.registrar('venta', {harina.pk: Decimal('-30')}, fecha=ahora - timedelta(days=5))
+        SaldoStock.objects.generar(ahora - timedelta(days=3))
+        MovimientoStock.objects.registrar('compra', {harina.pk: Decimal('7')}, fecha=ahora - timedelta(days=1))
+
+        self.assertEqual(MovimientoStock.objects.saldos_en(ahora - timedelta(days=7)), {harina.pk: Decimal('100.00')})
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(MovimientoStock.objects.saldos_en(ahora), {harina.pk: Decimal('77.00')})
+        # Solo los movimientos posteriores al saldo
+        self.assertTrue(any('"api_movimientostock"."fecha" >=' in consulta['sql'] for consulta in consultas))
+
+
+class VentasTestCase(ApiTestCase):
+    """Dos recetas que comparten insumos y ayudas para registrar ventas"""
+
+    def setUp(self):
+        super().setUp()
+        self.harina, self.azucar = crear_insumo('Harina', cantidad='10'), crear_insumo('Azúcar', cantidad='10')
+        self.pan = crear_receta((self.harina, '2'), nombre='Pan')
+        self.queque = crear_receta((self.harina, '1'), (self.azucar, '3'), nombre='Queque')
+
+    def crear_venta(self, *lineas, completada=False):
+        return self.client.post('/api/ventas/', {
+            'lineas': [
+                {'receta': receta.pk, 'cantidad': cantidad, 'precio_unitario': '1.00'} for receta, cantidad in lineas
+            ],
+            'completada': completada
+        }, format='json')
+
+    def stock(self):
+        return dict(Insumo.objects.values_list('nombre', 'cantidad'))
+
+
+class CompletarVentaTests(VentasTestCase):
+    def test_descuenta_los_insumos_de_todas_las_lineas(self):
+        response = self.crear_venta((self.pan, 2), (self.queque, 1), completada=True)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.stock(), {'Harina': Decimal('5.00'), 'Azúcar': Decimal('7.00')})
+
+    def test_sin_stock_suficiente_no_cambia_nada(self):
+        response = self.crear_venta((self.pan, 2), (self.queque, 4), completada=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('insumos_faltantes', response.data)
+        self.assertEqual(self.stock(), {'Harina': Decimal('10.00'), 'Azúcar': Decimal('10.00')})
+        self.assertFalse(Venta.objects.exists())
+        self.assertFalse(MovimientoStock.objects.exists())
+
+    def test_completar_dos_veces_descuenta_una_vez(self):
+        venta_id = self.crear_venta((self.pan, 1)).data['id']
+        response = self.client.put(f'/api/ventas/{venta_id}/', {'completada': True}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        # Una instancia cargada antes de completar no vuelve a descontar
+        self.assertFalse(Venta.objects.get(pk=venta_id).completar())
+        self.assertEqual(self.stock()['Harina'], Decimal('8.00'))
+
+    def test_sentencias_fijas_sin_importar_las_lineas(self):
+        def consultas_al_completar(*lineas):
+            venta = Venta.objects.create(total=Decimal('1'))
+            for receta, cantidad in lineas:
+                venta.lineas.create(receta=receta, cantidad=cantidad, precio_unitario=Decimal('1'))
+            with CaptureQueriesContext(connection) as consultas:
+                venta.completar()
+            return len(consultas)
+
+        self.assertEqual(consultas_al_completar((self.pan, 1)), consultas_al_completar((self.pan, 1), (self.queque, 1)))
+
+
+class MermaStockTests(ApiTestCase):
+    def test_descuenta_con_aritmetica_en_la_base_de_datos(self):
+        harina = crear_insumo(cantidad='10')
+        # Otro proceso cambia el stock después de que se cargó la instancia
+        Insumo.objects.filter(pk=harina.pk).update(cantidad=Decimal('50'))
+        response = self.client.post('/api/mermas/', {'insumo': f'/api/insumos/{harina.pk}/', 'cantidad': '4'})
+        self.assertEqual(response.status_code, 201, response.data)
+        harina.refresh_from_db()
+        self.assertEqual(harina.cantidad, Decimal('46.00'))
+
+    def test_lote_agrupa_los_cambios_por_insumo(self):
+        harina, azucar = crear_insumo('Harina', cantidad='10'), crear_insumo('Azúcar', cantidad='10')
+        mermas = [{'insumo': harina.pk, 'cantidad': '1'} for _ in range(50)] + [{'insumo': azucar.pk, 'cantidad': '2'}]
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.post('/api/mermas/registrar_lote/', {'mermas': mermas}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['mermas_registradas'], 51)
+        self.assertEqual(
+            dict(Insumo.objects.values_list('nombre', 'cantidad')),
+            {'Harina': Decimal('-40.00'), 'Azúcar': Decimal('8.00')}
+        )
+        # Un solo UPDATE de stock para todos los insumos del lote
+        self.assertEqual(sum(consulta['sql'].startswith('UPDATE "api_insumo"') for consulta in consultas), 1)
+
+    def test_lote_con_un_insumo_inexistente_no_registra_nada(self):
+        harina = crear_insumo(cantidad='10')
+        response = self.client.post('/api/mermas/registrar_lote/', {
+            'mermas': [{'insumo': harina.pk, 'cantidad': '1'}, {'insumo': harina.pk + 100, 'cantidad': '1'}]
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        harina.refresh_from_db()
+        self.assertEqual(harina.cantidad, Decimal('10.00'))
+        self.assertFalse(Merma.objects.exists())
+
+
+class PaginacionCursorTests(ApiTestCase):
+    def test_recorre_las_ventas_sin_repetir_ni_contar(self):
+        for total in range(25):
+            Venta.objects.create(total=Decimal(total))
+        ids, url = [], '/api/ventas/?page_size=10'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids += [venta['id'] for venta in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, list(Venta.objects.order_by('-fecha_venta', '-id').values_list('id', flat=True)))
+
+    def test_la_variante_async_usa_los_mismos_cursores(self):
+        ahora = timezone.now()
+        for dias in range(25):
+            venta = Venta.objects.create(total=Decimal(dias))
+            # Varias ventas por día: el cursor también debe desempatar por id
+            Venta.objects.filter(pk=venta.pk).update(fecha_venta=ahora - timedelta(days=dias // 3))
+        sincrona = self.client.get('/api/ventas/?page_size=10').data
+        asincrona = self.client.get('/api/async/ventas/?page_size=10').json()
+        self.assertEqual(
+            [venta['id'] for venta in asincrona['results']], [venta['id'] for venta in sincrona['results']]
+        )
+        self.assertIsNone(asincrona['previous'])
+
+        # El cursor de una variante se sigue en la otra, en ambas direcciones
+        segunda = self.client.get(sincrona['next'].replace('/api/ventas/', '/api/async/ventas/')).json()
+        self.assertEqual(
+            [venta['id'] for venta in segunda['results']],
+            [venta['id'] for venta in self.client.get(sincrona['next']).data['results']]
+        )
+        primera = self.client.get(segunda['previous'].replace('/api/async/ventas/', '/api/ventas/')).data
+        self.assertEqual(primera['results'], sincrona['results'])
+        self.assertEqual(self.client.get('/api/async/ventas/?cursor=no-es-un-cursor').status_code, 404)
+
+
+class ConsultasPorPaginaTests(ApiTestCase):
+    """Las consultas de un listado no dependen del tamaño de la página ni de las líneas de cada fila"""
+
+    def assertMismasConsultas(self, url, otra_url, preparar=None):
+        consultas = CaptureQueriesContext(connection)
+        with consultas:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        if preparar:
+            preparar()
+        with self.assertNumQueries(len(consultas)):
+            response = self.client.get(otra_url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def crear_recetas(self, cantidad, lineas):
+        for i in range(cantidad):
+            crear_receta(*[(crear_insumo(f'Insumo {i}-{j}'), '1') for j in range(lineas)], nombre=f'Receta {i}')
+
+    def test_recetas(self):
+        self.crear_recetas(2, 1)
+        # Después la página se llena con recetas de cuatro líneas
+        response = self.assertMismasConsultas(
+            '/api/recetas/', '/api/recetas/', preparar=lambda: self.crear_recetas(10, 4)
+        )
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(len(response.data['results'][-1]['insumos_detalle']), 4)
+
+    def test_lineas_de_receta(self):
+        self.crear_recetas(1, 2)
+        response = self.assertMismasConsultas(
+            '/api/recetainsumos/', '/api/recetainsumos/', preparar=lambda: self.crear_recetas(5, 3)
+        )
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_mermas(self):
+        insumos = [crear_insumo(f'Insumo {i}') for i in range(3)]
+        Merma.objects.bulk_create([
+            Merma(insumo=insumos[i % 3], cantidad=Decimal('1')) for i in range(30)
+        ])
+        response = self.assertMismasConsultas('/api/mermas/?page_size=2', '/api/mermas/?page_size=25')
+        self.assertEqual(len(response.data['results']), 25)
+
+    def test_ventas(self):
+        recetas = [crear_receta(nombre=f'Receta {i}') for i in range(3)]
+        for i in range(30):
+            venta = Venta.objects.create(total=Decimal('10'))
+            LineaVenta.objects.bulk_create([
+                LineaVenta(venta=venta, receta=receta, cantidad=1, precio_unitario=Decimal('5'))
+                for receta in recetas[:i % 3 + 1]
+            ])
+        response = self.assertMismasConsultas('/api/ventas/?page_size=2', '/api/ventas/?page_size=25')
+        self.assertEqual(len(response.data['results']), 25)
+        self.assertEqual({len(venta['lineas']) for venta in response.data['results']}, {1, 2, 3})
+
+
+class CamposDinamicosTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.harina = crear_insumo()
+        self.receta = crear_receta((self.harina, '2'), descripcion='Masa madre')
+
+    def consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [consulta['sql'] for consulta in consultas.captured_queries]
+
+    def test_fields_y_omit_recortan_la_respuesta(self):
+        response = self.client.get('/api/insumos/?fields=id,nombre')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'nombre'})
+
+        response = self.client.get('/api/recetas/?omit=insumos_detalle,descripcion')
+        receta = response.data['results'][0]
+        self.assertNotIn('insumos_detalle', receta)
+        self.assertNotIn('descripcion', receta)
+        self.assertIn('costo_total', receta)
+
+    def test_campos_desconocidos(self):
+        for url in ('/api/recetas/?fields=id,no_existe', '/api/mermas/?omit=no_existe'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('no_existe', str(response.data['fields']))
+
+    def test_recetas_sin_lineas_no_las_cargan(self):
+        _, completas = self.consultas('/api/recetas/')
+        response, consultas = self.consultas('/api/recetas/?fields=id,nombre,costo_total')
+        self.assertEqual(response.data['results'][0]['costo_total'], '4.00')
+        self.assertLess(len(consultas), len(completas))
+        self.assertFalse([sql for sql in consultas if 'api_recetainsumo' in sql])
+        # La descripción no se pide: se difiere la columna
+        lectura, = [sql for sql in consultas if sql.startswith('SELECT "api_receta"."id"')]
+        self.assertNotIn('"api_receta"."descripcion"', lectura)
+        self.assertIn('"api_receta"."costo_total"', lectura)
+
+    def test_no_difiere_las_columnas_del_cursor(self):
+        for i in range(5):
+            Venta.objects.create(total=Decimal(i))
+            Merma.objects.create(insumo=self.harina, cantidad=Decimal('1'))
+        for recurso, campo, tabla, columna in (
+            ('ventas', 'total', 'api_venta', 'fecha_venta'),
+            ('mermas', 'cantidad', 'api_merma', 'fecha_merma'),
+        ):
+            response, consultas = self.consultas(f'/api/{recurso}/?fields=id,{campo}&page_size=2')
+            self.assertEqual(set(response.data['results'][0]), {'id', campo})
+            lectura, = [sql for sql in consultas if sql.startswith(f'SELECT "{tabla}"."id"')]
+            self.assertIn(f'"{tabla}"."{columna}"', lectura)
+            # Sin la columna del orden, cada fila volvería a consultarse para armar el cursor
+            siguiente, consultas_siguiente = self.consultas(response.data['next'])
+            self.assertEqual(len(consultas_siguiente), len(consultas))
+            self.assertEqual(len(siguiente.data['results']), 2)
+
+
+class PeticionCondicionalTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.harina = crear_insumo()
+
+    def test_responde_304_sin_consultar_la_coleccion(self):
+        response = self.client.get('/api/insumos/')
+        self.assertEqual(response.status_code, 200)
+        # Solo se lee la versión de la colección
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/insumos/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_cambia_con_las_escrituras_de_la_coleccion(self):
+        etag = self.client.get('/api/insumos/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Insumo.objects.ajustar_cantidades({self.harina.pk: Decimal('1')}, MovimientoStock.Tipo.COMPRA)
+        response = self.client.get('/api/insumos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_ventas_y_mermas_no_tienen_version(self):
+        self.assertEqual(
+            set(VersionColeccion.objects.values_list('modelo', flat=True)),
+            {'api.insumo', 'api.receta', 'api.recetainsumo'}
+        )
+        receta = crear_receta((self.harina, '1'))
+        versiones = dict(VersionColeccion.objects.values_list('modelo', 'version'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/ventas/', {
+                'lineas': [{'receta': receta.pk, 'cantidad': 1, 'precio_unitario': '5'}], 'completada': False
+            }, format='json')
+        self.assertEqual(dict(VersionColeccion.objects.values_list('modelo', 'version')), versiones)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/mermas/', {
+                'insumo': f'/api/insumos/{self.harina.pk}/', 'cantidad': '1'
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(VersionColeccion.objects.exclude(modelo__in=versiones).exists())
+        # La merma cambia el stock del insumo, pero no las recetas ni sus líneas
+        nuevas = dict(VersionColeccion.objects.values_list('modelo', 'version'))
+        self.assertEqual(nuevas['api.insumo'], versiones['api.insumo'] + 1)
+        self.assertEqual(nuevas['api.receta'], versiones['api.receta'])
+        self.assertEqual(nuevas['api.recetainsumo'], versiones['api.recetainsumo'])
+
+    def test_recetas_no_dependen_del_stock(self):
+        receta = crear_receta((self.harina, '1'))
+        etag = self.client.get(f'/api/recetas/{receta.pk}/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Insumo.objects.ajustar_cantidades({self.harina.pk: Decimal('-1')}, MovimientoStock.Tipo.VENTA)
+        response = self.client.get(f'/api/recetas/{receta.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Las líneas de la receta sí muestran el nombre del insumo
+        with self.captureOnCommitCallbacks(execute=True):
+            self.harina.nombre = 'Harina integral'
+            self.harina.save()
+        response = self.client.get(f'/api/recetas/{receta.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['insumos_detalle'][0]['insumo_nombre'], 'Harina integral')
+
+    def test_get_no_escribe_versiones(self):
+        VersionColeccion.objects.all().delete()
+        etag = self.client.get('/api/recetas/')['ETag']
+        self.assertFalse(VersionColeccion.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_receta((self.harina, '1'))
+        self.assertNotEqual(self.client.get('/api/recetas/')['ETag'], etag)
+
+    def test_recalculo_diferido_incrementa_una_vez(self):
+        receta = crear_receta(*[(crear_insumo(f'Insumo {i}'), '1') for i in range(5)])
+        versiones = dict(VersionColeccion.objects.values_list('modelo', 'version'))
+        with self.captureOnCommitCallbacks(execute=True), recalculo_diferido():
+            receta.recetainsumo_set.all().delete()
+        nuevas = dict(VersionColeccion.objects.values_list('modelo', 'version'))
+        self.assertEqual(nuevas['api.recetainsumo'], versiones['api.recetainsumo'] + 1)
+
+
+class CacheAgregadosTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.harina = crear_insumo(cantidad='5', precio='2')
+
+    def test_segunda_lectura_sin_consultas(self):
+        hits = estadisticas()['hits']
+        self.assertEqual(self.client.get('/api/insumos/valor_total/').data['valor_total'], Decimal('10'))
+        self.client.get('/api/insumos/stock_bajo/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/insumos/stock_bajo/')
+        self.assertEqual([insumo['id'] for insumo in response.data], [self.harina.pk])
+        self.assertEqual(estadisticas()['hits'], hits + 1)
+
+    def test_se_invalida_al_confirmar_la_escritura(self):
+        self.client.get('/api/insumos/valor_total/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Insumo.objects.ajustar_cantidades({self.harina.pk: Decimal('5')}, MovimientoStock.Tipo.COMPRA)
+            # Antes del commit se sigue sirviendo la entrada anterior
+            self.assertEqual(self.client.get('/api/insumos/valor_total/').data['valor_total'], Decimal('10'))
+        self.assertEqual(self.client.get('/api/insumos/valor_total/').data['valor_total'], Decimal('20'))
+
+    def test_resumen_mermas_sigue_a_las_mermas(self):
+        self.assertEqual(self.client.get('/api/mermas/resumen_mermas/').data, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/mermas/', {
+                'insumo': f'/api/insumos/{self.harina.pk}/', 'cantidad': '2'
+            })
+        self.assertEqual(response.status_code, 201)
+        resumen = self.client.get('/api/mermas/resumen_mermas/').data
+        self.assertEqual([(fila['insumo__nombre'], fila['total_merma']) for fila in resumen], [('Harina', Decimal('2'))])
+
+
+class CacheTokensTests(APITestCase):
+    def setUp(self):
+        tokens.limpiar()
+        self.usuario = User.objects.create_user('prueba', password='clave')
+        self.token = Token.objects.create(user=self.usuario)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_visto_no_consulta_la_base_de_datos(self):
+        autenticacion = CachedTokenAuthentication()
+        autenticacion.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            usuario, token = autenticacion.authenticate_credentials(self.token.key)
+        self.assertEqual((usuario.pk, token.key), (self.usuario.pk, self.token.key))
+
+    def test_desaloja_la_entrada_menos_usada(self):
+        cache = _CacheTokens(max_entradas=2, ttl=60)
+        cache.guardar('a', self.usuario, 'ta')
+        cache.guardar('b', self.usuario, 'tb')
+        cache.obtener('a')
+        cache.guardar('c', self.usuario, 'tc')
+        self.assertIsNone(cache.obtener('b'))
+        self.assertIsNotNone(cache.obtener('a'))
+        self.assertIsNotNone(cache.obtener('c'))
+
+    def test_las_entradas_vencen(self):
+        cache = _CacheTokens(max_entradas=10, ttl=60)
+        with mock.patch('api.authentication.time.monotonic', return_value=1000):
+            cache.guardar('a', self.usuario, 'ta')
+        with mock.patch('api.authentication.time.monotonic', return_value=1059):
+            self.assertIsNotNone(cache.obtener('a'))
+        with mock.patch('api.authentication.time.monotonic', return_value=1061):
+            self.assertIsNone(cache.obtener('a'))
+
+    def test_eliminar_el_token_lo_invalida(self):
+        self.assertEqual(self.client.get('/api/insumos/').status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/insumos/').status_code, 401)
+
+    def test_guardar_el_usuario_lo_invalida(self):
+        self.assertEqual(self.client.get('/api/insumos/').status_code, 200)
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertEqual(self.client.get('/api/insumos/').status_code, 401)
+
+
+class EscriturasConcurrentesTests(TransactionTestCase):
+    """Escrituras simultáneas desde varios hilos, cada uno con su conexión"""
+    hilos = 16
+    por_hilo = 10
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('prueba', password='clave')
+        self.harina = crear_insumo(cantidad='1000')
+        self.receta = crear_receta((self.harina, '1'))
+
+    def _escribir(self, hilo):
+        cliente = APIClient()
+        cliente.force_authenticate(self.usuario)
+        estados = []
+        try:
+            for i in range(self.por_hilo):
+                if (hilo + i) % 2:
+                    response = cliente.post('/api/mermas/', {
+                        'insumo': f'/api/insumos/{self.harina.pk}/', 'cantidad': '1'
+                    })
+                else:
+                    response = cliente.post('/api/ventas/', {
+                        'lineas': [{'receta': self.receta.pk, 'cantidad': 1, 'precio_unitario': '5'}],
+                        'completada': True
+                    }, format='json')
+                estados.append(response.status_code)
+        finally:
+            connections.close_all()
+        return estados
+
+    def test_sin_errores_de_bloqueo_ni_escrituras_perdidas(self):
+        with ThreadPoolExecutor(self.hilos) as hilos:
+            estados = [estado for resultado in hilos.map(self._escribir, range(self.hilos)) for estado in resultado]
+        self.assertEqual(estados, [201] * self.hilos * self.por_hilo)
+
+        # Cada escritura descontó una unidad y quedó en el registro de movimientos
+        self.harina.refresh_from_db()
+        self.assertEqual(self.harina.cantidad, Decimal('1000') - len(estados))
+        self.assertEqual(
+            MovimientoStock.objects.filter(tipo__in=[MovimientoStock.Tipo.VENTA, MovimientoStock.Tipo.MERMA]).count(),
+            len(estados)
+        )
+        resumen = ResumenVentaDiario.objects.aggregate(ventas=Sum('ventas_completadas'))
+        self.assertEqual(resumen['ventas'], Venta.objects.count())
+
+
+class GenerarDatosTests(TestCase):
+    opciones = {
+        'insumos': 10, 'recetas': 5, 'insumos_por_receta': 3, 'anios': 0.05,
+        'ventas_por_dia': 6, 'mermas_por_dia': 2, 'hasta': date(2026, 3, 10), 'semilla': 7,
+    }
+
+    def _generar(self, **opciones):
+        call_command('generar_datos', **{**self.opciones, **opciones}, stdout=StringIO())
+        return {
+            'insumos': list(Insumo.objects.order_by('id').values_list('nombre', 'cantidad', 'precio_unitario')),
+            'recetas': list(Receta.objects.order_by('id').values_list('nombre', 'categoria', 'costo_total')),
+            'lineas': list(RecetaInsumo.objects.order_by('id').values_list('receta__nombre', 'insumo__nombre', 'cantidad')),
+            'ventas': list(Venta.objects.order_by('id').values_list('fecha_venta', 'total', 'completada')),
+            'mermas': list(Merma.objects.order_by('id').values_list('fecha_merma', 'insumo__nombre', 'cantidad')),
+        }
+
+    def test_misma_semilla_mismos_datos(self):
+        primera = self._generar()
+        self.assertTrue(primera['ventas'] and primera['mermas'])
+        self.assertEqual(self._generar(limpiar=True), primera)
+        self.assertNotEqual(self._generar(limpiar=True, semilla=8), primera)
+
+    def test_las_tablas_derivadas_quedan_al_dia(self):
+        self._generar()
+        ventas = Venta.objects.filter(completada=True).aggregate(total=Sum('total'))['total']
+        resumen = ResumenVentaDiario.objects.aggregate(total=Sum('monto_total'))['total']
+        self.assertEqual(Decimal(resumen).quantize(Decimal('0.01')), ventas)
+
+    def test_no_pisa_datos_existentes_sin_limpiar(self):
+        crear_insumo()
+        with self.assertRaises(CommandError):
+            self._generar()
+
+
+class BenchmarkEndpointsTests(TestCase):
+    def test_todos_los_endpoints_responden_sin_errores(self):
+        harina = crear_insumo()
+        crear_receta((harina, '1'))
+        Venta.objects.create(total=Decimal('5'))
+        Merma.objects.create(insumo=harina, cantidad=Decimal('1'))
+        with tempfile.TemporaryDirectory() as directorio:
+            salida = Path(directorio) / 'resultado.json'
+            call_command(
+                'benchmark_endpoints', peticiones=2, calentamiento=0,
+                salida=str(salida), stdout=StringIO()
+            )
+            resultado = json.loads(salida.read_text())
+        self.assertTrue(resultado['endpoints'])
+        for nombre, medicion in resultado['endpoints'].items():
+            self.assertEqual((medicion['peticiones'], medicion['errores']), (2, 0))
+
+    def test_sin_salida_guarda_en_el_directorio_de_benchmarks(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            destino = Path(directorio) / 'benchmarks'
+            with override_settings(BENCHMARK_DIRECTORIO=destino):
+                call_command(
+                    'benchmark_endpoints', peticiones=1, calentamiento=0, filtro='insumo-list', stdout=StringIO()
+                )
+            archivos = list(destino.glob('benchmark-*.json'))
+            self.assertEqual(len(archivos), 1)
+            self.assertIn('insumo-list', json.loads(archivos[0].read_text())['endpoints'])
+
+
+class ImportacionInsumosTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.harina = crear_insumo('Harina', cantidad='10', precio='2')
+        self.sal = crear_insumo('Sal', cantidad='5', precio='1')
+        self.receta = crear_receta((self.harina, '2'))
+
+    def _importar(self, filas, **datos):
+        return self.client.post('/api/insumos/importar/', {'insumos': filas, **datos}, format='json')
+
+    def test_crea_actualiza_y_propaga_precios(self):
+        response = self._importar([
+            {'id': self.harina.pk, 'precio_unitario': '3', 'cantidad': '12'},
+            {'nombre': 'Azúcar', 'cantidad': '4', 'unidad': 'kg', 'precio_unitario': '1.5'},
+            {'nombre': 'Sal', 'precio_unitario': '1'},
+        ], registrar_historial=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.data['creados'], response.data['actualizados'], response.data['sin_cambios']), (1, 1, 1)
+        )
+        self.assertEqual([fila['accion'] for fila in response.data['filas']], ['actualizado', 'creado', 'sin_cambios'])
+
+        self.harina.refresh_from_db()
+        self.assertEqual((self.harina.cantidad, self.harina.precio_unitario), (Decimal('12'), Decimal('3')))
+        self.assertTrue(Insumo.objects.filter(nombre='Azúcar', cantidad=Decimal('4')).exists())
+        # El precio nuevo llega a la receta y queda en el historial
+        self.receta.refresh_from_db()
+        self.assertEqual(self.receta.costo_total, Decimal('6.00'))
+        self.assertEqual(response.data['lineas_receta_actualizadas'], 1)
+        historial = HistorialCostoReceta.objects.get(receta=self.receta)
+        self.assertEqual((historial.costo_anterior, historial.costo_nuevo), (Decimal('4.00'), Decimal('6.00')))
+        # Los cambios de stock quedan como ajustes
+        self.assertEqual(
+            list(MovimientoStock.objects.filter(insumo=self.harina).values_list('tipo', 'cantidad')),
+            [(MovimientoStock.Tipo.AJUSTE, Decimal('2'))]
+        )
+
+    def test_una_fila_invalida_no_importa_nada(self):
+        response = self._importar([
+            {'id': self.harina.pk, 'precio_unitario': '3'},
+            {'id': 999999, 'precio_unitario': '1'},
+            {'nombre': 'Azúcar', 'precio_unitario': '1'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([fila['fila'] for fila in response.data['filas']], [2, 3])
+        self.harina.refresh_from_db()
+        self.assertEqual(self.harina.precio_unitario, Decimal('2'))
+        self.assertFalse(Insumo.objects.filter(nombre='Azúcar').exists())
+
+    def test_csv_con_celdas_vacias(self):
+        response = self.client.post(
+            '/api/insumos/importar/', 'nombre,cantidad,unidad,precio_unitario\nHarina,,,4\n', content_type='text/csv'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.harina.refresh_from_db()
+        self.assertEqual((self.harina.cantidad, self.harina.precio_unitario), (Decimal('10'), Decimal('4')))
+
+    def test_consultas_fijas_sin_importar_las_filas(self):
+        def consultas(cantidad, desde):
+            filas = [
+                {'nombre': f'Insumo {i}', 'cantidad': '1', 'unidad': 'kg', 'precio_unitario': '1'}
+                for i in range(desde, desde + cantidad)
+            ]
+            with CaptureQueriesContext(connection) as contexto:
+                self.assertEqual(self._importar(filas).status_code, 200)
+            return len(contexto)
+
+        self.assertEqual(consultas(5, 0), consultas(50, 100))
+
+
+class EditarVentaTests(VentasTestCase):
+    def editar(self, venta_id, datos):
+        return self.client.put(f'/api/ventas/{venta_id}/', datos, format='json')
+
+    def test_no_cambia_las_lineas_de_una_venta_completada(self):
+        venta_id = self.crear_venta((self.pan, 1), completada=True).data['id']
+        for datos in (
+            {'lineas': [{'receta': self.pan.pk, 'cantidad': 3, 'precio_unitario': '1.00'}]},
+            {'receta': [self.queque.pk]},
+        ):
+            response = self.editar(venta_id, datos)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stock(), {'Harina': Decimal('8.00'), 'Azúcar': Decimal('10.00')})
+        self.assertEqual(list(LineaVenta.objects.values_list('receta_id', 'cantidad')), [(self.pan.pk, 1)])
+
+    def test_acepta_las_mismas_lineas_sin_cambios(self):
+        venta = self.crear_venta((self.pan, 1), completada=True).data
+        response = self.editar(venta['id'], {
+            'lineas': [{'receta': self.pan.pk, 'cantidad': 1, 'precio_unitario': '1.00'}], 'completada': True
+        })
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.stock(), {'Harina': Decimal('8.00'), 'Azúcar': Decimal('10.00')})
+
+    def test_no_vuelve_a_pendiente(self):
+        venta_id = self.crear_venta((self.pan, 1), completada=True).data['id']
+        self.assertEqual(self.editar(venta_id, {'completada': False}).status_code, 400)
+        self.assertTrue(Venta.objects.get(pk=venta_id).completada)
+
+    def test_una_venta_pendiente_cambia_sus_lineas(self):
+        venta_id = self.crear_venta((self.pan, 1)).data['id']
+        response = self.editar(venta_id, {'receta': [self.pan.pk, self.queque.pk]})
+        self.assertEqual(response.status_code, 200, response.data)
+        # Sin total se reparte el total vigente
+        self.assertEqual(response.data['total'], '1.00')
+        self.assertEqual(
+            sorted(LineaVenta.objects.values_list('receta_id', 'precio_unitario')),
+            [(self.pan.pk, Decimal('0.50')), (self.queque.pk, Decimal('0.50'))]
+        )
+
+
+class BusquedaTests(ApiTestCase):
+    def buscar(self, coleccion, texto):
+        response = self.client.get(f'/api/{coleccion}/', {'q': texto})
+        self.assertEqual(response.status_code, 200)
+        return [fila['nombre'] for fila in response.data['results']]
+
+    def test_prefijos_sin_mayusculas_ni_acentos(self):
+        crear_insumo('Azúcar rubia')
+        crear_insumo('Harina')
+        self.assertEqual(self.buscar('insumos', 'azu'), ['Azúcar rubia'])
+        self.assertEqual(self.buscar('insumos', 'AZUCAR'), ['Azúcar rubia'])
+        self.assertEqual(self.buscar('insumos', 'rub azú'), ['Azúcar rubia'])
+        self.assertEqual(self.buscar('insumos', 'zucar'), [])
+
+    def test_todos_los_terminos_y_el_nombre_primero(self):
+        crear_receta(nombre='Brownie', descripcion='Con chocolate amargo')
+        crear_receta(nombre='Torta de chocolate')
+        crear_receta(nombre='Torta de vainilla')
+        self.assertEqual(self.buscar('recetas', 'torta choc'), ['Torta de chocolate'])
+        self.assertEqual(self.buscar('recetas', 'choc'), ['Torta de chocolate', 'Brownie'])
+
+    def test_operadores_se_buscan_como_texto(self):
+        crear_insumo('Harina')
+        self.assertEqual(self.buscar('insumos', '"har*'), ['Harina'])
+        # OR y NEAR son palabras a buscar, no operadores
+        self.assertEqual(self.buscar('insumos', 'har OR NEAR('), [])
+        # Sin palabras no se filtra
+        self.assertEqual(self.buscar('insumos', '***'), ['Harina'])
+
+    def test_el_indice_sigue_a_los_cambios(self):
+        insumo = crear_insumo('Harina')
+        insumo.nombre = 'Maicena'
+        insumo.save()
+        self.assertEqual(self.buscar('insumos', 'har'), [])
+        self.assertEqual(self.buscar('insumos', 'mai'), ['Maicena'])
+
+        receta = crear_receta(nombre='Queque')
+        receta.delete()
+        insumo.delete()
+        self.assertEqual(self.buscar('recetas', 'que'), [])
+        self.assertEqual(self.buscar('insumos', 'mai'), [])
+
+
+class MermasPorPeriodoTests(TestCase):
+    def test_coincide_con_trunc_en_los_cambios_de_hora(self):
+        harina = crear_insumo()
+        # Cada media hora alrededor de los cambios de horario de America/Santiago en 2025:
+        # el 6 de abril la medianoche se repite y el 7 de septiembre no existe
+        for cambio in (datetime(2025, 4, 6, 3), datetime(2025, 9, 7, 4)):
+            for media_hora in range(-16, 17):
+                merma = Merma.objects.create(insumo=harina, cantidad=Decimal('1'))
+                Merma.objects.filter(pk=merma.pk).update(
+                    fecha_merma=cambio.replace(tzinfo=dt_timezone.utc) + timedelta(minutes=30 * media_hora)
+                )
+
+        for granularity, trunc in (('day', TruncDay), ('week', TruncWeek), ('month', TruncMonth)):
+            esperado = {
+                timezone.localtime(fila['periodo']).date(): fila['total']
+                for fila in Merma.objects.annotate(periodo=trunc('fecha_merma')).values('periodo').annotate(
+                    total=Sum('cantidad')
+                )
+            }
+            obtenido = {
+                fila['periodo']: fila['total_merma'] for fila in Merma.objects.por_periodo(granularity)
+            }
+            self.assertEqual(obtenido, esperado, granularity)
+
+
+class ExportacionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.harina = crear_insumo()
+        self.recetas = [crear_receta((self.harina, '1'), nombre=f'Receta {i}') for i in range(2)]
+        ahora = timezone.now()
+        # 60 ventas, una por día hacia atrás: el primer bloque de líneas es más chico que el resto
+        for dias in range(60):
+            venta = Venta.objects.create(total=Decimal('10'))
+            Venta.objects.filter(pk=venta.pk).update(fecha_venta=ahora - timedelta(days=dias))
+            LineaVenta.objects.bulk_create([
+                LineaVenta(venta=venta, receta=receta, cantidad=dias % 3 + 1, precio_unitario=Decimal('5'))
+                for receta in self.recetas[:dias % 2 + 1]
+            ])
+            merma = Merma.objects.create(insumo=self.harina, cantidad=Decimal('1'))
+            Merma.objects.filter(pk=merma.pk).update(fecha_merma=ahora - timedelta(days=dias))
+
+    def lineas(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_cabecera_csv(self):
+        for recurso, cabecera in (
+            ('insumos', 'id,nombre,cantidad,unidad,precio_unitario,fecha_creacion'),
+            ('ventas', 'id,fecha_venta,total,completada,recetas,cantidades,precios'),
+            ('mermas', 'id,insumo_id,insumo_nombre,cantidad,fecha_merma'),
+        ):
+            lineas = self.lineas(f'/api/{recurso}/exportar/')
+            self.assertEqual(lineas[0], cabecera)
+
+    def test_ndjson_una_linea_por_fila(self):
+        lineas = self.lineas('/api/ventas/exportar/?formato=ndjson')
+        self.assertEqual(len(lineas), 60)
+        ventas = [json.loads(linea) for linea in lineas]
+        for venta in ventas:
+            lineas_venta = LineaVenta.objects.filter(venta_id=venta['id']).order_by('id')
+            self.assertEqual(venta['recetas'], [linea.receta_id for linea in lineas_venta])
+            self.assertEqual(venta['cantidades'], [linea.cantidad for linea in lineas_venta])
+
+    def test_la_primera_fila_sale_sola(self):
+        response = self.client.get('/api/mermas/exportar/?formato=ndjson')
+        primer_bloque = next(iter(response.streaming_content))
+        self.assertEqual(primer_bloque.count(b'\n'), 1)
+
+    def test_formato(self):
+        for formato, tipo in (('csv', 'text/csv; charset=utf-8'), ('ndjson', 'application/x-ndjson')):
+            response = self.client.get(f'/api/mermas/exportar/?formato={formato}')
+            self.assertEqual(response['Content-Type'], tipo)
+            self.assertEqual(response['Content-Disposition'], f'attachment; filename="mermas.{formato}"')
+        response = self.client.get('/api/mermas/exportar/?formato=xlsx')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('formato', response.data)
+
+    def test_periodo_igual_que_el_listado(self):
+        hoy = timezone.localdate()
+        periodo = f'fecha_inicio={hoy - timedelta(days=20)}&fecha_fin={hoy - timedelta(days=5)}'
+        for recurso, listado in (('ventas', 'ventas_por_periodo'), ('mermas', 'mermas_por_periodo')):
+            exportadas = [json.loads(linea)['id'] for linea in self.lineas(
+                f'/api/{recurso}/exportar/?formato=ndjson&{periodo}'
+            )]
+            listadas = [
+                fila['id'] for fila in self.client.get(
+                    f'/api/{recurso}/{listado}/?page_size=100&{periodo}'
+                ).data['results']
+            ]
+            self.assertTrue(listadas)
+            self.assertEqual(sorted(exportadas), sorted(listadas), recurso)
+
+
+class TareasTests(TransactionTestCase):
+    """El trabajador usa sus propias conexiones: los datos del test deben estar confirmados"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        configuracion = override_settings(TAREAS_DIRECTORIO=Path(directorio.name))
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+
+        self.usuario = User.objects.create_user('prueba', password='clave')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.harina = crear_insumo(precio='2')
+        self.receta = crear_receta((self.harina, '2'))
+
+    def encolar(self, metodo, url, datos=None):
+        response = getattr(self.client, metodo)(url, datos, format='json')
+        self.assertEqual(response.status_code, 202, getattr(response, 'data', None))
+        return response
+
+    def procesar(self):
+        with self.assertLogs('api.tareas', level='INFO'):
+            call_command('procesar_tareas', una_vez=True, hilos=1, stdout=StringIO())
+
+    def test_get_con_resultado_json(self):
+        respuesta = self.encolar('get', '/api/recetas/por_categoria/?asincrono=1&categoria=Panadería')
+        self.assertTrue(respuesta['Location'].endswith(f"/api/tareas/{respuesta.data['id']}/"))
+        self.procesar()
+
+        tarea = self.client.get(respuesta['Location']).data
+        self.assertEqual(tarea['estado'], Tarea.Estado.COMPLETADA)
+        resultado = self.client.get(f"/api/tareas/{respuesta.data['id']}/resultado/")
+        self.assertEqual(resultado.status_code, 200)
+        self.assertEqual(
+            resultado.json(), self.client.get('/api/recetas/por_categoria/?categoria=Panadería').json()
+        )
+
+    def test_post_con_el_cuerpo_original(self):
+        Insumo.objects.filter(pk=self.harina.pk).update(precio_unitario=Decimal('3'))
+        respuesta = self.encolar('post', '/api/recetas/actualizar_precios/?asincrono=1', {'registrar_historial': True})
+        self.procesar()
+
+        resultado = self.client.get(f"/api/tareas/{respuesta.data['id']}/resultado/").json()
+        self.assertEqual(resultado['lineas_actualizadas'], 1)
+        self.assertEqual(len(resultado['cambios']), 1)
+        self.receta.refresh_from_db()
+        self.assertEqual(self.receta.costo_total, Decimal('6.00'))
+
+    def test_exportacion_en_archivo(self):
+        Venta.objects.create(total=Decimal('5'))
+        respuesta = self.encolar('get', '/api/ventas/exportar/?asincrono=1&formato=csv')
+        self.procesar()
+
+        resultado = self.client.get(f"/api/tareas/{respuesta.data['id']}/resultado/")
+        self.assertEqual(resultado.status_code, 200)
+        directa = self.client.get('/api/ventas/exportar/?formato=csv')
+        self.assertEqual(b''.join(resultado.streaming_content), b''.join(directa.streaming_content))
+        self.assertEqual(resultado['Content-Disposition'], directa['Content-Disposition'])
+
+    @override_settings(TAREAS_MAX_POR_USUARIO=2)
+    def test_limite_de_tareas_activas(self):
+        for _ in range(2):
+            self.encolar('get', '/api/ventas/resumen_ventas/?asincrono=1')
+        self.assertEqual(self.client.get('/api/ventas/resumen_ventas/?asincrono=1').status_code, 429)
+        self.procesar()
+        self.encolar('get', '/api/ventas/resumen_ventas/?asincrono=1')
+
+    def test_solo_el_usuario_ve_sus_tareas(self):
+        tarea_id = self.encolar('get', '/api/ventas/resumen_ventas/?asincrono=1').data['id']
+        otro = APIClient()
+        otro.force_authenticate(User.objects.create_user('otro', password='clave'))
+        self.assertEqual(otro.get(f'/api/tareas/{tarea_id}/').status_code, 404)
+        self.assertIn(APIClient().get('/api/ventas/resumen_ventas/?asincrono=1').status_code, (401, 403))
+
+
+class BenchmarkAsgiTests(TransactionTestCase):
+    def test_compara_sin_errores(self):
+        crear_receta((crear_insumo(), '1'))
+        salida = StringIO()
+        call_command('benchmark_asgi', clientes=2, peticiones=7, hilos=2, stdout=salida)
+        filas = [linea.split() for linea in salida.getvalue().splitlines()[1:]]
+        self.assertEqual([(fila[0], fila[-1]) for fila in filas], [('WSGI', '0'), ('ASGI', '0')])
+
+
+@override_settings(INSTRUMENTACION_SQL=True)
+class InstrumentacionSQLTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        # El middleware reemplaza BaseSerializer.data al crearse
+        self.addCleanup(setattr, BaseSerializer, 'data', _data_original)
+        harina = crear_insumo()
+        for i in range(5):
+            crear_receta((harina, '1'), nombre=f'Receta {i}')
+
+    def test_encabezado_server_timing(self):
+        response = self.client.get('/api/recetas/')
+        self.assertEqual(response.status_code, 200)
+        entradas = dict(entrada.split(';', 1) for entrada in response['Server-Timing'].split(', '))
+        self.assertEqual(set(entradas), {'db', 'serializacion', 'vista', 'render', 'total'})
+        self.assertRegex(entradas['db'], r'^dur=[\d.]+;desc="\d+ consultas"$')
+        self.assertRegex(entradas['render'], r'^dur=[\d.]+$')
+
+    @override_settings(INSTRUMENTACION_CONSULTA_LENTA_MS=0)
+    def test_registra_las_consultas_lentas(self):
+        with self.assertLogs('api.instrumentacion', 'WARNING') as registros:
+            self.client.get('/api/recetas/')
+        lentas = [linea for linea in registros.output if 'Consulta lenta en GET /api/recetas/' in linea]
+        self.assertTrue(lentas)
+        self.assertIn('(RecetaViewSet.list)', lentas[0])
+
+    @override_settings(INSTRUMENTACION_DUPLICADAS_MIN=5)
+    def test_registra_las_consultas_repetidas(self):
+        # Sin el prefetch las líneas se leen receta por receta
+        with mock.patch.object(RecetaSerializer, 'prefetch_por_campo', {}), \
+                self.assertLogs('api.instrumentacion', 'WARNING') as registros:
+            self.client.get('/api/recetas/')
+        repetidas = [linea for linea in registros.output if 'Consulta repetida' in linea]
+        self.assertTrue(any(
+            'veces en GET /api/recetas/ (RecetaViewSet.list), posible N+1' in linea and 'api_recetainsumo' in linea
+            for linea in repetidas
+        ))
+
+    @override_settings(INSTRUMENTACION_SQL=False)
+    def test_desactivado(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            InstrumentacionSQLMiddleware(lambda request: None)
+        self.assertNotIn('Server-Timing', self.client.get('/api/recetas/'))
+        self.assertIs(BaseSerializer.data, _data_original)
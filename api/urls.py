@@ -1,8 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
     UserViewSet, InsumoViewSet, RecetaViewSet, VentaViewSet, MermaViewSet,
-    login_view, RecetaInsumoViewSet
+    login_view, RecetaInsumoViewSet, TareaViewSet, cache_estadisticas
 )
 
 router = DefaultRouter()
@@ -11,10 +12,25 @@ router.register(r'insumos', InsumoViewSet, basename='insumo')
 router.register(r'recetas', RecetaViewSet, basename='receta')
 router.register(r'ventas', VentaViewSet, basename='venta')
 router.register(r'mermas', MermaViewSet, basename='merma')
+router.register(r'tareas', TareaViewSet, basename='tarea')
 # TODO: Resolver el issue de RecetaInsumoViewSet para dejarlo habilitado
 router.register(r'recetainsumos', RecetaInsumoViewSet, basename='recetainsumo')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('login/', login_view, name='login'),
+    path('cache/estadisticas/', cache_estadisticas, name='cache-estadisticas'),
+    # Lecturas async para despliegues ASGI
+    path('async/insumos/', async_views.insumos_lista, name='async-insumo-list'),
+    path('async/insumos/stock_bajo/', async_views.insumos_stock_bajo, name='async-insumo-stock-bajo'),
+    path('async/insumos/valor_total/', async_views.insumos_valor_total, name='async-insumo-valor-total'),
+    path('async/insumos/<int:pk>/', async_views.insumos_detalle, name='async-insumo-detail'),
+    path('async/recetas/', async_views.recetas_lista, name='async-receta-list'),
+    path('async/recetas/<int:pk>/', async_views.recetas_detalle, name='async-receta-detail'),
+    path('async/ventas/', async_views.ventas_lista, name='async-venta-list'),
+    path('async/ventas/resumen_ventas/', async_views.ventas_resumen, name='async-venta-resumen'),
+    path('async/ventas/<int:pk>/', async_views.ventas_detalle, name='async-venta-detail'),
+    path('async/mermas/', async_views.mermas_lista, name='async-merma-list'),
+    path('async/mermas/resumen_mermas/', async_views.mermas_resumen, name='async-merma-resumen'),
+    path('async/mermas/<int:pk>/', async_views.mermas_detalle, name='async-merma-detail'),
 ] 
\ No newline at end of file
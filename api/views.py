@@ -1,17 +1,130 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.http import FileResponse
 from django.shortcuts import render
 from rest_framework import permissions, viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
-from django.db.models import Sum, F, QuerySet
+from django.db.models import (
+    Case, Count, DecimalField, F, Max, Min, QuerySet, Sum, Value, When
+)
+from django.db.models.functions import Floor, Round
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.contrib.auth import authenticate, login
 from rest_framework.authtoken.models import Token
-from .models import Insumo, Receta, Venta, Merma , RecetaInsumo
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from .models import (
+    ConsumoTeoricoDiario, Insumo, LineaVenta, MovimientoStock, Receta, Venta, Merma, RecetaInsumo, ResumenVentaDiario, Tarea, GRANULARIDADES
+)
 # importar los serializadores de la app
+from .busqueda import BusquedaViewSetMixin
+from .cache import cachear_agregado, estadisticas
+from .campos import CamposDinamicosViewSetMixin
+from .condicional import ColeccionVersionadaMixin
+from .exportacion import leer_formato, respuesta_exportacion
+from .importacion import CSVParser, formato_archivo, leer_filas
+from .pagination import MermaCursorPagination, MovimientoCursorPagination, VentaCursorPagination
 from .serializers import (
     UserSerializer, InsumoSerializer, RecetaSerializer,
-    VentaSerializer, MermaSerializer, RecetaInsumoSerializer
+    VentaSerializer, MermaSerializer, RecetaInsumoSerializer, PlanProduccionSerializer,
+    MermaLoteSerializer, ActualizarPreciosSerializer, ImportacionInsumosSerializer,
+    CompraInsumoSerializer, MovimientoStockSerializer, TareaSerializer
 )
+from .tareas import en_segundo_plano, en_tarea
+
+
+def leer_fecha(params, parametro):
+    """Lee un parámetro de fecha (YYYY-MM-DD o fecha y hora ISO) y devuelve la fecha"""
+    valor = params.get(parametro)
+    if not valor:
+        return None
+    fecha = parse_date(valor)
+    if fecha is None:
+        fecha_hora = parse_datetime(valor)
+        fecha = fecha_hora.date() if fecha_hora else None
+    if fecha is None:
+        raise ValidationError({parametro: 'Formato de fecha inválido, use YYYY-MM-DD'})
+    return fecha
+
+
+def leer_momento(params, parametro):
+    """
+    Instante de un parámetro de fecha: con hora, ese instante; solo la fecha, el
+    final de ese día (el inicio del siguiente) en la zona horaria local
+    """
+    valor = params.get(parametro)
+    if not valor:
+        return None
+    # parse_datetime también acepta una fecha sola, por eso se prueba primero parse_date
+    if parse_date(valor) is None:
+        fecha_hora = parse_datetime(valor)
+        if fecha_hora is not None:
+            return fecha_hora if timezone.is_aware(fecha_hora) else timezone.make_aware(fecha_hora)
+    fecha = leer_fecha(params, parametro)
+    return timezone.make_aware(datetime.combine(fecha + timedelta(days=1), time.min))
+
+
+def leer_granularity(params):
+    granularity = params.get('granularity')
+    if granularity is not None and granularity not in GRANULARIDADES:
+        raise ValidationError({'granularity': 'Debe ser day, week o month'})
+    return granularity
+
+
+def resumenes_ventas(params):
+    """Resúmenes diarios filtrados por fecha_inicio y fecha_fin (inclusive)"""
+    resumenes = ResumenVentaDiario.objects.all()
+    fecha_inicio = leer_fecha(params, 'fecha_inicio')
+    fecha_fin = leer_fecha(params, 'fecha_fin')
+    if fecha_inicio:
+        resumenes = resumenes.filter(fecha__gte=fecha_inicio)
+    if fecha_fin:
+        resumenes = resumenes.filter(fecha__lte=fecha_fin)
+    return resumenes
+
+
+def rango_fechas(params, campo):
+    """
+    Filtros {campo__gte, campo__lt} de un DateTimeField para fecha_inicio y fecha_fin
+    (inclusive), en la zona horaria local
+    """
+    filtros = {}
+    fecha_inicio = leer_fecha(params, 'fecha_inicio')
+    fecha_fin = leer_fecha(params, 'fecha_fin')
+    if fecha_inicio:
+        filtros[f'{campo}__gte'] = timezone.make_aware(datetime.combine(fecha_inicio, time.min))
+    if fecha_fin:
+        filtros[f'{campo}__lt'] = timezone.make_aware(datetime.combine(fecha_fin + timedelta(days=1), time.min))
+    return filtros
+
+
+def cambios_de_costo(historial):
+    """Representación de los HistorialCostoReceta generados al actualizar precios"""
+    return [
+        {
+            'receta': cambio.receta_id,
+            'costo_anterior': cambio.costo_anterior,
+            'costo_nuevo': cambio.costo_nuevo,
+            'diferencia': cambio.diferencia
+        }
+        for cambio in historial
+    ]
+
+
+def totales_ventas():
+    """Expresiones de agregado para el resumen de ventas"""
+    return {
+        'total_ventas': Coalesce(Sum('ventas_completadas'), 0),
+        'ventas_pendientes': Coalesce(Sum('ventas_pendientes'), 0),
+        'monto_total': Coalesce(Sum('monto_total'), Value(0), output_field=DecimalField())
+    }
 
 
 # UserViewSet es el controlador para el modelo de Usuario
@@ -28,13 +141,16 @@ class UserViewSet(viewsets.ModelViewSet):
 
 
 # InsumoViewSet es el controlador para el modelo de Insumo
-class InsumoViewSet(viewsets.ModelViewSet):
-    queryset = Insumo.objects.all()
+class InsumoViewSet(ColeccionVersionadaMixin, BusquedaViewSetMixin, CamposDinamicosViewSetMixin,
+                    viewsets.ModelViewSet):
+    queryset = Insumo.objects.order_by('id')
     serializer_class = InsumoSerializer
+    colecciones_versionadas = (Insumo,)
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     http_method_names = ['get', 'post', 'put', 'delete']
 
     @action(detail=False, methods=['get'])
+    @cachear_agregado(Insumo)
     def stock_bajo(self, request):
         """Retorna insumos con stock bajo (menos de 10 unidades)"""
         insumos = Insumo.objects.filter(cantidad__lt=10)
@@ -43,6 +159,7 @@ class InsumoViewSet(viewsets.ModelViewSet):
     
 
     @action(detail=False, methods=['get'])
+    @cachear_agregado(Insumo)
     def valor_total(self, request):
         """Calcula el valor total del inventario"""
         total = Insumo.objects.aggregate(
@@ -50,9 +167,180 @@ class InsumoViewSet(viewsets.ModelViewSet):
         )
         return Response(total)
 
-class RecetaViewSet(viewsets.ModelViewSet):
-    queryset = Receta.objects.all()
+    @action(detail=False, methods=['get'])
+    def varianza(self, request):
+        """
+        Compara por insumo el consumo teórico de las ventas completadas y las
+        mermas registradas con la variación real del stock según el registro de
+        movimientos, en el rango fecha_inicio–fecha_fin. Lee el consumo de la tabla
+        diaria materializada, no de las ventas.
+        """
+        fecha_inicio = leer_fecha(request.query_params, 'fecha_inicio')
+        fecha_fin = leer_fecha(request.query_params, 'fecha_fin')
+        if fecha_inicio and fecha_fin and fecha_inicio > fecha_fin:
+            raise ValidationError({'fecha_fin': 'Debe ser posterior a fecha_inicio'})
+
+        consumos = ConsumoTeoricoDiario.objects.order_by()
+        if fecha_inicio:
+            consumos = consumos.filter(fecha__gte=fecha_inicio)
+        if fecha_fin:
+            consumos = consumos.filter(fecha__lte=fecha_fin)
+        mermas = Merma.objects.order_by().filter(**rango_fechas(request.query_params, 'fecha_merma'))
+        movimientos = MovimientoStock.objects.order_by().filter(**rango_fechas(request.query_params, 'fecha'))
+
+        teorico = dict(consumos.values_list('insumo').annotate(total=Sum('cantidad')))
+        merma = dict(mermas.values_list('insumo').annotate(total=Sum('cantidad')))
+        variacion = {}
+        compras = {}
+        for insumo_id, tipo, total in movimientos.values_list('insumo', 'tipo').annotate(total=Sum('cantidad')):
+            variacion[insumo_id] = variacion.get(insumo_id, 0) + total
+            if tipo == MovimientoStock.Tipo.COMPRA:
+                compras[insumo_id] = total
+
+        # Días del período para el consumo diario; sin límites, los que tienen consumo
+        if not (fecha_inicio and fecha_fin):
+            extremos = consumos.aggregate(primero=Min('fecha'), ultimo=Max('fecha'))
+            fecha_inicio = fecha_inicio or extremos['primero']
+            fecha_fin = fecha_fin or extremos['ultimo']
+        dias = (fecha_fin - fecha_inicio).days + 1 if fecha_inicio and fecha_fin and fecha_fin >= fecha_inicio else None
+
+        centavos = Decimal('0.01')
+        resultado = []
+        for insumo in Insumo.objects.filter(
+            pk__in=teorico.keys() | merma.keys() | variacion.keys()
+        ).order_by('id').values('id', 'nombre', 'unidad', 'cantidad'):
+            consumo_teorico = Decimal(teorico.get(insumo['id'], 0)).quantize(centavos)
+            cantidad_merma = Decimal(merma.get(insumo['id'], 0)).quantize(centavos)
+            # Las ventas y las mermas descuentan stock, las compras lo suman
+            salidas = consumo_teorico + cantidad_merma
+            cantidad_compras = Decimal(compras.get(insumo['id'], 0)).quantize(centavos)
+            variacion_esperada = cantidad_compras - salidas
+            variacion_stock = Decimal(variacion.get(insumo['id'], 0)).quantize(centavos)
+            consumo_diario = (salidas / dias).quantize(centavos) if dias and salidas else None
+            resultado.append({
+                'insumo': insumo['id'],
+                'nombre': insumo['nombre'],
+                'unidad': insumo['unidad'],
+                'consumo_teorico': consumo_teorico,
+                'merma': cantidad_merma,
+                'salidas_esperadas': salidas,
+                # Merma como porcentaje del consumo teórico
+                'porcentaje_merma': (
+                    (cantidad_merma * 100 / consumo_teorico).quantize(centavos) if consumo_teorico else None
+                ),
+                'compras': cantidad_compras,
+                'variacion_esperada': variacion_esperada,
+                'variacion_stock': variacion_stock,
+                # Cambios de stock que no explican las compras, las ventas ni las mermas (ajustes)
+                'diferencia': variacion_stock - variacion_esperada,
+                'stock_actual': insumo['cantidad'],
+                'consumo_diario': consumo_diario,
+                'dias_cobertura': (insumo['cantidad'] / consumo_diario).quantize(Decimal('0.1')) if consumo_diario else None
+            })
+
+        return Response({
+            'fecha_inicio': fecha_inicio,
+            'fecha_fin': fecha_fin,
+            'dias': dias,
+            'insumos': resultado
+        })
+
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        """Exporta todos los insumos en CSV o NDJSON"""
+        formato = leer_formato(request)
+        campos = ['id', 'nombre', 'cantidad', 'unidad', 'precio_unitario', 'fecha_creacion']
+        filas = Insumo.objects.order_by('id').values(*campos).iterator(chunk_size=2000)
+        return respuesta_exportacion(filas, campos, formato, 'insumos')
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, CSVParser, MultiPartParser, FormParser])
+    def importar(self, request):
+        """
+        Importa una lista de precios de proveedor (CSV o JSON) creando o actualizando
+        insumos por id o nombre. Si alguna fila es inválida no se aplica ninguna.
+        """
+        registrar_historial = False
+        if isinstance(request.data, str):
+            filas = leer_filas(request.data, 'csv')
+        elif isinstance(request.data, list):
+            filas = request.data
+        elif 'archivo' in request.FILES:
+            archivo = request.FILES['archivo']
+            filas = leer_filas(archivo.read(), formato_archivo(archivo.name, request.data.get('formato')))
+            registrar_historial = request.data.get('registrar_historial', False)
+        else:
+            filas = request.data.get('insumos')
+            registrar_historial = request.data.get('registrar_historial', False)
+
+        serializer = ImportacionInsumosSerializer(data={
+            'insumos': filas,
+            'registrar_historial': registrar_historial
+        })
+        if not serializer.is_valid():
+            return Response(serializer.errores_por_fila, status=status.HTTP_400_BAD_REQUEST)
+        reporte = serializer.save()
+        reporte['cambios'] = cambios_de_costo(reporte.pop('historial'))
+        return Response(reporte)
+
+    @action(detail=True, methods=['post'])
+    def registrar_compra(self, request, pk=None):
+        """Suma al stock la cantidad comprada y la registra como movimiento de compra"""
+        insumo = self.get_object()
+        serializer = CompraInsumoSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            Insumo.objects.ajustar_cantidades(
+                {insumo.pk: serializer.validated_data['cantidad']}, MovimientoStock.Tipo.COMPRA
+            )
+        except DjangoValidationError as e:
+            raise ValidationError(e.message_dict)
+        insumo.refresh_from_db()
+        return Response(self.get_serializer(insumo).data)
+
+    @action(detail=True, methods=['get'])
+    def movimientos(self, request, pk=None):
+        """Movimientos de stock del insumo, del más reciente al más antiguo"""
+        insumo = self.get_object()
+        movimientos = MovimientoStock.objects.filter(
+            insumo=insumo, **rango_fechas(request.query_params, 'fecha')
+        )
+        paginador = MovimientoCursorPagination()
+        page = paginador.paginate_queryset(movimientos, request, view=self)
+        return paginador.get_paginated_response(MovimientoStockSerializer(page, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def stock_historico(self, request):
+        """
+        Stock de cada insumo al final del día fecha (o en el instante indicado si
+        fecha incluye la hora), a partir del último saldo guardado y los movimientos
+        posteriores. Acepta insumo para consultar uno solo.
+        """
+        momento = leer_momento(request.query_params, 'fecha')
+        if momento is None:
+            raise ValidationError({'fecha': 'Este parámetro es requerido'})
+        insumos = Insumo.objects.order_by('id')
+        insumo_id = request.query_params.get('insumo')
+        if insumo_id:
+            if not insumo_id.isdigit():
+                raise ValidationError({'insumo': 'Debe ser un id de insumo'})
+            insumos = insumos.filter(pk=insumo_id)
+
+        saldos = MovimientoStock.objects.saldos_en(momento, insumos=[int(insumo_id)] if insumo_id else None)
+        return Response({
+            'momento': momento,
+            'insumos': [
+                {**insumo, 'cantidad': saldos.get(insumo['id'], Decimal('0'))}
+                for insumo in insumos.values('id', 'nombre', 'unidad')
+            ]
+        })
+
+class RecetaViewSet(ColeccionVersionadaMixin, BusquedaViewSetMixin, CamposDinamicosViewSetMixin,
+                    viewsets.ModelViewSet):
+    # Las líneas de cada receta se cargan según los campos pedidos (RecetaSerializer.prefetch_por_campo)
+    queryset = Receta.objects.order_by('id')
     serializer_class = RecetaSerializer
+    # Las líneas muestran nombre y unidad del insumo, no su stock
+    colecciones_versionadas = (Receta, RecetaInsumo)
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     http_method_names = ['get', 'post', 'put', 'delete']
 
@@ -72,13 +360,13 @@ class RecetaViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
+    @en_segundo_plano
     def por_categoria(self, request):
         """Agrupa recetas por categoría"""
         categoria = request.query_params.get('categoria', None)
+        recetas = self.get_queryset()
         if categoria:
-            recetas = Receta.objects.filter(categoria=categoria)
-        else:
-            recetas = Receta.objects.all()
+            recetas = recetas.filter(categoria=categoria)
         serializer = self.get_serializer(recetas, many=True)
         return Response(serializer.data)
 
@@ -108,78 +396,333 @@ class RecetaViewSet(viewsets.ModelViewSet):
             'message': 'Hay suficientes insumos para preparar la receta'
         })
 
-class VentaViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    @en_segundo_plano
+    def actualizar_precios(self, request):
+        """Actualiza los precios de las líneas de receta con el precio actual de sus insumos"""
+        serializer = ActualizarPreciosSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        lineas = RecetaInsumo.objects.all()
+        if 'insumos' in serializer.validated_data:
+            lineas = lineas.filter(insumo_id__in=serializer.validated_data['insumos'])
+        actualizadas, historial = lineas.actualizar_precios(
+            registrar_historial=serializer.validated_data['registrar_historial']
+        )
+
+        return Response({
+            'lineas_actualizadas': actualizadas,
+            'cambios': cambios_de_costo(historial)
+        })
+
+    @action(detail=False, methods=['post'])
+    def planificar_produccion(self, request):
+        """Verifica si hay insumos suficientes para producir varias recetas a la vez"""
+        serializer = PlanProduccionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lotes = serializer.validated_data['recetas']
+
+        lineas = RecetaInsumo.objects.filter(receta_id__in=lotes)
+        decimal = DecimalField(max_digits=20, decimal_places=2)
+
+        # Demanda total por insumo en una sola consulta agrupada
+        demanda = lineas.values(
+            'insumo_id', 'insumo__nombre', 'insumo__unidad', 'insumo__cantidad'
+        ).annotate(
+            cantidad_necesaria=Sum(
+                F('cantidad') * Case(
+                    *[When(receta_id=receta_id, then=Value(n)) for receta_id, n in lotes.items()],
+                    output_field=decimal
+                ),
+                output_field=decimal
+            )
+        ).order_by('insumo__nombre')
+
+        insumos_faltantes = [
+            {
+                'insumo_id': fila['insumo_id'],
+                'insumo': fila['insumo__nombre'],
+                'unidad': fila['insumo__unidad'],
+                'cantidad_necesaria': fila['cantidad_necesaria'],
+                'cantidad_disponible': fila['insumo__cantidad'],
+                'faltante': fila['cantidad_necesaria'] - fila['insumo__cantidad']
+            }
+            for fila in demanda
+            if fila['cantidad_necesaria'] > fila['insumo__cantidad']
+        ]
+
+        # Máximo de lotes que se pueden preparar de cada receta con el stock actual
+        maximos = dict(
+            lineas.filter(cantidad__gt=0).values('receta_id').annotate(
+                lotes_maximos=Min(Floor(F('insumo__cantidad') / F('cantidad')))
+            ).values_list('receta_id', 'lotes_maximos')
+        )
+        recetas = [
+            {
+                'receta': receta_id,
+                'lotes': n,
+                # Con stock negativo el cociente también lo es: no se puede preparar ningún lote
+                'lotes_maximos': max(int(maximos[receta_id]), 0) if receta_id in maximos else None
+            }
+            for receta_id, n in lotes.items()
+        ]
+
+        if insumos_faltantes:
+            return Response({
+                'status': 'error',
+                'message': 'Faltan insumos',
+                'insumos_faltantes': insumos_faltantes,
+                'recetas': recetas
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'status': 'success',
+            'message': 'Hay suficientes insumos para la producción planificada',
+            'recetas': recetas
+        })
+
+class VentaViewSet(CamposDinamicosViewSetMixin, viewsets.ModelViewSet):
     queryset = Venta.objects.all()
     serializer_class = VentaSerializer
+    pagination_class = VentaCursorPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     http_method_names = ['get', 'post', 'put', 'delete']
 
-    @action(detail=False, methods=['get'])
-    def ventas_por_periodo(self, request):
-        """Obtiene ventas por período"""
-        fecha_inicio = request.query_params.get('fecha_inicio', None)
-        fecha_fin = request.query_params.get('fecha_fin', None)
+    def filtrar_por_periodo(self, ventas):
+        fecha_inicio = self.request.query_params.get('fecha_inicio', None)
+        fecha_fin = self.request.query_params.get('fecha_fin', None)
         
-        ventas = self.queryset
         if fecha_inicio and fecha_fin:
             ventas = ventas.filter(fecha_venta__range=[fecha_inicio, fecha_fin])
-        
-        serializer = self.get_serializer(ventas, many=True)
-        return Response(serializer.data)
+        return ventas
 
     @action(detail=False, methods=['get'])
+    def ventas_por_periodo(self, request):
+        """Obtiene ventas por período"""
+        # Con granularity se responde agrupado desde el resumen diario
+        granularity = leer_granularity(request.query_params)
+        if granularity:
+            return Response(resumenes_ventas(request.query_params).por_periodo(granularity))
+
+        ventas = self.filtrar_por_periodo(self.get_queryset())
+        page = self.paginate_queryset(ventas)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    @en_segundo_plano
     def resumen_ventas(self, request):
-        """Obtiene un resumen de ventas"""
-        total_ventas = self.queryset.filter(completada=True).count()
-        ventas_pendientes = self.queryset.filter(completada=False).count()
-        monto_total = self.queryset.filter(completada=True).aggregate(
-            total=Sum('total')
-        )['total'] or 0
+        """Obtiene un resumen de ventas a partir del resumen diario"""
+        granularity = leer_granularity(request.query_params)
+        resumenes = resumenes_ventas(request.query_params)
+        resumen = resumenes.aggregate(**totales_ventas())
 
-        return Response({
-            'total_ventas': total_ventas,
-            'ventas_pendientes': ventas_pendientes,
-            'monto_total': monto_total
-        })
+        if granularity:
+            resumen['periodos'] = resumenes.por_periodo(granularity)
+
+        return Response(resumen)
+
+    @action(detail=False, methods=['get'])
+    @en_segundo_plano
+    def ventas_por_receta(self, request):
+        """
+        Unidades vendidas e ingresos por receta de las ventas completadas, en una sola
+        consulta agrupada sobre las líneas de venta. Acepta fecha_inicio, fecha_fin,
+        orden (unidades o ingresos) y limite.
+        """
+        orden = request.query_params.get('orden', 'unidades')
+        if orden not in ('unidades', 'ingresos'):
+            raise ValidationError({'orden': 'Debe ser unidades o ingresos'})
+        try:
+            limite = int(request.query_params.get('limite', 10))
+        except ValueError:
+            raise ValidationError({'limite': 'Debe ser un número entero'})
+        if limite < 1:
+            raise ValidationError({'limite': 'Debe ser mayor que cero'})
+
+        filas = LineaVenta.objects.filter(
+            venta__completada=True, **rango_fechas(request.query_params, 'venta__fecha_venta')
+        ).values('receta', receta_nombre=F('receta__nombre')).annotate(
+            unidades=Sum('cantidad'),
+            # En SQLite el producto de decimales se calcula en coma flotante
+            ingresos=Round(
+                Sum(F('cantidad') * F('precio_unitario')), 2,
+                output_field=DecimalField(max_digits=14, decimal_places=2)
+            ),
+            ventas=Count('venta')
+        ).order_by(f'-{orden}', 'receta')[:limite]
+        return Response(list(filas))
+
+    @action(detail=False, methods=['get'])
+    @en_segundo_plano
+    def exportar(self, request):
+        """Exporta las ventas del período en CSV o NDJSON"""
+        formato = leer_formato(request)
+        ventas = self.filtrar_por_periodo(Venta.objects.all())
+        filas = self._filas_con_lineas(
+            ventas.values('id', 'fecha_venta', 'total', 'completada').iterator(chunk_size=2000)
+        )
+        campos = ['id', 'fecha_venta', 'total', 'completada', 'recetas', 'cantidades', 'precios']
+        # El conteo solo vale la pena para informar el progreso de una tarea
+        total = ventas.count() if en_tarea() else None
+        return respuesta_exportacion(filas, campos, formato, 'ventas', total)
 
-class MermaViewSet(viewsets.ModelViewSet):
+    def _filas_con_lineas(self, filas, tamano=2000, primer_tamano=50):
+        """
+        Agrega a cada venta las listas paralelas de recetas, cantidades y precios
+        unitarios de sus líneas, una consulta por bloque. El primer bloque es más
+        chico para que la exportación empiece a enviarse de inmediato.
+        """
+        filas = iter(filas)
+        siguiente = primer_tamano
+        while bloque := list(islice(filas, siguiente)):
+            siguiente = tamano
+            lineas = {}
+            for venta_id, receta_id, cantidad, precio in LineaVenta.objects.filter(
+                venta_id__in=[fila['id'] for fila in bloque]
+            ).order_by('venta_id', 'id').values_list('venta_id', 'receta_id', 'cantidad', 'precio_unitario'):
+                lineas.setdefault(venta_id, []).append((receta_id, cantidad, precio))
+            for fila in bloque:
+                lineas_venta = lineas.get(fila['id'], [])
+                fila['recetas'] = [receta_id for receta_id, _, _ in lineas_venta]
+                fila['cantidades'] = [cantidad for _, cantidad, _ in lineas_venta]
+                fila['precios'] = [precio for _, _, precio in lineas_venta]
+                yield fila
+
+class MermaViewSet(CamposDinamicosViewSetMixin, viewsets.ModelViewSet):
     queryset = Merma.objects.all()
     serializer_class = MermaSerializer
+    pagination_class = MermaCursorPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     http_method_names = ['get', 'post', 'put', 'delete']
 
-    @action(detail=False, methods=['get'])
-    def mermas_por_periodo(self, request):
-        """Obtiene mermas por período"""
-        fecha_inicio = request.query_params.get('fecha_inicio', None)
-        fecha_fin = request.query_params.get('fecha_fin', None)
+    def filtrar_por_periodo(self, mermas):
+        fecha_inicio = self.request.query_params.get('fecha_inicio', None)
+        fecha_fin = self.request.query_params.get('fecha_fin', None)
         
-        mermas = self.queryset
         if fecha_inicio and fecha_fin:
             mermas = mermas.filter(fecha_merma__range=[fecha_inicio, fecha_fin])
-        
-        serializer = self.get_serializer(mermas, many=True)
-        return Response(serializer.data)
+        return mermas
+
+    @action(detail=False, methods=['get'])
+    def mermas_por_periodo(self, request):
+        """Obtiene mermas por período"""
+        mermas = self.filtrar_por_periodo(self.get_queryset())
+        page = self.paginate_queryset(mermas)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post'])
+    def registrar_lote(self, request):
+        """Registra muchas mermas en una sola transacción"""
+        serializer = MermaLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        mermas = serializer.save()
+
+        return Response({
+            'mermas_registradas': len(mermas),
+            'ids': [merma.id for merma in mermas]
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    @en_segundo_plano
+    def exportar(self, request):
+        """Exporta las mermas del período en CSV o NDJSON"""
+        formato = leer_formato(request)
+        mermas = self.filtrar_por_periodo(Merma.objects.order_by('-fecha_merma', '-id'))
+        filas = mermas.values(
+            'id', 'insumo_id', 'cantidad', 'fecha_merma', insumo_nombre=F('insumo__nombre')
+        ).iterator(chunk_size=2000)
+        campos = ['id', 'insumo_id', 'insumo_nombre', 'cantidad', 'fecha_merma']
+        total = mermas.count() if en_tarea() else None
+        return respuesta_exportacion(filas, campos, formato, 'mermas', total)
 
     @action(detail=False, methods=['get'])
+    @en_segundo_plano
+    def por_insumo(self, request):
+        """
+        Mermas agrupadas por insumo y por día, semana o mes (granularity, por defecto
+        month) en el rango fecha_inicio–fecha_fin, con su costo; insumo filtra uno solo
+        """
+        granularity = leer_granularity(request.query_params) or 'month'
+        mermas = Merma.objects.all()
+        insumo_id = request.query_params.get('insumo')
+        if insumo_id:
+            if not insumo_id.isdigit():
+                raise ValidationError({'insumo': 'Debe ser un id de insumo'})
+            mermas = mermas.filter(insumo_id=insumo_id)
+        try:
+            filas = mermas.por_periodo(
+                granularity,
+                leer_fecha(request.query_params, 'fecha_inicio'),
+                leer_fecha(request.query_params, 'fecha_fin')
+            )
+        except DjangoValidationError as e:
+            raise ValidationError(e.message_dict)
+        return Response(list(filas))
+
+    @action(detail=False, methods=['get'])
+    @en_segundo_plano
+    @cachear_agregado(Merma, Insumo)
     def resumen_mermas(self, request):
         """Obtiene un resumen de mermas por insumo"""
         resumen = self.queryset.values('insumo__nombre').annotate(
             total_merma=Sum('cantidad')
         ).order_by('-total_merma')
         
-        return Response(resumen)
+        return Response(list(resumen))
+
+class TareaViewSet(viewsets.ModelViewSet):
+    """
+    Tareas en segundo plano del usuario (las de todos para el staff). Se crean con
+    ?asincrono=1 en las acciones que lo admiten, no desde aquí.
+    """
+    serializer_class = TareaSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['get', 'delete']
+
+    def get_queryset(self):
+        tareas = Tarea.objects.order_by('-id')
+        if not self.request.user.is_staff:
+            tareas = tareas.filter(usuario=self.request.user)
+        return tareas
+
+    @action(detail=True, methods=['get'])
+    def resultado(self, request, pk=None):
+        """Respuesta de la acción ejecutada, tal como la habría devuelto sin ?asincrono"""
+        tarea = self.get_object()
+        if tarea.terminada is None:
+            return Response({
+                'error': 'La tarea aún no termina',
+                'estado': tarea.estado
+            }, status=status.HTTP_409_CONFLICT)
+        if tarea.archivo:
+            response = FileResponse(open(tarea.ruta_archivo, 'rb'), content_type=tarea.tipo_contenido)
+            response['Content-Disposition'] = tarea.disposicion
+            return response
+        return Response(tarea.resultado, status=tarea.codigo or status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def destroy(self, request, *args, **kwargs):
+        tarea = self.get_object()
+        if tarea.estado == Tarea.Estado.EN_CURSO:
+            return Response({
+                'error': 'No se puede eliminar una tarea en curso'
+            }, status=status.HTTP_409_CONFLICT)
+        tarea.eliminar_archivo()
+        tarea.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 # TODO: Analizar si se necesita un endpoint específico para RecetaInsumo
 
-class RecetaInsumoViewSet(viewsets.ModelViewSet):
-    queryset = RecetaInsumo.objects.all()
+class RecetaInsumoViewSet(ColeccionVersionadaMixin, viewsets.ModelViewSet):
+    queryset = RecetaInsumo.objects.select_related('receta', 'insumo').order_by('id')
     serializer_class = RecetaInsumoSerializer
+    colecciones_versionadas = (RecetaInsumo,)
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     http_method_names = ['get', 'post', 'put', 'delete']
 
     def get_queryset(self) -> QuerySet:
-        queryset = RecetaInsumo.objects.all()
+        queryset = super().get_queryset()
         receta_id = self.request.GET.get('receta', None)
         if receta_id:
             queryset = queryset.filter(receta_id=receta_id)
@@ -215,4 +758,12 @@ def login_view(request):
     else:
         return Response({
             'error': 'Credenciales inválidas'
-        }, status=status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        }, status=status.HTTP_401_UNAUTHORIZED)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def cache_estadisticas(request):
+    """
+    Vista que devuelve los aciertos y fallos de la cache de agregados de este proceso
+    """
+    return Response(estadisticas())
@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero, para que sus tiempos incluyan al resto de los middlewares
+    'api.instrumentacion.InstrumentacionSQLMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware
@@ -75,10 +81,11 @@ SESSION_COOKIE_SAMESITE = 'Lax'
 SESSION_COOKIE_HTTPONLY = True
 
 REST_FRAMEWORK = {
+    # El token va primero para que las peticiones con token no consulten la sesión
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -87,6 +94,12 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
 }
 
+# Cache en memoria de tokens de autenticación (ver api/authentication.py).
+# Cada proceso tiene su propia cache: un token eliminado o un usuario desactivado
+# desde otro proceso deja de ser válido aquí como máximo tras TOKEN_CACHE_TTL segundos.
+TOKEN_CACHE_TTL = 300
+TOKEN_CACHE_MAX_ENTRADAS = 10000
+
 ROOT_URLCONF = 'muma.urls'
 
 TEMPLATES = [
@@ -110,11 +123,133 @@ WSGI_APPLICATION = 'muma.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# El perfil se elige con DB_ENGINE=sqlite (por defecto) o DB_ENGINE=postgresql.
+# Las conexiones persistentes duran DB_CONN_MAX_AGE segundos y se verifican antes
+# de reutilizarse (CONN_HEALTH_CHECKS).
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'mumo'),
+            'USER': os.environ.get('DB_USER', 'mumo'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+    # Con DB_POOL=1 se usa el pool de conexiones de psycopg 3 (requiere psycopg[pool]);
+    # el pool reemplaza a las conexiones persistentes.
+    if os.environ.get('DB_POOL') == '1':
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX', 10)),
+        }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Segundos que se espera a que se libere el bloqueo de escritura
+                'timeout': int(os.environ.get('DB_BUSY_TIMEOUT', 20)),
+                # Las transacciones toman el bloqueo de escritura al empezar y no al
+                # primer UPDATE, así dos escrituras concurrentes no se bloquean entre sí
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f"PRAGMA mmap_size={int(os.environ.get('DB_MMAP_SIZE', 134217728))};"
+                    f"PRAGMA cache_size={int(os.environ.get('DB_CACHE_SIZE', -20000))};"
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+            # Los tests de concurrencia necesitan un archivo: la base en memoria
+            # compartida no usa WAL ni respeta el timeout de bloqueo. Va en el
+            # directorio temporal para no dejar el archivo ni sus -wal/-shm en el repo
+            'TEST': {
+                'NAME': os.environ.get('DB_TEST_NAME', Path(tempfile.gettempdir()) / 'muma_test_db.sqlite3'),
+            },
+        }
     }
+else:
+    raise ImproperlyConfigured(f'DB_ENGINE no soportado: {DB_ENGINE}')
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# 'agregados' guarda las respuestas de los endpoints de agregados (ver api/cache.py).
+# LocMemCache es un LRU en memoria por proceso; con varios procesos conviene usar
+# un backend compartido (Redis, Memcached) para que las invalidaciones lleguen a todos.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'agregados': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'agregados',
+        'TIMEOUT': 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+
+# Instrumentación SQL por petición (ver api/instrumentacion.py). Desactivada no
+# tiene costo: el middleware se quita de la cadena al arrancar.
+
+INSTRUMENTACION_SQL = os.environ.get('INSTRUMENTACION_SQL') == '1'
+INSTRUMENTACION_PETICION_LENTA_MS = int(os.environ.get('INSTRUMENTACION_PETICION_LENTA_MS', 500))
+INSTRUMENTACION_CONSULTA_LENTA_MS = int(os.environ.get('INSTRUMENTACION_CONSULTA_LENTA_MS', 100))
+# Repeticiones de una misma consulta en una petición a partir de las cuales se avisa de un N+1
+INSTRUMENTACION_DUPLICADAS_MIN = int(os.environ.get('INSTRUMENTACION_DUPLICADAS_MIN', 5))
+
+# Resultados JSON de benchmark_endpoints cuando no se indica --salida
+BENCHMARK_DIRECTORIO = Path(os.environ.get('BENCHMARK_DIRECTORIO', BASE_DIR / 'benchmarks'))
+
+# Tareas en segundo plano (ver api/tareas.py). Las ejecuta el comando procesar_tareas
+# con TAREAS_CONCURRENCIA hilos; los archivos generados (exportaciones) se guardan en
+# TAREAS_DIRECTORIO y se eliminan con la tarea pasadas TAREAS_RETENCION_HORAS.
+
+TAREAS_DIRECTORIO = Path(os.environ.get('TAREAS_DIRECTORIO', BASE_DIR / 'tareas'))
+TAREAS_CONCURRENCIA = int(os.environ.get('TAREAS_CONCURRENCIA', 2))
+# Tareas pendientes o en curso que puede tener cada usuario a la vez
+TAREAS_MAX_POR_USUARIO = int(os.environ.get('TAREAS_MAX_POR_USUARIO', 5))
+TAREAS_RETENCION_HORAS = int(os.environ.get('TAREAS_RETENCION_HORAS', 24))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.instrumentacion': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'api.tareas': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
 }
 
 